@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from plots import seq_length_distribution
+
+
+def make_fasta(path, n_seqs, seed=42):
+    """Write `n_seqs` contigs with log-normally distributed lengths (median ~500 bp), 60 bases per line."""
+    rng = np.random.default_rng(seed)
+    line = 'ACGT' * 15 + '\n'
+    with open(path, 'w') as ouf:
+        for i, length in enumerate(rng.lognormal(np.log(500), 1.0, n_seqs).astype(int) + 1):
+            ouf.write(f'>contig{i}\n{line * (length // 60)}{line[:length % 60]}\n')
+
+
+def seq_length_distribution_list(path):
+    """The pre-streaming version: every record parsed by Biopython and every length kept in a list. For comparison."""
+    from Bio import SeqIO
+    sizes = [len(rec) for rec in SeqIO.parse(path, 'fasta')]
+    fig = plt.figure()
+    plt.hist(sizes, edgecolor='black')
+    plt.title("%i sequences\nLengths %i to %i" % (len(sizes), min(sizes), max(sizes)))
+    plt.savefig(path + '.png')
+    plt.close(fig)
+
+
+def bench_length_distribution(path):
+    """Seconds and peak traced allocations of plotting the length distribution with a list and with streaming."""
+    results = {}
+    for name, func in [('list', seq_length_distribution_list), ('streaming', seq_length_distribution)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (elapsed, peak)
+    return results
+
+
+def import_time(statement):
+    """Microseconds spent on the imports of `statement` in a fresh interpreter, from python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    total = 0
+    started = False  # interpreter startup imports end with the top-level 'site'
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.split('|')[2].startswith('  '):  # not a top-level import
+            continue
+        if started:
+            total += int(line.split('|')[1])
+        started = started or line.split('|')[2].strip() == 'site'
+    return total
+
+
+def bench_import():
+    """Import times of plots and of the libraries the eager version of it imported on load."""
+    return {'plots': import_time('import plots'),
+            'matplotlib.pyplot, seaborn, Bio.SeqIO': import_time('import matplotlib.pyplot, seaborn, Bio.SeqIO')}
+
+
+if __name__ == '__main__':
+    n_seqs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta_path = os.path.join(tmp, 'contigs.fasta')
+        make_fasta(fasta_path, n_seqs)
+        results = bench_length_distribution(fasta_path)
+    print(f'seq_length_distribution, {n_seqs} contigs (tracemalloc slows both down):')
+    for name, (elapsed, peak) in results.items():
+        print(f'{name + ":":<11} {elapsed:8.2f} s, peak {peak / 2 ** 20:8.1f} MiB allocated')
+    print('import time (python -X importtime):')
+    for statement, microseconds in bench_import().items():
+        print(f'{statement:<40} {microseconds / 1000:8.1f} ms')
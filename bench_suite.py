@@ -0,0 +1,339 @@
+"""Benchmark suite of the repository on seeded synthetic data (see synthetic.py). Results are saved as JSON, and
+compared with a baseline run: a benchmark whose throughput drops by more than the threshold is flagged as a
+regression, and the exit status is 1.
+
+Usage: python bench_suite.py [--scale <float>] [--repeat <int>] [--only <name>[,<name>...]] [--output <results.json>]
+                             [--baseline <results.json>] [--threshold <float>] [--list]
+
+    --scale <float>     Multiply the data sizes by this factor (1.0 by default; 0.1 for a quick run).
+    --repeat <int>      Runs per benchmark; the fastest counts (3 by default).
+    --only <names>      Run only these comma-separated benchmarks.
+    --output <path>     Write the results to this JSON file.
+    --baseline <path>   Compare the results with the JSON file of an earlier run.
+    --threshold <float> Relative throughput drop flagged as a regression (0.1 by default, i.e. 10% slower).
+    --list              List the benchmarks and exit.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[1:1] = [os.path.join(ROOT, 'fastq-filtrator'), os.path.join(ROOT, 'nucleic_acids')]
+
+from synthetic import synthetic_seqs, write_fasta, write_fastq  # noqa: E402
+
+SEED = 42
+THRESHOLD = 0.1
+REPEAT = 3
+
+Case = namedtuple('Case', ['run', 'items', 'unit', 'reset'], defaults=[None])
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """Register a benchmark: a function of (temporary directory, scale) that prepares the data and returns a Case."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def scaled(n, scale):
+    return max(1, int(n * scale))
+
+
+def filter_args(tmp, fastq_path, **options):
+    parsed_args = {
+        '--min_length': 100,
+        '--keep_filtered': True,
+        '--gc_bounds': [40.0, 60.0],
+        '--output_base_name': os.path.join(tmp, 'bench'),
+        '--threads': 1,
+        '--compress': None,
+        '--failed_output': None,
+        '--min_mean_quality': 0.0,
+        '--min_base_quality': 0,
+        '--trim_quality': [],
+        '--phred64': False,
+        'fastq_path': fastq_path
+    }
+    parsed_args.update(options)
+    return parsed_args
+
+
+def write_to_file_case(tmp, scale, **options):
+    from filter_fastq2 import write_to_file
+    n_reads = scaled(200000, scale)
+    fastq_path = os.path.join(tmp, 'reads.fastq')
+    write_fastq(fastq_path, n_reads, length=150, length_sd=15, gc=50, gc_sd=8, seed=SEED)
+    parsed_args = filter_args(tmp, fastq_path, **options)
+
+    def reset():
+        for suffix in ['passed', 'failed']:
+            path = f'{parsed_args["--output_base_name"]}__{suffix}.fastq'
+            if os.path.exists(path):
+                os.remove(path)
+    return Case(lambda: write_to_file(parsed_args), n_reads, 'reads', reset)
+
+
+@benchmark
+def write_to_file_length_gc(tmp, scale):
+    """filter_fastq2.write_to_file with length and GC filters, failed reads kept."""
+    return write_to_file_case(tmp, scale)
+
+
+@benchmark
+def write_to_file_quality(tmp, scale):
+    """filter_fastq2.write_to_file with length, GC and mean quality filters and quality trimming."""
+    return write_to_file_case(tmp, scale, **{'--min_mean_quality': 25.0, '--trim_quality': [20, 4]})
+
+
+@benchmark
+def write_to_file_adapters(tmp, scale):
+    """filter_fastq2.write_to_file with length and GC filters and screening for 300 random 20-30 bp adapters."""
+    rng = np.random.default_rng(SEED)
+    adapters_path = os.path.join(tmp, 'adapters.fasta')
+    with open(adapters_path, 'w') as ouf:
+        for i, length in enumerate(rng.integers(20, 31, size=300)):
+            ouf.write(f'>adapter{i}\n{"".join(rng.choice(list("ACGT"), size=length))}\n')
+    return write_to_file_case(tmp, scale, **{'--adapters': adapters_path})
+
+
+@benchmark
+def write_to_file_metrics(tmp, scale):
+    """filter_fastq2.write_to_file with length and GC filters from the cached read metrics (--metrics_cache)."""
+    from metrics_cache import get_metrics
+    case = write_to_file_case(tmp, scale, **{'--metrics_cache': True})
+    get_metrics(os.path.join(tmp, 'reads.fastq'))  # a threshold sweep measures the input once
+    return case
+
+
+@benchmark
+def write_to_file_paired(tmp, scale):
+    """filter_fastq2.write_to_file_paired on R1 and R2 files with length and GC filters."""
+    from filter_fastq2 import write_to_file_paired
+    case = write_to_file_case(tmp, scale)
+    r2_path = os.path.join(tmp, 'reads_R2.fastq')
+    write_fastq(r2_path, case.items, length=150, length_sd=15, gc=50, gc_sd=8, seed=SEED + 1)
+    parsed_args = filter_args(tmp, os.path.join(tmp, 'reads.fastq'), **{'--paired': r2_path})
+
+    def reset():
+        for mate in ['R1', 'R2']:
+            for kind in ['passed', 'orphan', 'failed']:
+                path = f'{parsed_args["--output_base_name"]}__{mate}_{kind}.fastq'
+                if os.path.exists(path):
+                    os.remove(path)
+    return Case(lambda: write_to_file_paired(parsed_args), case.items, 'pairs', reset)
+
+
+@benchmark
+def gc_count(tmp, scale):
+    """filter_fastq2.gc_count of each read."""
+    from filter_fastq2 import gc_count
+    seqs = synthetic_seqs(scaled(200000, scale), length=150, length_sd=15, gc_sd=8, seed=SEED)
+    return Case(lambda: [gc_count(seq) for seq in seqs], len(seqs), 'reads')
+
+
+@benchmark
+def dna_construction(tmp, scale):
+    """Dna objects made from validated 150 bp reads."""
+    from nucleic_acids import Dna
+    seqs = synthetic_seqs(scaled(100000, scale), seed=SEED)
+    return Case(lambda: [Dna(seq) for seq in seqs], len(seqs), 'reads')
+
+
+@benchmark
+def dna_from_trusted(tmp, scale):
+    """Dna objects made from 150 bp reads without validation."""
+    from nucleic_acids import Dna
+    seqs = synthetic_seqs(scaled(100000, scale), seed=SEED)
+    return Case(lambda: [Dna.from_trusted(seq) for seq in seqs], len(seqs), 'reads')
+
+
+@benchmark
+def rna_construction(tmp, scale):
+    """Rna objects made from validated 150 bp reads."""
+    from nucleic_acids import Rna
+    seqs = [seq.replace('T', 'U') for seq in synthetic_seqs(scaled(100000, scale), seed=SEED)]
+    return Case(lambda: [Rna(seq) for seq in seqs], len(seqs), 'reads')
+
+
+@benchmark
+def dna_construction_long(tmp, scale):
+    """One Dna object made from a validated 10 Mb sequence."""
+    from nucleic_acids import Dna
+    seq = synthetic_seqs(1, length=scaled(10 ** 7, scale), seed=SEED)[0]
+    return Case(lambda: Dna(seq), len(seq), 'bases')
+
+
+@benchmark
+def reverse_complement(tmp, scale):
+    """Dna.reverse_complement of 150 bp reads."""
+    from nucleic_acids import Dna
+    dnas = [Dna(seq) for seq in synthetic_seqs(scaled(100000, scale), seed=SEED)]
+    return Case(lambda: [dna.reverse_complement() for dna in dnas], len(dnas), 'reads')
+
+
+@benchmark
+def batch_reverse_complement(tmp, scale):
+    """nucleic_acids.batch_reverse_complement of 150 bp reads."""
+    from nucleic_acids import batch_reverse_complement
+    seqs = synthetic_seqs(scaled(100000, scale), seed=SEED)
+    return Case(lambda: batch_reverse_complement(seqs), len(seqs), 'reads')
+
+
+@benchmark
+def seq_length_distribution(tmp, scale):
+    """plots.seq_length_distribution of a FASTA file of contigs with log-normal lengths (median 500 bp)."""
+    from plots import seq_length_distribution
+    n_seqs = scaled(100000, scale)
+    fasta_path = os.path.join(tmp, 'contigs.fasta')
+    write_fasta(fasta_path, n_seqs, length=500, length_sd=1.0, length_distribution='lognormal', seed=SEED)
+    return Case(lambda: seq_length_distribution(fasta_path), n_seqs, 'sequences')
+
+
+@benchmark
+def indexed_fetch(tmp, scale):
+    """seq_index.SeqIndex.fetch of random 1 kb regions of an indexed FASTA file of contigs."""
+    from seq_index import build_index
+    n_seqs = scaled(20000, scale)
+    fasta_path = os.path.join(tmp, 'contigs.fasta')
+    write_fasta(fasta_path, n_seqs, length=5000, length_sd=1.0, length_distribution='lognormal', seed=SEED)
+    index = build_index(fasta_path)
+    rng = np.random.default_rng(SEED)
+    rows = rng.integers(0, n_seqs, 10000).tolist()
+    starts = (rng.random(10000) * index.lengths[rows]).astype(np.int64).tolist()
+    return Case(lambda: [index.fetch(row, start, start + 1000) for row, start in zip(rows, starts)], 10000, 'regions')
+
+
+def run_benchmark(name, scale=1.0, repeat=REPEAT):
+    """Prepare and run one benchmark `repeat` times; the fastest run counts."""
+    with tempfile.TemporaryDirectory() as tmp:
+        case = BENCHMARKS[name](tmp, scale)
+        runs = []
+        for _ in range(repeat):
+            if case.reset is not None:
+                case.reset()
+            start = time.perf_counter()
+            case.run()
+            runs.append(time.perf_counter() - start)
+    best = min(runs)
+    return {'seconds': best, 'runs': runs, 'items': case.items, 'unit': case.unit,
+            'per_second': case.items / best if best else None}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names=None, scale=1.0, repeat=REPEAT, stream=None):
+    """Run the benchmarks (all by default) and return the results with the environment they ran in."""
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = run_benchmark(name, scale, repeat)
+        if stream is not None:
+            print(f'{name:<26} {results[name]["seconds"]:10.4f} s {results[name]["per_second"]:14.0f} '
+                  f'{results[name]["unit"]}/s', file=stream, flush=True)
+    return {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': scale,
+            'repeat': repeat,
+            'seed': SEED,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Compare the throughput of the benchmarks in both result sets.
+
+    Returns rows of (name, baseline items/s, current items/s, change, status) where change is current/baseline - 1
+    and status is 'regression' for a drop beyond `threshold`, 'improvement' for a gain beyond it, 'ok' otherwise.
+    Throughput rather than time is compared, so runs of different --scale stay roughly comparable.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['per_second'] or not result['per_second']:
+            continue
+        change = result['per_second'] / before['per_second'] - 1
+        status = 'regression' if change < -threshold else 'improvement' if change > threshold else 'ok'
+        rows.append((name, before['per_second'], result['per_second'], change, status))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f'{"benchmark":<26} {"baseline/s":>14} {"current/s":>14} {"change":>8}']
+    for name, before, after, change, status in rows:
+        lines.append(f'{name:<26} {before:14.0f} {after:14.0f} {change:+8.1%}' +
+                     ('' if status == 'ok' else f'  {status.upper()}'))
+    return '\n'.join(lines)
+
+
+def option_value(args, option, convert, default):
+    if option not in args:
+        return default
+    idx = args.index(option)
+    try:
+        value = convert(args[idx + 1])
+    except (IndexError, ValueError):
+        raise ValueError(f'Please specify a valid value for {option}. Type --help for usage.')
+    del args[idx:idx + 2]
+    return value
+
+
+def main(args):
+    """Run the suite from command line arguments; returns the exit status."""
+    args = list(args)
+    if '--help' in args:
+        print(__doc__.split('\n\n', 1)[1])
+        return 0
+    if '--list' in args:
+        for name, func in BENCHMARKS.items():
+            print(f'{name:<26} {func.__doc__}')
+        return 0
+    scale = option_value(args, '--scale', float, 1.0)
+    repeat = option_value(args, '--repeat', int, REPEAT)
+    names = option_value(args, '--only', lambda value: value.split(','), None)
+    output = option_value(args, '--output', str, None)
+    baseline_path = option_value(args, '--baseline', str, None)
+    threshold = option_value(args, '--threshold', float, THRESHOLD)
+    if args:
+        raise ValueError(f'Unknown arguments {" ".join(args)}. Type --help for usage.')
+    unknown = set(names or []) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f'Unknown benchmarks {", ".join(sorted(unknown))}. Type --list for the benchmarks.')
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as inf:
+            baseline = json.load(inf)
+    current = run_suite(names, scale, repeat, stream=sys.stdout)
+    if output:
+        with open(output, 'w') as ouf:
+            json.dump(current, ouf, indent=2)
+    if baseline is None:
+        return 0
+    rows = compare(baseline, current, threshold)
+    print(f'\nagainst {baseline_path} (commit {baseline["meta"].get("commit")}), threshold {threshold:.0%}:')
+    print(format_comparison(rows))
+    return 1 if any(row[4] == 'regression' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
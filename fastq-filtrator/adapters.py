@@ -0,0 +1,204 @@
+import functools
+import hashlib
+import os
+from collections import deque
+
+import numpy as np
+
+AUTOMATON_VERSION = 1  # bump when the cached arrays change meaning
+SEGMENT_LENGTH = 256  # bases of a read scanned per lane; longer reads are cut into overlapping segments
+ALPHABET = 5  # A, C, G, T and anything else, which no pattern contains
+
+BASE_CODES = np.full(256, 4, dtype=np.int32)
+for code, bases in enumerate([b'Aa', b'Cc', b'Gg', b'Tt']):
+    BASE_CODES[list(bases)] = code
+COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+
+
+def cache_dir():
+    """Where compiled automata are kept: $XDG_CACHE_HOME/fastq-filtrator, ~/.cache/fastq-filtrator by default."""
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                        'fastq-filtrator')
+
+
+def reverse_complement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def read_patterns(path):
+    """(name, sequence) of the patterns in a FASTA file, or in a text file with a sequence per line (named by itself).
+
+    Sequences are upper-cased and may only contain A, C, G and T.
+    """
+    with open(path) as inf:
+        lines = [line.strip() for line in inf if line.strip()]
+    if lines and lines[0].startswith('>'):
+        patterns = []
+        for line in lines:
+            if line.startswith('>'):
+                patterns.append([line[1:].split(None, 1)[0] if line[1:].strip() else f'pattern{len(patterns) + 1}', ''])
+            else:
+                patterns[-1][1] += line.upper()
+    else:
+        patterns = [[line.upper(), line.upper()] for line in lines]
+    for name, seq in patterns:
+        if not seq or seq.strip('ACGT'):
+            raise ValueError(f'Pattern {name} in {path} must be a non-empty sequence of A, C, G and T.')
+    if not patterns:
+        raise ValueError(f'No patterns in {path}.')
+    return [tuple(pattern) for pattern in patterns]
+
+
+class Automaton:
+    """An Aho-Corasick automaton of DNA patterns and their reverse complements, run on NumPy arrays of reads.
+
+    `delta` is the full transition table: the next state of state s on base code c (see BASE_CODES) is
+    delta[s * ALPHABET + c], stored premultiplied by ALPHABET so a step is one lookup. `out_length[s]` is the length
+    of the longest pattern ending at state s (0 for none) and `out_pattern[s]` its number in `names`. Reads are scanned
+    in lanes, one base of every read per step, so the work per base does not depend on the number of patterns.
+    """
+    def __init__(self, names, delta, out_length, out_pattern):
+        self.names = list(names)
+        self.delta = delta
+        self.out_length = out_length
+        self.out_pattern = out_pattern
+        self.max_length = int(out_length.max(initial=0))
+        self.out_steps = np.repeat(out_length, ALPHABET)  # out_length by premultiplied state
+
+    @classmethod
+    def build(cls, patterns):
+        """Compile (name, sequence) patterns. A sequence found under several names counts for the first of them."""
+        goto = [{}]
+        terminal = {}  # state: (length, pattern number)
+        for number, (_, seq) in enumerate(patterns):
+            for strand in dict.fromkeys([seq, reverse_complement(seq)]):
+                state = 0
+                for code in BASE_CODES[list(strand.encode())].tolist():
+                    if code not in goto[state]:
+                        goto[state][code] = len(goto)
+                        goto.append({})
+                    state = goto[state][code]
+                terminal.setdefault(state, (len(strand), number))
+
+        n_states = len(goto)
+        delta = np.zeros((n_states, ALPHABET), dtype=np.int64)
+        out_length = np.zeros(n_states, dtype=np.int64)
+        out_pattern = np.full(n_states, -1, dtype=np.int64)
+        fail = [0] * n_states
+        queue = deque()
+        for code, child in goto[0].items():
+            delta[0, code] = child
+            queue.append(child)
+        while queue:  # breadth first, so the fail state of every state is done before it
+            state = queue.popleft()
+            out_length[state], out_pattern[state] = terminal.get(state, (out_length[fail[state]],
+                                                                         out_pattern[fail[state]]))
+            delta[state] = delta[fail[state]]
+            for code, child in goto[state].items():
+                fail[child] = delta[fail[state], code]
+                delta[state, code] = child
+                queue.append(child)
+        delta[:, ALPHABET - 1] = 0
+        return cls([name for name, _ in patterns], (delta * ALPHABET).ravel(), out_length, out_pattern)
+
+    def scan(self, data, starts, ends):
+        """Find the patterns in the sequences data[starts[i]:ends[i]].
+
+        Returns the offset in `data` where the earliest match in each sequence starts (-1 if none) and the number of
+        the pattern matched there (-1 if none). Sequences longer than SEGMENT_LENGTH are scanned as overlapping
+        segments, so no lane is much longer than the others.
+        """
+        n_reads = len(starts)
+        lengths = ends - starts
+        n_segments = (lengths + SEGMENT_LENGTH - 1) // SEGMENT_LENGTH
+        first_segments = np.zeros(n_reads + 1, dtype=np.int64)
+        np.cumsum(n_segments, out=first_segments[1:])
+        reads = np.repeat(np.arange(n_reads), n_segments)
+        seg_starts = starts[reads] + (np.arange(len(reads)) - first_segments[reads]) * SEGMENT_LENGTH
+        seg_lengths = np.minimum(seg_starts + SEGMENT_LENGTH + self.max_length - 1, ends[reads]) - seg_starts
+        order = np.argsort(-seg_lengths, kind='stable')  # longest first: lanes still going are a prefix
+        seg_starts, seg_lengths = seg_starts[order], seg_lengths[order]
+        active = np.searchsorted(-seg_lengths, -np.arange(int(seg_lengths.max(initial=0))), side='left')
+
+        low = int(starts.min(initial=0))
+        codes = BASE_CODES[data[low:int(ends.max(initial=0))]]
+        seg_starts -= low
+        states = np.zeros(len(seg_starts), dtype=np.int64)
+        best = np.full(len(seg_starts), np.iinfo(np.int64).max)
+        best_pattern = np.full(len(seg_starts), -1, dtype=np.int64)
+        for step, n in enumerate(active.tolist()):
+            states[:n] = self.delta[states[:n] + codes[seg_starts[:n] + step]]
+            matched = self.out_steps[states[:n]]
+            hits = np.flatnonzero(matched)
+            if len(hits):
+                match_starts = seg_starts[hits] + low + step + 1 - matched[hits]
+                better = match_starts < best[hits]
+                best[hits[better]] = match_starts[better]
+                best_pattern[hits[better]] = self.out_pattern[states[hits[better]] // ALPHABET]
+
+        seg_best = np.empty_like(best)
+        seg_best[order] = best
+        seg_pattern = np.empty_like(best_pattern)
+        seg_pattern[order] = best_pattern
+        match_starts = np.full(n_reads, -1, dtype=np.int64)
+        patterns = np.full(n_reads, -1, dtype=np.int64)
+        found = np.flatnonzero(seg_pattern >= 0)
+        if len(found):
+            # the earliest match of each read over its segments
+            found = found[np.lexsort((seg_best[found], reads[found]))]
+            firsts = found[np.concatenate(([True], reads[found][1:] != reads[found][:-1]))]
+            match_starts[reads[firsts]] = seg_best[firsts]
+            patterns[reads[firsts]] = seg_pattern[firsts]
+        return match_starts, patterns
+
+    def save(self, path):
+        """Write the arrays to an .npz file, through a temporary file so a crash leaves no half-written cache."""
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, names=np.array(self.names, dtype=str), delta=self.delta, out_length=self.out_length,
+                 out_pattern=self.out_pattern)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays['names'].tolist(), arrays['delta'], arrays['out_length'], arrays['out_pattern'])
+
+
+def load_automaton(path, cache=True):
+    """The Automaton of the patterns in the file at `path`.
+
+    Compiled automata are cached in cache_dir() under the SHA-256 of the file contents, so a pattern set is compiled
+    once however often it is used. A cache that cannot be written is skipped.
+    """
+    with open(path, 'rb') as inf:
+        digest = hashlib.sha256(inf.read()).hexdigest()
+    cache_path = os.path.join(cache_dir(), f'automaton-v{AUTOMATON_VERSION}-{digest}.npz')
+    if cache and os.path.isfile(cache_path):
+        try:
+            return Automaton.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass  # a damaged cache file is compiled again
+    automaton = Automaton.build(read_patterns(path))
+    if cache:
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            automaton.save(cache_path)
+        except OSError:
+            pass
+    return automaton
+
+
+def cached_automaton(path):
+    """load_automaton(path), loaded once per process for as long as the file keeps its size and modification time.
+
+    Pipelines are built per range in --threads mode and per file in --batch mode; this spares each of them reading
+    and hashing the pattern file and loading the compiled automaton again. The automaton is never modified, so
+    pipelines share it.
+    """
+    stat = os.stat(path)
+    return _cached_automaton(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_automaton(path, size, mtime_ns):
+    return load_automaton(path)
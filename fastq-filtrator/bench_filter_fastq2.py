@@ -0,0 +1,202 @@
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fastq_reader import FastqReader
+from filter_fastq2 import FastqWriter, batch_metrics, batch_valid, file_exists, filter_mapped, filter_reads, \
+    mate_name, read_chunk, seqs_to_array, valid_gc, valid_len, write_to_file, write_to_file_paired
+from pipeline import Pipeline
+
+
+def make_fastq(path, n_reads, read_len=101, seed=42):
+    """Write a synthetic FASTQ file with `n_reads` random reads of length `read_len`."""
+    rng = random.Random(seed)
+    # Illumina-like qualities: mostly high, dropping towards the 3' end
+    profile = [[chr(33 + max(2, min(41, round(rng.gauss(38 - 12 * pos / read_len, 5))))) for _ in range(64)]
+               for pos in range(read_len)]
+    with open(path, 'w') as ouf:
+        for i in range(n_reads):
+            seq = ''.join(rng.choice('ACGT') for _ in range(read_len))
+            qual = ''.join(rng.choice(choices) for choices in profile)
+            ouf.write(f'@synthetic_read{i}\n{seq}\n+\n{qual}\n')
+
+
+def write_to_file_per_read_open(parsed_args):
+    """The pre-buffering filter loop that reopens the outputs for every read. Kept for comparison only."""
+    minlen = parsed_args['--min_length']
+    keep_filtered = parsed_args['--keep_filtered']
+    gc_bounds = parsed_args['--gc_bounds']
+    output_base_name = parsed_args['--output_base_name']
+    output_passed = output_base_name + '__passed.fastq'
+    file_exists(output_base_name)
+
+    with open(parsed_args['fastq_path'], 'r') as inf:
+        read = []
+        passed = 0
+        failed = 0
+        for line in inf:
+            if len(read) != 3:
+                read.append(line.strip())
+                continue
+            read.append(line.rstrip())
+            with open(output_passed, 'a') as ouf_passed:
+                if valid_gc(read[1], gc_bounds) and valid_len(read[1], minlen):
+                    ouf_passed.write('\n'.join(read) + '\n')
+                    passed += 1
+                else:
+                    if keep_filtered:
+                        with open(output_base_name + '__failed.fastq', 'a') as ouf_failed:
+                            ouf_failed.write('\n'.join(read) + '\n')
+                    failed += 1
+            read = []
+    return passed, failed
+
+
+def bench(func, parsed_args, n_reads, repeat=1):
+    """Best reads/s of `repeat` runs of `func` on parsed_args."""
+    best = 0
+    for _ in range(repeat):
+        for suffix in ['passed', 'failed']:
+            path = f'{parsed_args["--output_base_name"]}__{suffix}.fastq'
+            if os.path.exists(path):
+                os.remove(path)
+        start = time.perf_counter()
+        func(parsed_args)
+        best = max(best, n_reads / (time.perf_counter() - start))
+    return best
+
+
+def bench_filters(fastq_path, minlen, gc_bounds):
+    """Time the per-read valid_gc/valid_len checks against batch_metrics/batch_valid on already parsed reads."""
+    with open(fastq_path, 'r') as inf:
+        seqs = [read[1] for read in read_chunk(inf, 1 << 30)]
+    start = time.perf_counter()
+    per_read = [valid_gc(seq, gc_bounds) and valid_len(seq, minlen) for seq in seqs]
+    per_read_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = batch_valid(*batch_metrics(*seqs_to_array(seqs)), minlen, gc_bounds)
+    batch_time = time.perf_counter() - start
+    assert per_read == batch.tolist()
+    return len(seqs) / per_read_time, len(seqs) / batch_time
+
+
+def bench_reader(parsed_args, output_path, n_reads):
+    """Reads/s and peak traced allocations of the line-based loop (filter_reads) and the mmap one (filter_mapped)."""
+    fastq_path = parsed_args['fastq_path']
+    results = {}
+    for name in ['lines', 'mmap']:
+        tracemalloc.start()
+        start = time.perf_counter()
+        with FastqWriter(output_path) as ouf:
+            if name == 'lines':
+                with open(fastq_path, 'r') as inf:
+                    filter_reads(inf, ouf, None, Pipeline.from_args(parsed_args))
+            else:
+                with FastqReader(fastq_path) as reader:
+                    filter_mapped(reader, ouf, None, Pipeline.from_args(parsed_args))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (n_reads / elapsed, peak)
+    return results
+
+
+def bench_quality(parsed_args, n_reads):
+    """Reads/s of write_to_file with the length and GC filters only, and with the quality filters and trimming too."""
+    quality_args = dict(parsed_args, **{'--min_mean_quality': 25.0, '--min_base_quality': 2, '--trim_quality': [20, 4]})
+    return bench(write_to_file, parsed_args, n_reads, 3), bench(write_to_file, quality_args, n_reads, 3)
+
+
+def bench_threads(parsed_args, n_reads, workers=(1, 2, 4, 8, 16)):
+    """Reads/s of write_to_file for each number of worker processes."""
+    return {n: bench(write_to_file, dict(parsed_args, **{'--threads': n}), n_reads) for n in workers}
+
+
+def repair_by_name(r1_path, r2_path, output_base_name):
+    """Re-pair separately filtered R1 and R2 files: hash all R1 reads by name, then stream R2. The third pass of the
+    two-run workflow that --paired replaces. For comparison."""
+    with open(r1_path, 'r') as inf:
+        r1_reads = {mate_name(read[0]): read for read in read_chunk(inf, 1 << 40)}
+    with open(r2_path, 'r') as inf, FastqWriter(f'{output_base_name}__R1_passed.fastq') as ouf_r1, \
+            FastqWriter(f'{output_base_name}__R2_passed.fastq') as ouf_r2, \
+            FastqWriter(f'{output_base_name}__R2_orphan.fastq') as ouf_orphan:
+        for read in iter(lambda: read_chunk(inf, 1), []):
+            mate = r1_reads.pop(mate_name(read[0][0]), None)
+            if mate is None:
+                ouf_orphan.write(read[0])
+            else:
+                ouf_r1.write(mate)
+                ouf_r2.write(read[0])
+    with FastqWriter(f'{output_base_name}__R1_orphan.fastq') as ouf_orphan:
+        for read in r1_reads.values():
+            ouf_orphan.write(read)
+
+
+def bench_paired(parsed_args, r2_path, n_reads):
+    """Seconds and peak traced allocations of filtering R1 and R2 in two runs and re-pairing by name, and of one
+    lockstep --paired run."""
+    base = parsed_args['--output_base_name']
+    results = {}
+    for name in ['two runs + re-pair', '--paired']:
+        for path in glob.glob(f'{base}*__*.fastq'):
+            os.remove(path)
+        tracemalloc.start()
+        start = time.perf_counter()
+        if name == '--paired':
+            write_to_file_paired(dict(parsed_args, **{'--paired': r2_path, '--keep_filtered': False}))
+        else:
+            for mate, path in [('R1', parsed_args['fastq_path']), ('R2', r2_path)]:
+                write_to_file(dict(parsed_args, **{'fastq_path': path, '--output_base_name': f'{base}_{mate}',
+                                                   '--keep_filtered': False}))
+            repair_by_name(f'{base}_R1__passed.fastq', f'{base}_R2__passed.fastq', base)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (elapsed, peak)
+    return results
+
+
+if __name__ == '__main__':
+    n_reads = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        fastq_path = os.path.join(tmp, 'synthetic.fastq')
+        make_fastq(fastq_path, n_reads)
+        parsed_args = {
+            '--min_length': 50,
+            '--keep_filtered': True,
+            '--gc_bounds': [45.0, 55.0],
+            '--output_base_name': os.path.join(tmp, 'synthetic'),
+            'fastq_path': fastq_path
+        }
+        before = bench(write_to_file_per_read_open, parsed_args, n_reads)
+        after = bench(write_to_file, parsed_args, n_reads)
+        per_read, batch = bench_filters(fastq_path, parsed_args['--min_length'], parsed_args['--gc_bounds'])
+        scaling = bench_threads(parsed_args, n_reads)
+        without_quality, with_quality = bench_quality(parsed_args, n_reads)
+        readers = bench_reader(parsed_args, os.path.join(tmp, 'reader.fastq'), n_reads)
+        r2_path = os.path.join(tmp, 'synthetic_R2.fastq')
+        make_fastq(r2_path, n_reads, seed=43)
+        paired = bench_paired(dict(parsed_args, **{'--output_base_name': os.path.join(tmp, 'paired')}), r2_path,
+                              n_reads)
+    print(f'{n_reads} reads, 101 bp, --keep_filtered')
+    print(f'per-read open:   {before:12.0f} reads/s')
+    print(f'buffered writer: {after:12.0f} reads/s ({after / before:.2f}x)')
+    print('filters only:')
+    print(f'per-read checks: {per_read:12.0f} reads/s')
+    print(f'batch engine:    {batch:12.0f} reads/s ({batch / per_read:.2f}x)')
+    print('quality stage:')
+    print(f'length + GC:     {without_quality:12.0f} reads/s')
+    print(f'+ quality, trim: {with_quality:12.0f} reads/s ({1 - with_quality / without_quality:.0%} slower)')
+    print('reading (tracemalloc slows both down):')
+    for name, (reads_per_sec, peak) in readers.items():
+        print(f'{name + ":":<16} {reads_per_sec:12.0f} reads/s, peak {peak / 2 ** 20:.1f} MiB allocated')
+    print(f'--threads scaling ({os.cpu_count()} CPUs):')
+    for n, reads_per_sec in scaling.items():
+        print(f'{n:>2} workers:      {reads_per_sec:12.0f} reads/s ({reads_per_sec / scaling[1]:.2f}x)')
+    print(f'paired-end, {n_reads} pairs (tracemalloc slows both down):')
+    for name, (elapsed, peak) in paired.items():
+        print(f'{name + ":":<20} {elapsed:8.2f} s, peak {peak / 2 ** 20:8.1f} MiB allocated')
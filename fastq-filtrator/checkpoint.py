@@ -0,0 +1,106 @@
+import json
+import os
+import time
+
+CHECKPOINT_INTERVAL = 60.0  # seconds between checkpoints
+CHECKPOINT_VERSION = 1
+RESUMABLE_COMPRESSIONS = [None, 'bgzip']  # outputs that stay valid when truncated at a flushed offset
+RUN_ARGS = ['--profile', '--stats-json', '--resume', '--threads']  # options that do not change the output
+
+
+def checkpoint_path(output_base_name):
+    return f'{output_base_name}.checkpoint.json'
+
+
+def input_identity(path):
+    """What tells an input file apart from a changed one: its absolute path, size and modification time."""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def filter_args(parsed_args):
+    """The parsed arguments that decide what is written, in the form they take in a JSON file."""
+    return json.loads(json.dumps({key: value for key, value in parsed_args.items() if key not in RUN_ARGS}))
+
+
+def write_atomically(path, data):
+    """Replace the file at `path` with `data` so that a crash leaves either the old or the new file, never a mix."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as ouf:
+        ouf.write(data)
+        ouf.flush()
+        os.fsync(ouf.fileno())
+    os.replace(tmp_path, path)
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:  # directories cannot be opened on Windows
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def load_checkpoint(path, fastq_path, parsed_args):
+    """Read the checkpoint of an unfinished run and check that it was a run of the same input and options."""
+    if not os.path.isfile(path):
+        raise ValueError(f'Nothing to resume: no checkpoint {path}. Type --help for usage.')
+    with open(path) as inf:
+        state = json.load(inf)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'{path} was written by another version of filter_fastq2 and cannot be resumed.')
+    if state['input'] != input_identity(fastq_path):
+        raise ValueError(f'{fastq_path} changed since {path} was written; the run cannot be resumed.')
+    if state['args'] != filter_args(parsed_args):
+        raise ValueError(f'The options differ from those of the run in {path}; resume it with the same options.')
+    return state
+
+
+def truncate_outputs(state):
+    """Cut the output files back to their sizes at the checkpoint."""
+    for path, size in state['outputs'].items():
+        if not os.path.isfile(path) or os.path.getsize(path) < size:
+            raise ValueError(f'{path} is shorter than at the checkpoint; the run cannot be resumed.')
+        with open(path, 'r+b') as ouf:
+            ouf.truncate(size)
+
+
+class Checkpointer:
+    """Periodically saves how far a filtering run got, so that it can be resumed after a crash.
+
+    A checkpoint holds the input position (a byte offset for mapped input, else the number of reads done), the
+    passed/failed counts and the sizes of the output files once they are synced to disk. `state` is the checkpoint
+    a resumed run started from; counts given to `advance` are added to its counts.
+    """
+    def __init__(self, path, fastq_path, parsed_args, writers, interval=CHECKPOINT_INTERVAL, state=None):
+        self.path = path
+        self.writers = writers
+        self.interval = interval
+        self.base = state or {'offset': 0, 'records': 0, 'passed': 0, 'failed': 0}
+        self.state = {
+            'version': CHECKPOINT_VERSION,
+            'input': input_identity(fastq_path),
+            'args': filter_args(parsed_args),
+        }
+        self.save(self.base['offset'], self.base['passed'], self.base['failed'])
+
+    def advance(self, passed, failed, offset=None):
+        """Take a checkpoint if one is due. `passed` and `failed` count the reads of this run, `offset` is the input
+        byte offset they end at (for mapped input)."""
+        if time.monotonic() >= self.next_save:
+            self.save(offset, self.base['passed'] + passed, self.base['failed'] + failed)
+
+    def save(self, offset, passed, failed):
+        self.state.update({
+            'offset': offset,
+            'records': passed + failed,
+            'passed': passed,
+            'failed': failed,
+            'outputs': {writer.path: writer.sync() for writer in self.writers},
+        })
+        write_atomically(self.path, json.dumps(self.state, indent=2))
+        self.next_save = time.monotonic() + self.interval
+
+    def remove(self):
+        """The run finished: drop the checkpoint."""
+        os.remove(self.path)
@@ -0,0 +1,210 @@
+import gzip
+import io
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+
+GZIP_MAGIC = b'\x1f\x8b'  # also the start of every bgzip block
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSIONS = ['gzip', 'bgzip', 'zstd']
+EXTENSIONS = {None: '', 'gzip': '.gz', 'bgzip': '.gz', 'zstd': '.zst'}
+
+BGZF_BLOCK_SIZE = 0xff00  # uncompressed bytes per bgzip block, as in htslib
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('zstd support requires the zstandard package: pip install zstandard')
+    return zstandard
+
+
+def open_stream(path, mode):
+    """Open a file, or a duplicate of the stdin/stdout descriptor for '-', which can be closed on its own."""
+    if path == '-':
+        stream = sys.stdin if 'r' in mode else sys.stdout
+        if stream is sys.stdout:
+            stream.flush()
+        return open(os.dup(stream.fileno()), mode)
+    return open(path, mode)
+
+
+def detect_format(path, inf=None):
+    """Tell the compression of a file by its magic bytes: 'gzip' (which covers bgzip), 'zstd' or None.
+
+    For an already opened buffered stream `inf` (stdin) the bytes are peeked at, so nothing is consumed.
+    """
+    if inf is not None:
+        magic = inf.peek(4)[:4]
+    else:
+        with open(path, 'rb') as inf:
+            magic = inf.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+class PrefetchReader(io.RawIOBase):
+    """Reads a binary stream in a background thread, keeping up to `depth` blocks ready for the consumer.
+
+    Wrapped around a decompressing stream, this lets decompression (which releases the GIL) overlap with filtering.
+    """
+    def __init__(self, raw, block_size=1 << 20, depth=4):
+        super().__init__()
+        self.blocks = queue.Queue(depth)
+        self.block = memoryview(b'')
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._fill, args=(raw, block_size), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, raw, block_size):
+        try:
+            while True:
+                block = raw.read(block_size)
+                if not self._put(block) or not block:
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            raw.close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.block:
+            if self.eof:
+                return 0
+            item = self.blocks.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.block = memoryview(item)
+        n = min(len(b), len(self.block))
+        b[:n] = self.block[:n]
+        self.block = self.block[n:]
+        return n
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        super().close()
+
+
+class BgzfWriter(io.BufferedIOBase):
+    """Writes multi-member bgzip: independent gzip blocks of at most BGZF_BLOCK_SIZE bytes with the BGZF size field.
+
+    The result is readable by any gzip reader and can be indexed by htslib tools. The empty EOF block is written on
+    close unless `eof` is False, which is used for parts that are concatenated afterwards. `flush` ends the current
+    block early, so the file can be cut at its size then and appended to (`append`) later.
+    """
+    def __init__(self, path, eof=True, level=6, append=False):
+        super().__init__()
+        self.handle = open_stream(path, 'ab' if append else 'wb')
+        self.pending = bytearray()
+        self.eof = eof
+        self.level = level
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending += data
+        while len(self.pending) >= BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self.pending[:BGZF_BLOCK_SIZE]))
+            del self.pending[:BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def flush(self):
+        if self.handle.closed:
+            return
+        if self.pending:
+            self._write_block(bytes(self.pending))
+            self.pending = bytearray()
+        self.handle.flush()
+
+    def fileno(self):
+        return self.handle.fileno()
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+        self.handle.write(header + struct.pack('<H', len(header) + 2 + len(deflated) + 8 - 1) + deflated +
+                          struct.pack('<II', zlib.crc32(data), len(data)))
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.pending:
+                self._write_block(bytes(self.pending))
+                self.pending = bytearray()
+            if self.eof:
+                self.handle.write(BGZF_EOF)
+        finally:
+            self.handle.close()
+            super().close()
+
+
+class StreamGzipFile(gzip.GzipFile):
+    """GzipFile over an open file object that closes the file object too (GzipFile itself leaves it open)."""
+    def close(self):
+        stream = self.fileobj
+        try:
+            super().close()
+        finally:
+            if stream is not None:
+                stream.close()
+
+
+def open_input(path):
+    """Open a plain, gzip/bgzip or zstd FASTQ file ('-' for stdin) for reading text.
+
+    Compressed input is decompressed in a background thread.
+    """
+    inf = open_stream(path, 'rb')
+    compression = detect_format(path, inf)
+    if compression is None:
+        return io.TextIOWrapper(inf)
+    if compression == 'gzip':
+        raw = StreamGzipFile(fileobj=inf, mode='rb')
+    else:
+        raw = import_zstandard().open(inf, 'rb')
+    return io.TextIOWrapper(io.BufferedReader(PrefetchReader(raw)), encoding='ascii')
+
+
+def open_output(path, compression=None, eof=True, append=False):
+    """Open an output file ('-' for stdout) for writing bytes, compressed with `compression` (one of COMPRESSIONS).
+
+    With `append` writing continues at the end of the file; only plain and bgzip output can be appended to.
+    """
+    if compression is None:
+        return open_stream(path, 'ab' if append else 'wb')
+    if compression == 'bgzip':
+        return BgzfWriter(path, eof=eof, append=append)
+    if append:
+        raise ValueError(f'{compression} output cannot be appended to.')
+    if compression == 'gzip':
+        return StreamGzipFile(fileobj=open_stream(path, 'wb'), mode='wb')
+    return import_zstandard().open(open_stream(path, 'wb'), 'wb')
@@ -0,0 +1,176 @@
+import math
+
+import numpy as np
+
+FINGERPRINT_SEED = 20210211
+MAX_LOAD = 0.5  # share of filled slots at which a FingerprintTable doubles
+BLOOM_HASHES = 7  # bits per key in a BloomFilter; best for about 10 bits per distinct read
+GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+
+
+def mix(values):
+    """The splitmix64 finalizer: spreads every input bit over all 64 output bits. `values` is a uint64 array."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def gather(data, starts, ends):
+    """Copy the byte ranges data[starts[i]:ends[i]] into one array; returns it with the offsets of the ranges in it."""
+    lengths = ends - starts
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+    return data[positions], offsets
+
+
+class RangeHasher:
+    """Hashes byte ranges to 64 bits: the sum over positions i of key[i] * (byte + 1), modulo 2 ** 64.
+
+    The keys are random 64-bit numbers, one per position, drawn from a seeded generator and extended as longer ranges
+    come, so equal ranges always get equal hashes and different ones collide with a chance of about 2 ** -62. Unlike
+    a polynomial hash modulo 2 ** 64, which Thue-Morse-like strings break for every base, this has no structured
+    collisions. `fold_case` hashes lower-case letters as upper-case ones.
+    """
+    def __init__(self, seed=FINGERPRINT_SEED, fold_case=False):
+        self.seed = seed
+        self.fold_case = fold_case
+        self.keys = np.zeros(0, dtype=np.uint64)
+
+    def position_keys(self, n):
+        if len(self.keys) < n:  # the generator's output is the same whatever the size, so old keys stay the same
+            self.keys = np.random.default_rng(self.seed).integers(0, 2 ** 64 - 1, size=max(n, 2 * len(self.keys)),
+                                                                  dtype=np.uint64, endpoint=True)
+        return self.keys
+
+    def hash(self, data, starts, ends):
+        raw, offsets = gather(data, starts, ends)
+        if self.fold_case:
+            raw = raw & np.uint8(0xdf)
+        lengths = ends - starts
+        positions = np.arange(len(raw)) - np.repeat(offsets[:-1], lengths)
+        terms = self.position_keys(int(lengths.max(initial=0)))[positions] * (raw.astype(np.uint64) + np.uint64(1))
+        sums = np.zeros(len(terms) + 1, dtype=np.uint64)
+        np.cumsum(terms, out=sums[1:])
+        return sums[offsets[1:]] - sums[offsets[:-1]]  # wraps around like the sums did
+
+
+def fingerprints(chunk, idx, seq_hasher, qual_hasher=None, length=None, quality=0):
+    """64-bit fingerprints of the reads at indices `idx` of a pipeline Chunk: of the first `length` bases (all if
+    None) and the first `quality` quality characters. Never 0, which marks empty FingerprintTable slots."""
+    starts = chunk.seq_starts[idx]
+    ends = chunk.seq_ends[idx] if length is None else np.minimum(chunk.seq_ends[idx], starts + length)
+    values = mix(seq_hasher.hash(chunk.seq_data, starts, ends) + (ends - starts).astype(np.uint64) * GOLDEN)
+    if quality:
+        qual_starts = chunk.qual_starts[idx]
+        qual_ends = np.minimum(chunk.qual_ends[idx], qual_starts + quality)
+        values = mix(values ^ qual_hasher.hash(chunk.qual_data, qual_starts, qual_ends))
+    values[values == 0] = 1
+    return values
+
+
+def first_occurrences(values):
+    """Mask of the values that do not occur earlier in the array."""
+    mask = np.zeros(len(values), dtype=bool)
+    mask[np.unique(values, return_index=True)[1]] = True
+    return mask
+
+
+class FingerprintTable:
+    """An exact set of nonzero 64-bit fingerprints: open addressing with linear probing in a uint64 array.
+
+    Slots are found by the low bits of the (already mixed) fingerprints; 0 marks an empty slot. A batch is inserted
+    with NumPy: every round, all pending fingerprints look at their slot, claim it if it is empty and move on if it
+    holds another fingerprint. The table doubles when it gets MAX_LOAD full, so it takes 16 to 32 bytes per
+    distinct read.
+    """
+    def __init__(self, capacity=1 << 16):
+        self.slots = np.zeros(1 << max(capacity - 1, 1).bit_length(), dtype=np.uint64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.slots.nbytes
+
+    def add(self, values):
+        """Add fingerprints in order. Returns the mask of those not seen before, earlier in `values` included."""
+        new = first_occurrences(values)
+        keys = values[new]
+        if self.size + len(keys) > MAX_LOAD * len(self.slots):
+            self._resize(self.size + len(keys))
+        inserted = self._insert(self.slots, keys)
+        self.size += int(np.count_nonzero(inserted))
+        new[np.flatnonzero(new)[~inserted]] = False
+        return new
+
+    def _resize(self, size):
+        capacity = len(self.slots)
+        while size > MAX_LOAD * capacity:
+            capacity *= 2
+        slots = np.zeros(capacity, dtype=np.uint64)
+        self._insert(slots, self.slots[self.slots != 0])
+        self.slots = slots
+
+    @staticmethod
+    def _insert(slots, keys):
+        """Insert distinct keys into `slots`; returns the mask of the keys that were not there yet."""
+        mask = np.uint64(len(slots) - 1)
+        positions = keys & mask
+        inserted = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            current = slots[positions[pending]]
+            empty = current == 0
+            claimed = pending[empty]
+            slots[positions[claimed]] = keys[claimed]  # of keys racing for a slot, one wins
+            won = slots[positions[claimed]] == keys[claimed]
+            inserted[claimed[won]] = True
+            moving = current != keys[pending]
+            moving[empty] = ~won
+            pending = pending[moving]
+            positions[pending] = (positions[pending] + np.uint64(1)) & mask
+        return inserted
+
+
+class BloomFilter:
+    """An approximate set of fingerprints in a fixed number of bytes, for inputs too large for a FingerprintTable.
+
+    Each fingerprint sets BLOOM_HASHES bits, found by double hashing. A new fingerprint whose bits happen to be set
+    already is taken for a duplicate (a false positive); the chance of that grows as the filter fills, see
+    `false_positive_rate`. Fingerprints of one batch are compared exactly among themselves.
+    """
+    def __init__(self, nbytes, hashes=BLOOM_HASHES):
+        self.bits = np.zeros(max(int(nbytes), 1), dtype=np.uint8)
+        self.n_bits = np.uint64(8 * len(self.bits))
+        self.hashes = hashes
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def add(self, values):
+        """Add fingerprints in order. Returns the mask of those (probably) seen for the first time."""
+        new = first_occurrences(values)
+        keys = values[new]
+        step = mix(keys ^ GOLDEN) | np.uint64(1)
+        positions = (keys[:, None] + np.arange(self.hashes, dtype=np.uint64)[None, :] * step[:, None]) % self.n_bits
+        byte_idx = (positions >> np.uint64(3)).astype(np.int64)
+        bit_masks = np.left_shift(1, (positions & np.uint64(7)).astype(np.uint8)).astype(np.uint8)
+        present = ((self.bits[byte_idx] & bit_masks) != 0).all(axis=1)
+        np.bitwise_or.at(self.bits, byte_idx[~present].ravel(), bit_masks[~present].ravel())
+        self.size += int(np.count_nonzero(~present))
+        new[np.flatnonzero(new)[present]] = False
+        return new
+
+    def false_positive_rate(self):
+        """The expected chance that a new fingerprint is taken for a duplicate, at the current fill."""
+        return (1 - math.exp(-self.hashes * self.size / int(self.n_bits))) ** self.hashes
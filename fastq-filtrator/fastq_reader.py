@@ -0,0 +1,146 @@
+import mmap
+import os
+
+import numpy as np
+
+
+class FastqRecord:
+    """A view of one read in a memory-mapped FASTQ file.
+
+    Only byte offsets into the mapping are stored; `raw` slices the record without copying and `name`, `seq` and
+    `qual` decode to str only when asked for. FastqReader reuses one view for every read it yields, so copy
+    what you need before moving to the next read.
+    """
+    __slots__ = ('view', 'start', 'seq_start', 'seq_end', 'qual_start', 'qual_end', 'end')
+
+    def __init__(self, view):
+        self.view = view
+        self.start = self.seq_start = self.seq_end = self.qual_start = self.qual_end = self.end = 0
+
+    @property
+    def raw(self):
+        """The whole record, four lines with their newlines, as a memoryview slice of the mapping."""
+        return self.view[self.start:self.end]
+
+    @property
+    def name(self):
+        return bytes(self.view[self.start + 1:self.seq_start]).decode().strip()
+
+    @property
+    def seq(self):
+        return bytes(self.view[self.seq_start:self.seq_end]).decode()
+
+    @property
+    def qual(self):
+        return bytes(self.view[self.qual_start:self.qual_end]).decode()
+
+    def lines(self):
+        """The record as the four stripped lines filter_fastq2.read_chunk would produce."""
+        return [bytes(line).decode().strip() for line in bytes(self.raw).splitlines()]
+
+    def __len__(self):
+        return self.seq_end - self.seq_start
+
+
+class FastqReader:
+    """Memory-maps a plain FASTQ file and walks its reads between byte offsets `start` and `end`.
+
+    `start` must be at the beginning of a read (see filter_fastq2.find_record_start); a read starting before `end`
+    is read to its end. A trailing incomplete read is dropped, and if the file does not end with a newline the last
+    read's `end` is the end of the file (check `newline_at_eof` before copying it). Used as a context manager.
+    """
+    def __init__(self, path, start=0, end=None):
+        self.size = os.path.getsize(path)
+        self.start = start
+        self.end = self.size if end is None else min(end, self.size)
+        self.mapping = None
+        self.view = memoryview(b'')
+        if self.size:
+            with open(path, 'rb') as inf:
+                self.mapping = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mapping)
+        self.array = np.frombuffer(self.view, dtype=np.uint8)
+        self.newline_at_eof = self.size == 0 or self.mapping[self.size - 1] == 10
+
+    def _next_record(self, pos):
+        """Return offsets (start, seq_start, seq_end, qual_start, qual_end, end) of the read at `pos`, or None."""
+        find = self.mapping.find
+        header_end = find(b'\n', pos)
+        seq_end = find(b'\n', header_end + 1) if header_end != -1 else -1
+        plus_end = find(b'\n', seq_end + 1) if seq_end != -1 else -1
+        if plus_end == -1 or plus_end + 1 >= self.size:
+            return None
+        qual_end = find(b'\n', plus_end + 1)
+        end = qual_end + 1
+        if qual_end == -1:
+            qual_end = end = self.size
+        seq_start = header_end + 1
+        if seq_end > seq_start and self.mapping[seq_end - 1] == 13:  # \r\n line ends
+            seq_end -= 1
+        if qual_end > plus_end + 1 and self.mapping[qual_end - 1] == 13:
+            qual_end -= 1
+        return pos, seq_start, seq_end, plus_end + 1, qual_end, end
+
+    def __iter__(self):
+        record = FastqRecord(self.view)
+        pos = self.start
+        while pos < self.end:
+            offsets = self._next_record(pos)
+            if offsets is None:
+                break
+            (record.start, record.seq_start, record.seq_end,
+             record.qual_start, record.qual_end, record.end) = offsets
+            yield record
+            pos = record.end
+
+    def chunks(self, chunk_size):
+        """Yield the offsets of up to `chunk_size` reads at a time as a (6, n) int64 array.
+
+        Rows are start, seq_start, seq_end, qual_start, qual_end and end of each read. Newlines are found with
+        NumPy over a window of the mapping, so there is no Python-level work per read.
+        """
+        pos = self.start
+        window = chunk_size * 512  # bytes; grown to fit chunk_size reads once their size is known
+        while pos < self.end:
+            stop = min(pos + window, self.size)
+            newlines = np.flatnonzero(self.array[pos:stop] == 10)
+            n = min(len(newlines) // 4, chunk_size)
+            if n == 0:
+                if stop < self.size:
+                    window *= 2
+                    continue
+                offsets = self._next_record(pos)  # the last read, without a final newline
+                if offsets is not None:
+                    yield np.array([offsets], dtype=np.int64).T
+                return
+            line_ends = newlines[:4 * n].reshape(n, 4) + pos
+            ends = line_ends[:, 3] + 1
+            starts = np.concatenate(([pos], ends[:-1]))
+            n = int(np.searchsorted(starts, self.end))
+            line_ends, starts, ends = line_ends[:n], starts[:n], ends[:n]
+            seq_starts = line_ends[:, 0] + 1
+            qual_starts = line_ends[:, 2] + 1
+            seq_ends = line_ends[:, 1] - ((line_ends[:, 1] > seq_starts) & (self.array[line_ends[:, 1] - 1] == 13))
+            qual_ends = line_ends[:, 3] - ((line_ends[:, 3] > qual_starts) & (self.array[line_ends[:, 3] - 1] == 13))
+            yield np.array([starts, seq_starts, seq_ends, qual_starts, qual_ends, ends], dtype=np.int64)
+            if n < len(line_ends) or not n:
+                return
+            window = max(window, int((ends[-1] - pos) / n * chunk_size * 1.25))  # room for chunk_size reads
+            pos = int(ends[-1])
+
+    def close(self):
+        """Unmap the file. Slices still held elsewhere (e.g. records buffered in a writer that outlives the reader)
+        keep the mapping alive until they are released."""
+        self.array = None
+        try:
+            self.view.release()
+            if self.mapping is not None:
+                self.mapping.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
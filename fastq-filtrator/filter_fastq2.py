@@ -1,5 +1,22 @@
 import sys
 import os
+import json
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from itertools import islice
+
+import numpy as np
+
+from checkpoint import CHECKPOINT_INTERVAL, RESUMABLE_COMPRESSIONS, Checkpointer, checkpoint_path, load_checkpoint, \
+    truncate_outputs
+from compression import BGZF_EOF, COMPRESSIONS, EXTENSIONS, detect_format, open_input, open_output, open_stream
+from fastq_reader import FastqReader
+from metrics_cache import METRICS_CHUNK_SIZE, get_metrics
+from pipeline import Chunk, Pipeline, batch_valid, quality_metrics, range_metrics, trim_lengths  # noqa: F401
+from profiling import NULL_PROFILER, PROGRESS_INTERVAL, Profiler, format_report
 
 
 def help_and_exit():
@@ -11,9 +28,11 @@ Contacts: Andrey Sobolev (github.com/chorzow)
 
 Usage: python3 filter_fastq2.py [OPTIONS] FASTQ_PATH
 
-    Filter a .fastq file.
+    Filter a .fastq file, or the R1 and R2 files of paired-end reads in lockstep (see --paired).
 
-    FASTQ_PATH: Path to a FASTQ file.
+    FASTQ_PATH: Path to a FASTQ file. gzip, bgzip and zstd compressed files (.fastq.gz, .fastq.zst) are read as is.
+                `-` reads from stdin; passed reads then go to stdout unless --output_base_name is given.
+                With --batch, a directory of FASTQ files or a manifest listing them.
 
 Options:
     --min_length <int>  Minimal length of the read to pass filtration. Must be a positive integer.
@@ -22,20 +41,100 @@ Options:
                         One value is treated as a lower threshold; two values are treated as a range of GC content.
                         E.g., --gc_bounds 55 leaves only reads with GC >=55%;
                               --gc_bounds 55 60 leaves only reads with 55 =< GC >= 60
-    --output_base_name <str>  Base name to use for output file(s).
+    --output_base_name <str>  Base name to use for output file(s). `-` writes passed reads to stdout.
+    --failed_output <str>     Write filtered reads to this path instead (e.g. a named FIFO or /dev/fd/3).
+                              Implies --keep_filtered; required for it when passed reads go to stdout.
+    --threads <int>     Number of worker processes to filter with. Output is identical to a single-process run.
+                        Compressed input is always filtered in one process.
+    --compress <str>    Compress output file(s) with gzip, bgzip or zstd (needs the zstandard package).
+    --min_mean_quality <float>  Minimal mean Phred quality of the read.
+    --min_base_quality <int>    Minimal Phred quality of every base of the read.
+    --trim_quality <int> <int>  Trim the 3' end of reads before filtering: a window of bases (4 by default, or the
+                        second value) slides from the 3' end until its mean Phred quality reaches the first value.
+                        E.g., --trim_quality 20 cuts reads after the 3'-most 4-base window with mean quality >= 20.
+    --phred64           Quality lines are Phred+64 encoded (Phred+33 by default).
+    --adapters <str>    FASTA file (or a file with a sequence per line) of adapter and contaminant sequences of A, C, G
+                        and T. Reads that contain any of them or their reverse complements fail, and the reads found
+                        per sequence are listed at the end. The sequences are compiled once into an automaton that is
+                        cached in $XDG_CACHE_HOME/fastq-filtrator (~/.cache/fastq-filtrator).
+    --trim_adapters     Cut reads before the first adapter found instead of failing them (3' adapter trimming; done
+                        before --trim_quality and the filters). Needs --adapters.
+    --profile           Print a progress line to stderr every few seconds and a table of wall/CPU time per stage
+                        (read, parse, trim, each filter, write), throughput and peak RSS at the end.
+    --stats-json <str>  Write the same run statistics and the filtering counts to this JSON file.
+    --paired <str>      Path to the R2 file of paired-end reads; FASTQ_PATH is then the R1 file. Both mates are
+                        filtered and pairs are kept or dropped together: pairs that pass go to <base>__R1_passed.fastq
+                        and <base>__R2_passed.fastq, mates that pass alone to <base>__R1_orphan.fastq and
+                        <base>__R2_orphan.fastq, and with --keep_filtered failed mates to <base>__R1_failed.fastq and
+                        <base>__R2_failed.fastq. Runs in one process; not with stdin/stdout or --failed_output.
+    --dedup             Drop reads whose sequence was seen earlier in the input among reads that passed the other
+                        filters; the first read of each group is kept. Duplicates count as failed. Runs in one
+                        process; not with --paired or --resume.
+    --dedup_length <int>  Compare only the first <int> bases, so reads that differ only further on are duplicates
+                        too. Implies --dedup.
+    --dedup_quality <int> Compare the first <int> quality characters as well. Implies --dedup.
+    --dedup_bloom <float> Keep the seen reads in a Bloom filter of this many MB instead of an exact table (16-32
+                        bytes per distinct read), so memory stays fixed on huge inputs. About 1 MB per 800,000
+                        distinct reads keeps the share of unique reads taken for duplicates below 1%. Implies --dedup.
+    --resume            Continue an interrupted run with the same options: outputs are cut back to the last
+                        checkpoint in <base>.checkpoint.json and filtering goes on from the input position saved there.
+                        Single-process runs of an input file into plain or bgzip output files save a checkpoint every
+                        minute; it is removed when the run finishes.
+    --batch             Filter many files in one run: FASTQ_PATH is a directory, whose .fastq/.fq files are all
+                        filtered, or a manifest with a FASTQ path per line, optionally followed by a tab and its output
+                        base name. Outputs are named after the input files, in the directory given by
+                        --output_base_name (the current one by default). All files share one pool of --threads
+                        worker processes, largest files first, and a table of the counts per file is printed at the
+                        end. Not with stdin/stdout, --failed_output, --paired or --resume.
+    --metrics_cache     Filter by the length, GC content and quality of each read kept in <FASTQ_PATH>.metrics/, a
+                        directory of NumPy columns (about 25 bytes per read) that is written on the first run and
+                        remade when the input's size or modification time changes. Reruns with other --min_length,
+                        --gc_bounds, --min_mean_quality or --min_base_quality values then only copy the byte ranges of
+                        the selected reads, without parsing the FASTQ file. Used for plain input files (others are
+                        filtered as usual) in one process per file; not with stdin, --trim_quality, --adapters, --dedup,
+                        --paired or --resume.
     --help          Show this message and exit.
 """
         )
     sys.exit(1)
 
 
-supported_args = ['--min_length', '--keep_filtered', '--gc_bounds', '--output_base_name']
+FLUSH_SIZE = 1 << 20  # bytes buffered per output file before writing to disk
+CHUNK_SIZE = 1 << 14  # reads filtered together by the batch engine
+
+supported_args = ['--min_length', '--keep_filtered', '--gc_bounds', '--output_base_name', '--threads', '--compress',
+                  '--failed_output', '--min_mean_quality', '--min_base_quality', '--trim_quality', '--phred64',
+                  '--profile', '--stats-json', '--paired', '--resume', '--dedup', '--dedup_length', '--dedup_quality',
+                  '--dedup_bloom', '--batch', '--adapters', '--trim_adapters',
+                  '--metrics_cache']
+
+fastq_extensions = ['.fastq', '.fq']
+compressed_extensions = ['.gz', '.bgz', '.zst']
 
 parsed_args = {
         '--min_length': 0,
         '--keep_filtered': False,
         '--gc_bounds': [],
         '--output_base_name': '',
+        '--threads': 1,
+        '--compress': None,
+        '--failed_output': None,
+        '--min_mean_quality': 0.0,
+        '--min_base_quality': 0,
+        '--trim_quality': [],
+        '--phred64': False,
+        '--profile': False,
+        '--stats-json': None,
+        '--paired': None,
+        '--resume': False,
+        '--dedup': False,
+        '--dedup_length': None,
+        '--dedup_quality': 0,
+        '--dedup_bloom': None,
+        '--batch': False,
+        '--adapters': None,
+        '--trim_adapters': False,
+        '--metrics_cache': False,
         'fastq_path': '.'
     }
 
@@ -91,13 +190,31 @@ def parse_gc_bounds(args_lst):
     return gc_bounds
 
 
+def strip_fastq_extension(file_name):
+    """Return the file name without its .fastq/.fq extension and compression suffix, or None if it has none."""
+    for extension in compressed_extensions:
+        if file_name.endswith(extension):
+            file_name = file_name[:-len(extension)]
+            break
+    for extension in fastq_extensions:
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return None
+
+
 def parse_file_name(args_lst):
     path = args_lst[-1]
     file_name = path.split('/')[-1]
+    if path == '-':
+        return file_name, path
+    if '--batch' in args_lst:
+        if not os.path.exists(path):
+            raise ValueError(f'No such directory or manifest: {path}. Type --help for usage.')
+        return file_name, path
     if not os.path.exists(path):
         raise ValueError(f'No such file: {path}.\n'
                          f'Please specify a valid path to a .fastq or .fq file. Type --help for usage.')
-    if not file_name.endswith('.fastq') or file_name.endswith('.fq'):
+    if strip_fastq_extension(file_name) is None:
         raise ValueError(f'Wrong format: {path} is not a .fastq or .fq file. Type --help for usage.')
     return file_name, path
 
@@ -112,12 +229,195 @@ def parse_output_base_name(args_lst):
         except (ValueError, IndexError):
             raise ValueError('Please specify a valid output base name. Type --help for usage.')
 
+    elif '--batch' in args_lst:
+        output_name = ''
     else:
         file_name, path = parse_file_name(args_lst)
-        output_name, _ = file_name.split('.fastq')
+        output_name = '-' if path == '-' else strip_fastq_extension(file_name)
     return output_name
 
 
+def parse_threads(args_lst):
+    threads = 1
+    if '--threads' in args_lst:
+        idx = args_lst.index('--threads')
+        try:
+            threads = int(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid number of threads. Type --help for usage.')
+        if threads < 1:
+            raise ValueError('--threads must be a positive integer. Type --help for usage.')
+    return threads
+
+
+def parse_compress(args_lst):
+    compression = None
+    if '--compress' in args_lst:
+        idx = args_lst.index('--compress')
+        if idx == len(args_lst) - 1 or args_lst[idx + 1] not in COMPRESSIONS:
+            raise ValueError(f'--compress takes one of: {", ".join(COMPRESSIONS)}. Type --help for usage.')
+        compression = args_lst[idx + 1]
+    return compression
+
+
+def parse_failed_output(args_lst):
+    failed_output = None
+    if '--failed_output' in args_lst:
+        idx = args_lst.index('--failed_output')
+        if idx + 1 >= len(args_lst) - 1 or args_lst[idx + 1] in supported_args:
+            raise ValueError('Please specify a valid path for --failed_output. Type --help for usage.')
+        failed_output = args_lst[idx + 1]
+    return failed_output
+
+
+def parse_min_mean_quality(args_lst):
+    min_mean = 0.0
+    if '--min_mean_quality' in args_lst:
+        idx = args_lst.index('--min_mean_quality')
+        try:
+            min_mean = float(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid value for --min_mean_quality. Type --help for usage.')
+        if min_mean < 0:
+            raise ValueError('--min_mean_quality must be non-negative. Type --help for usage.')
+    return min_mean
+
+
+def parse_min_base_quality(args_lst):
+    min_base = 0
+    if '--min_base_quality' in args_lst:
+        idx = args_lst.index('--min_base_quality')
+        try:
+            min_base = int(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid value for --min_base_quality. Type --help for usage.')
+        if min_base < 0:
+            raise ValueError('--min_base_quality must be a non-negative integer. Type --help for usage.')
+    return min_base
+
+
+def parse_trim_quality(args_lst):
+    trim = []
+    if '--trim_quality' in args_lst:
+        idx = args_lst.index('--trim_quality')
+        try:
+            trim = [int(args_lst[idx + 1])]
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid value for --trim_quality. Type --help for usage.')
+        if idx + 2 < len(args_lst) - 1 and args_lst[idx + 2].isdigit():
+            trim.append(int(args_lst[idx + 2]))
+        else:
+            trim.append(4)
+        if trim[0] < 0 or trim[1] < 1:
+            raise ValueError('--trim_quality takes a non-negative quality and a positive window size. '
+                             'Type --help for usage.')
+    return trim
+
+
+def parse_phred64(args_lst):
+    return '--phred64' in args_lst
+
+
+def parse_profile(args_lst):
+    return '--profile' in args_lst
+
+
+def parse_stats_json(args_lst):
+    stats_json = None
+    if '--stats-json' in args_lst:
+        idx = args_lst.index('--stats-json')
+        try:
+            stats_json = args_lst[idx + 1]
+        except IndexError:
+            raise ValueError('Please specify a path for --stats-json. Type --help for usage.')
+        if stats_json.startswith('--'):
+            raise ValueError('Please specify a path for --stats-json. Type --help for usage.')
+    return stats_json
+
+
+def parse_adapters(args_lst):
+    adapters = None
+    if '--adapters' in args_lst:
+        idx = args_lst.index('--adapters')
+        if idx + 1 >= len(args_lst) - 1 or args_lst[idx + 1] in supported_args:
+            raise ValueError('Please specify the file of adapter sequences for --adapters. Type --help for usage.')
+        adapters = args_lst[idx + 1]
+        if not os.path.isfile(adapters):
+            raise ValueError(f'No such file: {adapters}. Type --help for usage.')
+    return adapters
+
+
+def parse_trim_adapters(args_lst):
+    return '--trim_adapters' in args_lst
+
+
+def parse_metrics_cache(args_lst):
+    return '--metrics_cache' in args_lst
+
+
+def parse_paired(args_lst):
+    r2_path = None
+    if '--paired' in args_lst:
+        idx = args_lst.index('--paired')
+        if idx + 1 >= len(args_lst) - 1 or args_lst[idx + 1] in supported_args:
+            raise ValueError('Please specify the path to the R2 file for --paired. Type --help for usage.')
+        _, r2_path = parse_file_name([args_lst[idx + 1]])
+        if r2_path == '-' or args_lst[-1] == '-':
+            raise ValueError('--paired cannot read from stdin. Type --help for usage.')
+    return r2_path
+
+
+def parse_resume(args_lst):
+    return '--resume' in args_lst
+
+
+def parse_dedup_length(args_lst):
+    length = None
+    if '--dedup_length' in args_lst:
+        idx = args_lst.index('--dedup_length')
+        try:
+            length = int(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid value for --dedup_length. Type --help for usage.')
+        if length < 1:
+            raise ValueError('--dedup_length must be a positive integer. Type --help for usage.')
+    return length
+
+
+def parse_dedup_quality(args_lst):
+    quality = 0
+    if '--dedup_quality' in args_lst:
+        idx = args_lst.index('--dedup_quality')
+        try:
+            quality = int(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid value for --dedup_quality. Type --help for usage.')
+        if quality < 0:
+            raise ValueError('--dedup_quality must be a non-negative integer. Type --help for usage.')
+    return quality
+
+
+def parse_dedup_bloom(args_lst):
+    megabytes = None
+    if '--dedup_bloom' in args_lst:
+        idx = args_lst.index('--dedup_bloom')
+        try:
+            megabytes = float(args_lst[idx + 1])
+        except (ValueError, IndexError):
+            raise ValueError('Please specify a valid size in MB for --dedup_bloom. Type --help for usage.')
+        if megabytes <= 0:
+            raise ValueError('--dedup_bloom must be positive. Type --help for usage.')
+    return megabytes
+
+
+def parse_dedup(args_lst):
+    return any(option in args_lst for option in ['--dedup', '--dedup_length', '--dedup_quality', '--dedup_bloom'])
+
+
+def parse_batch(args_lst):
+    return '--batch' in args_lst
+
+
 def parse_args(args_lst):
     if '--help' in args_lst:
         help_and_exit()
@@ -129,6 +429,52 @@ def parse_args(args_lst):
     parsed_args['--gc_bounds'] = parse_gc_bounds(args_lst)
     _, parsed_args['fastq_path'] = parse_file_name(args_lst)
     parsed_args['--output_base_name'] = parse_output_base_name(args_lst)
+    parsed_args['--threads'] = parse_threads(args_lst)
+    parsed_args['--compress'] = parse_compress(args_lst)
+    parsed_args['--failed_output'] = parse_failed_output(args_lst)
+    parsed_args['--min_mean_quality'] = parse_min_mean_quality(args_lst)
+    parsed_args['--min_base_quality'] = parse_min_base_quality(args_lst)
+    parsed_args['--trim_quality'] = parse_trim_quality(args_lst)
+    parsed_args['--phred64'] = parse_phred64(args_lst)
+    parsed_args['--profile'] = parse_profile(args_lst)
+    parsed_args['--stats-json'] = parse_stats_json(args_lst)
+    parsed_args['--paired'] = parse_paired(args_lst)
+    parsed_args['--resume'] = parse_resume(args_lst)
+    parsed_args['--dedup'] = parse_dedup(args_lst)
+    parsed_args['--dedup_length'] = parse_dedup_length(args_lst)
+    parsed_args['--dedup_quality'] = parse_dedup_quality(args_lst)
+    parsed_args['--dedup_bloom'] = parse_dedup_bloom(args_lst)
+    parsed_args['--batch'] = parse_batch(args_lst)
+    parsed_args['--adapters'] = parse_adapters(args_lst)
+    parsed_args['--trim_adapters'] = parse_trim_adapters(args_lst)
+    parsed_args['--metrics_cache'] = parse_metrics_cache(args_lst)
+    if parsed_args['--trim_adapters'] and parsed_args['--adapters'] is None:
+        raise ValueError('--trim_adapters needs --adapters. Type --help for usage.')
+    if parsed_args['--metrics_cache'] and (parsed_args['fastq_path'] == '-' or parsed_args['--trim_quality'] or
+                                           parsed_args['--adapters'] is not None or parsed_args['--dedup'] or
+                                           parsed_args['--paired'] is not None or parsed_args['--resume']):
+        raise ValueError('--metrics_cache filters input files by length, GC content and quality only: not with stdin, '
+                         '--trim_quality, --adapters, --dedup, --paired or --resume. Type --help for usage.')
+    if parsed_args['--batch'] and ('-' in [parsed_args['fastq_path'], parsed_args['--output_base_name']] or
+                                   parsed_args['--failed_output'] is not None or
+                                   parsed_args['--paired'] is not None or parsed_args['--resume']):
+        raise ValueError('--batch reads and writes files only, not with stdin/stdout, --failed_output, --paired or '
+                         '--resume. Type --help for usage.')
+    if parsed_args['--dedup'] and (parsed_args['--paired'] is not None or parsed_args['--resume']):
+        raise ValueError('--dedup cannot be used with --paired or --resume. Type --help for usage.')
+    if parsed_args['--resume'] and (parsed_args['fastq_path'] == '-' or parsed_args['--output_base_name'] == '-' or
+                                    parsed_args['--threads'] > 1 or parsed_args['--paired'] is not None or
+                                    parsed_args['--compress'] not in RESUMABLE_COMPRESSIONS):
+        raise ValueError('--resume continues single-process runs of an input file into plain or bgzip output files. '
+                         'Type --help for usage.')
+    if parsed_args['--paired'] is not None and \
+            (parsed_args['--output_base_name'] == '-' or parsed_args['--failed_output'] is not None):
+        raise ValueError('--paired writes to files only, not with --output_base_name - or --failed_output. '
+                         'Type --help for usage.')
+    if parsed_args['--failed_output'] is not None:
+        parsed_args['--keep_filtered'] = True
+    elif parsed_args['--keep_filtered'] and parsed_args['--output_base_name'] == '-':
+        raise ValueError('--keep_filtered with passed reads on stdout needs --failed_output. Type --help for usage.')
 
     return parsed_args
 
@@ -155,13 +501,27 @@ def valid_gc(read, gc_bounds):
     return True
 
 
-def file_exists(output_base_name):
-    suffices = ['passed', 'failed']
+def output_path(output_base_name, suffix, compression=None, failed_output=None):
+    if suffix == 'failed' and failed_output is not None:
+        return failed_output
+    if output_base_name == '-':
+        return '-'
+    return f'{output_base_name}__{suffix}.fastq{EXTENSIONS[compression]}'
+
+
+def file_exists(output_base_name, compression=None, failed_output=None, suffices=('passed', 'failed')):
+    """Ask before overwriting existing output files. FIFOs, devices and stdout are never asked about.
+
+    Without a terminal to ask on (e.g. inside a pipeline) existing files are an error instead of a prompt.
+    """
     for suffix in suffices:
-        if os.path.exists(f'{output_base_name}__{suffix}.fastq'):
-            ans = input(f'File {output_base_name}__{suffix}.fastq already exists. Overwrite? [y/n]')
+        path = output_path(output_base_name, suffix, compression, failed_output)
+        if path != '-' and os.path.isfile(path):
+            if not sys.stdin.isatty():
+                raise ValueError(f'File {path} already exists. Remove it or choose another --output_base_name.')
+            ans = input(f'File {path} already exists. Overwrite? [y/n]')
             if ans == 'y':
-                os.remove(f'{output_base_name}__{suffix}.fastq')
+                os.remove(path)
             elif ans == 'n':
                 print('Aborted.')
                 sys.exit(1)
@@ -169,49 +529,707 @@ def file_exists(output_base_name):
                 raise ValueError('Aborted. Please try again and type y or n.')
 
 
-def write_to_file(parsed_args):
-    minlen = parsed_args['--min_length']
-    keep_filtered = parsed_args['--keep_filtered']
-    gc_bounds = parsed_args['--gc_bounds']
+def read_chunk(inf, chunk_size=CHUNK_SIZE):
+    """Read up to `chunk_size` complete reads from an open FASTQ file. A trailing incomplete read is dropped."""
+    lines = list(islice(inf, 4 * chunk_size))
+    return [[lines[i].strip(), lines[i + 1].strip(), lines[i + 2].strip(), lines[i + 3].rstrip()]
+            for i in range(0, len(lines) - 3, 4)]
+
+
+def seqs_to_array(seqs):
+    """Pack sequences into one uint8 array of bytes and an array of offsets where each sequence starts and ends."""
+    lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)
+    return data, offsets
+
+
+def reads_to_chunk(reads, quality=True):
+    """A pipeline Chunk of reads given as lists of four lines. Without `quality` the quality lines are not packed."""
+    seq_data, seq_offsets = seqs_to_array([read[1] for read in reads])
+    qual_data, qual_offsets = seqs_to_array([read[3] for read in reads]) if quality else (seq_data, seq_offsets)
+    return Chunk(seq_data, seq_offsets[:-1], seq_offsets[1:], qual_data, qual_offsets[:-1], qual_offsets[1:])
+
+
+def trimmed_read(read, length):
+    """The read cut to its first `length` bases."""
+    if length < len(read[1]):
+        return [read[0], read[1][:length], read[2], read[3][:length]]
+    return read
+
+
+def mate_name(header):
+    """The read name of a FASTQ header line without the comment and a /1 or /2 mate suffix."""
+    name = header.split(maxsplit=1)[0] if header.strip() else header
+    return name[:-2] if name[-2:] in ('/1', '/2') else name
+
+
+def batch_metrics(data, offsets):
+    """Return lengths and GC percentages of all sequences packed by seqs_to_array in one pass."""
+    return range_metrics(data, offsets[:-1], offsets[1:])
+
+
+class FastqWriter:
+    """Keeps an output file open for the whole run and writes reads to it in large chunks.
+
+    Reads are collected in memory and flushed once `flush_size` bytes have accumulated. `write` takes a read as
+    four lines, `write_raw` takes a record that is already bytes, e.g. a slice of a mapped input file.
+    Used as a context manager, so the buffered reads are written out and the file is closed on error too.
+    `compression`, `eof` and `append` are passed to compression.open_output.
+    """
+    def __init__(self, path, flush_size=FLUSH_SIZE, compression=None, eof=True, append=False):
+        self.path = path
+        self.flush_size = flush_size
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.handle = open_output(path, compression, eof, append)
+
+    def write(self, read):
+        self.write_raw(('\n'.join(read) + '\n').encode())
+
+    def write_raw(self, record):
+        self.buffer.append(record)
+        self.buffered += len(record)
+        if self.buffered >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.handle.write(b''.join(self.buffer))
+            self.written += self.buffered
+            self.buffer = []
+            self.buffered = 0
+
+    def sync(self):
+        """Write everything buffered through to the disk and return the size of the output file."""
+        self.flush()
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        return os.fstat(self.handle.fileno()).st_size
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def filter_reads(lines, ouf_passed, ouf_failed, pipeline, chunk_size=CHUNK_SIZE, profiler=NULL_PROFILER,
+                 checkpointer=None):
+    """Filter reads from an iterable of FASTQ lines through a Pipeline into open writers. `ouf_failed` is None to
+    drop failed reads. Trimmed reads are written trimmed, whether they pass or not. Stages are timed by `profiler`,
+    and a checkpoint.Checkpointer is given the counts after every chunk.
+    """
+    passed = 0
+    failed = 0
+    read_stage, parse_stage, write_stage = profiler.stage('read'), profiler.stage('parse'), profiler.stage('write')
+    while True:
+        with read_stage:
+            reads = read_chunk(lines, chunk_size)
+        if not reads:
+            break
+        with parse_stage:
+            chunk = reads_to_chunk(reads, pipeline.needs_quality())
+        mask, lengths = pipeline.evaluate(chunk)
+        with write_stage:
+            for read, ok, length in zip(reads, mask.tolist(), lengths.tolist()):
+                read = trimmed_read(read, length)
+                if ok:
+                    ouf_passed.write(read)
+                elif ouf_failed is not None:
+                    ouf_failed.write(read)
+        profiler.advance(len(reads))
+        n_passed = int(np.count_nonzero(mask))
+        passed += n_passed
+        failed += len(reads) - n_passed
+        if checkpointer is not None:
+            checkpointer.advance(passed, failed)
+    return passed, failed
+
+
+def filter_mapped(reader, ouf_passed, ouf_failed, pipeline, chunk_size=CHUNK_SIZE, profiler=NULL_PROFILER,
+                  checkpointer=None):
+    """Filter the reads of a FastqReader through a Pipeline into open writers, copying passed/failed records straight
+    from the mapping.
+
+    A trimmed read is written as slices around the cut-off bases of its sequence and quality lines. Stages are timed
+    by `profiler`; 'read' is finding the reads of a chunk in the mapping, which also pages the file in. A
+    checkpoint.Checkpointer is given the counts and the input offset reached after every chunk.
+    """
+    passed = 0
+    failed = 0
+    view = reader.view
+    chunks = reader.chunks(chunk_size)
+    read_stage, parse_stage, write_stage = profiler.stage('read'), profiler.stage('parse'), profiler.stage('write')
+    while True:
+        with read_stage:
+            offsets = next(chunks, None)
+        if offsets is None:
+            break
+        with parse_stage:
+            starts, seq_starts, seq_ends, qual_starts, qual_ends, ends = offsets
+            chunk = Chunk(reader.array, seq_starts, seq_ends, reader.array, qual_starts, qual_ends)
+        mask, lengths = pipeline.evaluate(chunk)
+        with write_stage:
+            trimmed = lengths < seq_ends - seq_starts
+            for row, ok, cut, length in zip(offsets.T.tolist(), mask.tolist(), trimmed.tolist(), lengths.tolist()):
+                ouf = ouf_passed if ok else ouf_failed
+                if ouf is None:
+                    continue
+                start, seq_start, seq_end, qual_start, qual_end, end = row
+                if cut:
+                    ouf.write_raw(view[start:seq_start + length])
+                    ouf.write_raw(view[seq_end:qual_start + length])
+                    ouf.write_raw(view[qual_end:end])
+                else:
+                    ouf.write_raw(view[start:end])
+                if end == reader.size and not reader.newline_at_eof:
+                    ouf.write_raw(b'\n')
+        profiler.advance(len(mask), int(ends[-1]) - reader.start if len(ends) else None)
+        n_passed = int(np.count_nonzero(mask))
+        passed += n_passed
+        failed += len(mask) - n_passed
+        if checkpointer is not None and len(ends):
+            checkpointer.advance(passed, failed, int(ends[-1]))
+    return passed, failed
+
+
+def filter_metrics(reader, metrics, ouf_passed, ouf_failed, pipeline, chunk_size=METRICS_CHUNK_SIZE,
+                   profiler=NULL_PROFILER):
+    """Filter the reads of a FastqReader by their metrics_cache.ReadMetrics through a Pipeline of filters that support
+    them, into open writers. Runs of reads that go to the same writer are copied from the mapping as one byte range.
+    """
+    passed = 0
+    failed = 0
+    view = reader.view
+    write_stage = profiler.stage('write')
+    for start in range(0, len(metrics), chunk_size):
+        chunk = metrics.slice(start, start + chunk_size)
+        mask = pipeline.evaluate_metrics(chunk)
+        with write_stage:
+            runs = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+            offsets = chunk.offsets[np.concatenate(([0], runs, [len(mask)]))].tolist()
+            oks = mask[np.concatenate(([0], runs))].tolist()
+            for run_start, run_end, ok in zip(offsets, offsets[1:], oks):
+                ouf = ouf_passed if ok else ouf_failed
+                if ouf is None:
+                    continue
+                for piece in range(run_start, run_end, ouf.flush_size):  # a long run is not buffered whole
+                    ouf.write_raw(view[piece:min(piece + ouf.flush_size, run_end)])
+                if run_end == reader.size and not reader.newline_at_eof:
+                    ouf.write_raw(b'\n')
+        profiler.advance(len(mask), offsets[-1])
+        n_passed = int(np.count_nonzero(mask))
+        passed += n_passed
+        failed += len(mask) - n_passed
+    return passed, failed
+
+
+def filter_pairs(lines1, lines2, writers1, writers2, pipeline, chunk_size=CHUNK_SIZE, profiler=NULL_PROFILER):
+    """Filter paired-end reads from two iterables of FASTQ lines in lockstep through one Pipeline.
+
+    `writers1` and `writers2` are the (passed, orphan, failed) writers of each mate; `failed` is None to drop failed
+    mates. A pair goes to the passed writers if both mates pass, a mate that passes alone to its orphan writer.
+    Mates are matched by position; the names of the first and last pair of each chunk are checked to catch files
+    that are out of sync. Returns the numbers of pairs where both mates, only R1, only R2 and neither passed.
+    """
+    counts = [0, 0, 0, 0]
+    read_stage, parse_stage, write_stage = profiler.stage('read'), profiler.stage('parse'), profiler.stage('write')
+    while True:
+        with read_stage:
+            reads1 = read_chunk(lines1, chunk_size)
+            reads2 = read_chunk(lines2, chunk_size)
+        if len(reads1) != len(reads2):
+            raise ValueError(f'R1 and R2 have different numbers of reads: one ends after '
+                             f'{sum(counts) + min(len(reads1), len(reads2))} reads.')
+        if not reads1:
+            break
+        for i in (0, -1):
+            if mate_name(reads1[i][0]) != mate_name(reads2[i][0]):
+                raise ValueError(f'{reads1[i][0]} and {reads2[i][0]} are not mates: R1 and R2 are out of sync.')
+        with parse_stage:
+            chunk1 = reads_to_chunk(reads1, pipeline.needs_quality())
+            chunk2 = reads_to_chunk(reads2, pipeline.needs_quality())
+        mask1, lengths1 = pipeline.evaluate(chunk1)
+        mask2, lengths2 = pipeline.evaluate(chunk2)
+        with write_stage:
+            for reads, (ouf_passed, ouf_orphan, ouf_failed), mask, mate_mask, lengths in [
+                    (reads1, writers1, mask1, mask2, lengths1), (reads2, writers2, mask2, mask1, lengths2)]:
+                for read, ok, mate_ok, length in zip(reads, mask.tolist(), mate_mask.tolist(), lengths.tolist()):
+                    if ok:
+                        (ouf_passed if mate_ok else ouf_orphan).write(trimmed_read(read, length))
+                    elif ouf_failed is not None:
+                        ouf_failed.write(trimmed_read(read, length))
+        profiler.advance(2 * len(reads1))
+        both = int(np.count_nonzero(mask1 & mask2))
+        only1 = int(np.count_nonzero(mask1)) - both
+        only2 = int(np.count_nonzero(mask2)) - both
+        counts = [counts[0] + both, counts[1] + only1, counts[2] + only2,
+                  counts[3] + len(reads1) - both - only1 - only2]
+    return tuple(counts)
+
+
+def find_record_start(inf, offset):
+    """Return the offset of the first read starting at or after `offset` in a FASTQ file opened in binary mode.
+
+    A read starts at an '@' line followed by a '+' line two lines later, which tells headers from quality lines
+    that happen to start with '@'.
+    """
+    if offset == 0:
+        return 0
+    inf.seek(offset - 1)
+    inf.readline()
+    pos = inf.tell()
+    lines = [inf.readline() for _ in range(3)]
+    while lines[0]:
+        if lines[0].startswith(b'@') and lines[2].startswith(b'+'):
+            return pos
+        pos += len(lines[0])
+        lines = lines[1:] + [inf.readline()]
+    return pos
+
+
+def split_ranges(fastq_path, n_ranges):
+    """Split a FASTQ file into at most `n_ranges` (start, end) byte ranges aligned to read boundaries."""
+    size = os.path.getsize(fastq_path)
+    with open(fastq_path, 'rb') as inf:
+        bounds = sorted({find_record_start(inf, size * i // n_ranges) for i in range(n_ranges)} | {size})
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def filter_range(fastq_path, start, end, part_base, pipeline, keep_filtered, flush_size, chunk_size,
+                 compression=None, profile=None):
+    """Filter one byte range of a FASTQ file into `<part_base>__passed.fastq` (and `__failed.fastq`).
+
+    `profile` is None, or keyword arguments of a Profiler to time the run with. Returns the passed and failed counts,
+    the Profiler (None if not profiling) and the pipeline, for its counts.
+    """
+    profiler = Profiler(total_bytes=end - start, **profile) if profile is not None else None
+    with ExitStack() as stack:
+        reader = stack.enter_context(FastqReader(fastq_path, start, end))
+        writers = [stack.enter_context(
+            FastqWriter(output_path(part_base, 'passed', compression), flush_size, compression, eof=False))]
+        if keep_filtered:
+            writers.append(stack.enter_context(
+                FastqWriter(output_path(part_base, 'failed', compression), flush_size, compression, eof=False)))
+        passed, failed = filter_mapped(reader, writers[0], writers[1] if keep_filtered else None, pipeline, chunk_size,
+                                       profiler or NULL_PROFILER)
+    if profiler is not None:
+        profiler.add_pipeline(pipeline)
+        profiler.bytes_out += sum(writer.written for writer in writers)
+    return passed, failed, profiler, pipeline
+
+
+def concatenate(part_paths, path, compression=None):
+    """Join part files into `path` in the given order and remove them.
+
+    Concatenated gzip members and zstd frames are valid files as they are; bgzip parts are written without the EOF
+    block, so it is added once at the end.
+    """
+    with open_stream(path, 'wb') as ouf:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as inf:
+                shutil.copyfileobj(inf, ouf, FLUSH_SIZE)
+            os.remove(part_path)
+        if compression == 'bgzip':
+            ouf.write(BGZF_EOF)
+
+
+def write_to_file_parallel(parsed_args, flush_size=FLUSH_SIZE, chunk_size=CHUNK_SIZE, profiler=None, pipeline=None):
+    """Filter read-aligned byte ranges of the input in a process pool and stitch the outputs in input order.
+
+    With a `profiler`, every worker profiles its range (printing its own progress lines) and the profiles are merged.
+    The counts of the workers' pipelines are added to `pipeline`, if given. Parts of outputs to stdout are written to
+    a temporary directory, removed at the end even if filtering fails.
+    """
+    with ExitStack() as stack:
+        part_base_name = parsed_args['--output_base_name']
+        if part_base_name == '-':
+            part_base_name = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), 'stdout')
+        return filter_parts(parsed_args, part_base_name, flush_size, chunk_size, profiler, pipeline)
+
+
+def filter_parts(parsed_args, part_base_name, flush_size=FLUSH_SIZE, chunk_size=CHUNK_SIZE, profiler=None,
+                 pipeline=None):
+    """The body of write_to_file_parallel, with the parts of the outputs written to <part_base_name>.part<i>."""
     output_base_name = parsed_args['--output_base_name']
     fastq_path = parsed_args['fastq_path']
-    output_passed = output_base_name + '__passed.fastq'
-    file_exists(output_base_name)
-
-    with open(fastq_path, 'r') as inf:
-        read = []
-        passed = 0
-        failed = 0
-
-        for line in inf:
-            if len(read) != 3:
-                read.append(line.strip())
-                continue
-            else:
-                read.append(line.rstrip())
-                with open(output_passed, 'a') as ouf_passed:
-                    if valid_gc(read[1], gc_bounds) and valid_len(read[1], minlen):
-                        ouf_passed.write('\n'.join(read) + '\n')
-                        passed += 1
-                    else:
-                        if keep_filtered:
-                            output_failed = output_base_name + '__failed.fastq'
-                            with open(output_failed, 'a') as ouf_failed:
-                                ouf_failed.write('\n'.join(read) + '\n')
-                        failed += 1
-
-            read = []
-    return passed, failed
+    compression = parsed_args.get('--compress')
+    failed_output = parsed_args.get('--failed_output')
+    keep_filtered = parsed_args['--keep_filtered'] or failed_output is not None
+    file_exists(output_base_name, compression, failed_output)
 
+    ranges = split_ranges(fastq_path, parsed_args['--threads'])
+    part_bases = [f'{part_base_name}.part{i}' for i in range(len(ranges))]
+    profiles = [None] * len(ranges)
+    if profiler is not None:
+        profiles = [{'label': f'{profiler.label} part {i}', 'progress_interval': profiler.progress_interval}
+                    for i in range(len(ranges))]
+    with ProcessPoolExecutor(parsed_args['--threads']) as pool:
+        futures = [pool.submit(filter_range, fastq_path, start, end, part_base, Pipeline.from_args(parsed_args),
+                               keep_filtered, flush_size, chunk_size, compression, profile)
+                   for (start, end), part_base, profile in zip(ranges, part_bases, profiles)]
+        counts = [future.result() for future in futures]
 
-if __name__ == '__main__':
-    parsed_args = parse_args(sys.argv[1:])
-    passed, failed = write_to_file(parsed_args)
-    print('Filtering finished.')
-    print(f'Total reads in {parsed_args["fastq_path"]}: {passed + failed}, of them:\n'
-          f'{passed} ({round(passed * 100 / (passed + failed), 2)}%) passed.\n'
-          f'{failed} ({round(failed * 100 / (passed + failed), 2)}%) failed.')
+    with (profiler or NULL_PROFILER).stage('concatenate'):
+        suffices = ['passed', 'failed'] if keep_filtered else ['passed']
+        for suffix in suffices:
+            concatenate([output_path(part_base, suffix, compression) for part_base in part_bases],
+                        output_path(output_base_name, suffix, compression, failed_output), compression)
+    for count in counts:
+        if profiler is not None:
+            profiler.merge(count[2])
+        if pipeline is not None:
+            pipeline.merge(count[3])
+    return sum(count[0] for count in counts), sum(count[1] for count in counts)
+
+
+def write_to_file(parsed_args, flush_size=FLUSH_SIZE, chunk_size=CHUNK_SIZE, profiler=None,
+                  checkpoint_interval=CHECKPOINT_INTERVAL, pipeline=None):
+    """Filter the input of parsed_args into the output files. With a profiling.Profiler the run is profiled.
+
+    Single-process runs of an input file into plain or bgzip files save a checkpoint every `checkpoint_interval`
+    seconds (None for none), which --resume continues from. `pipeline` is the Pipeline to filter a single-process run
+    with, for its counts afterwards (by default one is built from parsed_args). Returns the passed and failed counts
+    of the whole input.
+    """
+    fastq_path = parsed_args['fastq_path']
+    mappable = fastq_path != '-' and os.path.isfile(fastq_path) and detect_format(fastq_path) is None
+    if parsed_args.get('--metrics_cache') and mappable:
+        return write_to_file_metrics(parsed_args, flush_size, profiler=profiler, pipeline=pipeline)
+    dedup = parsed_args.get('--dedup', False)
+    if parsed_args.get('--threads', 1) > 1 and mappable and not dedup:  # one seen-read table for the whole input
+        return write_to_file_parallel(parsed_args, flush_size, chunk_size, profiler, pipeline)
+    output_base_name = parsed_args['--output_base_name']
+    compression = parsed_args.get('--compress')
+    failed_output = parsed_args.get('--failed_output')
+    keep_filtered = parsed_args['--keep_filtered'] or failed_output is not None
+    output_passed = output_path(output_base_name, 'passed', compression)
+    output_failed = output_path(output_base_name, 'failed', compression, failed_output)
+    checkpoint_file = checkpoint_path(output_base_name)
+    checkpointing = checkpoint_interval is not None and not dedup and os.path.isfile(fastq_path) and \
+        output_base_name != '-' and \
+        compression in RESUMABLE_COMPRESSIONS and (failed_output is None or not os.path.exists(failed_output) or
+                                                   os.path.isfile(failed_output))
+    state = None
+    if parsed_args.get('--resume'):
+        state = load_checkpoint(checkpoint_file, fastq_path, parsed_args)
+        truncate_outputs(state)
+    elif checkpointing and os.path.exists(checkpoint_file):
+        raise ValueError(f'{checkpoint_file} is left from an unfinished run into {output_base_name}: add --resume to '
+                         f'continue it, or remove it and the outputs to start over.')
+    else:
+        file_exists(output_base_name, compression, failed_output)
+
+    pipeline = pipeline or Pipeline.from_args(parsed_args)
+    checkpointer = None
+    with ExitStack() as stack:
+        inf = stack.enter_context(FastqReader(fastq_path, state['offset'] if state else 0) if mappable
+                                  else open_input(fastq_path))
+        if state is not None and not mappable:
+            deque(islice(inf, 4 * state['records']), maxlen=0)  # skip the reads done before the checkpoint
+        writers = [stack.enter_context(FastqWriter(output_passed, flush_size, compression, append=state is not None))]
+        if keep_filtered:
+            writers.append(stack.enter_context(
+                FastqWriter(output_failed, flush_size, compression, append=state is not None)))
+        ouf_passed, ouf_failed = writers[0], writers[1] if keep_filtered else None
+        if checkpointing:
+            checkpointer = Checkpointer(checkpoint_file, fastq_path, parsed_args, writers, checkpoint_interval, state)
+        if profiler is not None and mappable:
+            profiler.total_bytes = inf.size
+        filter_func = filter_mapped if mappable else filter_reads
+        counts = filter_func(inf, ouf_passed, ouf_failed, pipeline, chunk_size, profiler or NULL_PROFILER,
+                             checkpointer)
+    if checkpointer is not None:
+        checkpointer.remove()
+    if state is not None:
+        counts = (state['passed'] + counts[0], state['failed'] + counts[1])
+    if profiler is not None:
+        profiler.add_pipeline(pipeline)
+        profiler.bytes_out += ouf_passed.written + (ouf_failed.written if keep_filtered else 0)
+        if not mappable and os.path.isfile(fastq_path):
+            profiler.bytes_in = os.path.getsize(fastq_path)  # compressed bytes for compressed input
+    return counts
+
+
+def write_to_file_metrics(parsed_args, flush_size=FLUSH_SIZE, chunk_size=METRICS_CHUNK_SIZE, profiler=None,
+                          pipeline=None):
+    """Filter the plain input file of parsed_args by its cached read metrics (see metrics_cache), measuring the file
+    first if its sidecar is missing or out of date. Returns the passed and failed counts.
+    """
+    fastq_path = parsed_args['fastq_path']
+    output_base_name = parsed_args['--output_base_name']
+    compression = parsed_args.get('--compress')
+    failed_output = parsed_args.get('--failed_output')
+    keep_filtered = parsed_args['--keep_filtered'] or failed_output is not None
+    pipeline = pipeline or Pipeline.from_args(parsed_args)
+    if not pipeline.supports_metrics():
+        raise ValueError('--metrics_cache filters by length, GC content and quality only.')
+    file_exists(output_base_name, compression, failed_output)
+
+    with (profiler or NULL_PROFILER).stage('read'):
+        metrics = get_metrics(fastq_path)
+    with ExitStack() as stack:
+        reader = stack.enter_context(FastqReader(fastq_path))
+        writers = [stack.enter_context(FastqWriter(output_path(output_base_name, 'passed', compression), flush_size,
+                                                   compression))]
+        if keep_filtered:
+            writers.append(stack.enter_context(
+                FastqWriter(output_path(output_base_name, 'failed', compression, failed_output), flush_size,
+                            compression)))
+        if profiler is not None:
+            profiler.total_bytes = reader.size
+        counts = filter_metrics(reader, metrics, writers[0], writers[1] if keep_filtered else None, pipeline,
+                                chunk_size, profiler or NULL_PROFILER)
+    if profiler is not None:
+        profiler.add_pipeline(pipeline)
+        profiler.bytes_out += sum(writer.written for writer in writers)
+    return counts
+
+
+def write_to_file_paired(parsed_args, flush_size=FLUSH_SIZE, chunk_size=CHUNK_SIZE, profiler=None, pipeline=None):
+    """Filter the R1 (fastq_path) and R2 (--paired) files of parsed_args in lockstep into the paired outputs.
+
+    Returns the numbers of pairs where both mates, only R1, only R2 and neither passed, as filter_pairs. `pipeline` is
+    the Pipeline to filter with, built from parsed_args if None.
+    """
+    paths = [parsed_args['fastq_path'], parsed_args['--paired']]
+    output_base_name = parsed_args['--output_base_name']
+    compression = parsed_args.get('--compress')
+    keep_filtered = parsed_args['--keep_filtered']
+    kinds = ['passed', 'orphan', 'failed'] if keep_filtered else ['passed', 'orphan']
+    file_exists(output_base_name, compression, suffices=[f'{mate}_{kind}' for mate in ['R1', 'R2'] for kind in kinds])
 
+    pipeline = pipeline or Pipeline.from_args(parsed_args)
+    with ExitStack() as stack:
+        inputs = [stack.enter_context(open_input(path)) for path in paths]
+        writers = [[stack.enter_context(FastqWriter(output_path(output_base_name, f'{mate}_{kind}', compression),
+                                                    flush_size, compression)) for kind in kinds]
+                   for mate in ['R1', 'R2']]
+        counts = filter_pairs(inputs[0], inputs[1], (writers[0] + [None])[:3], (writers[1] + [None])[:3], pipeline,
+                              chunk_size, profiler or NULL_PROFILER)
+    if profiler is not None:
+        profiler.add_pipeline(pipeline)
+        profiler.bytes_in = sum(os.path.getsize(path) for path in paths)
+        profiler.bytes_out += sum(writer.written for mate_writers in writers for writer in mate_writers)
+    return counts
 
 
+def batch_inputs(path, output_dir=''):
+    """The (FASTQ path, output base name) pairs of a batch run, in input order.
 
+    `path` is a directory, whose .fastq/.fq files (compressed or not) are all taken, or a manifest: a text file with
+    a FASTQ path per line, optionally followed by a tab and its output base name. Blank lines and lines starting with
+    '#' are skipped. Output base names default to the file name without its extensions, in `output_dir`.
+    """
+    if os.path.isdir(path):
+        entries = [[os.path.join(path, name)] for name in sorted(os.listdir(path))
+                   if strip_fastq_extension(name) is not None and os.path.isfile(os.path.join(path, name))]
+    else:
+        with open(path) as inf:
+            entries = [line.rstrip('\r\n').split('\t') for line in inf if line.strip() and not line.startswith('#')]
+    inputs = []
+    for entry in entries:
+        if len(entry) > 2:
+            raise ValueError(f'Manifest lines are a FASTQ path and an optional output base name, not {entry}.')
+        file_name, fastq_path = parse_file_name(entry[:1])
+        if fastq_path == '-':
+            raise ValueError('A batch cannot read from stdin. Type --help for usage.')
+        base = entry[1] if len(entry) == 2 else os.path.join(output_dir, strip_fastq_extension(file_name))
+        inputs.append((fastq_path, base))
+    if not inputs:
+        raise ValueError(f'No FASTQ files in {path}.')
+    bases = [base for _, base in inputs]
+    repeated = sorted({base for base in bases if bases.count(base) > 1})
+    if repeated:
+        raise ValueError(f'Several inputs would be written to {", ".join(repeated)}; give them output base names in a '
+                         f'manifest.')
+    return inputs
+
+
+def filter_file(parsed_args, flush_size, chunk_size, profile=None):
+    """Filter one input of a batch in a worker process, without checkpoints.
+
+    `profile` is None, or keyword arguments of a Profiler to time the run with. Returns the passed and failed counts,
+    the Profiler (None if not profiling) and the pipeline, for its counts.
+    """
+    profiler = Profiler(**profile) if profile is not None else None
+    pipeline = Pipeline.from_args(parsed_args)
+    passed, failed = write_to_file(parsed_args, flush_size, chunk_size, profiler, checkpoint_interval=None,
+                                   pipeline=pipeline)
+    return passed, failed, profiler, pipeline
+
+
+def write_to_file_batch(parsed_args, flush_size=FLUSH_SIZE, chunk_size=CHUNK_SIZE, profiler=None, pipeline=None):
+    """Filter all inputs of a batch (see batch_inputs) on one pool of --threads worker processes.
+
+    Tasks are queued largest first, so a big file does not start last and keep the run going alone. A plain input
+    bigger than its share of the batch is split into read-aligned ranges like in write_to_file_parallel, and its parts
+    are joined as soon as the last of them is done, while other files are still being filtered. Returns (FASTQ path,
+    output base name, passed, failed, duplicates, adapters) per input: the reads failed as duplicates (None without
+    --dedup) and failed or trimmed for adapters (None without --adapters). The counts of the workers' pipelines are
+    added to `pipeline`, if given.
+    """
+    threads = parsed_args['--threads']
+    compression = parsed_args.get('--compress')
+    keep_filtered = parsed_args['--keep_filtered']
+    suffices = ['passed', 'failed'] if keep_filtered else ['passed']
+    inputs = batch_inputs(parsed_args['fastq_path'], parsed_args['--output_base_name'])
+    for _, output_base_name in inputs:
+        file_exists(output_base_name, compression, suffices=suffices)
+        os.makedirs(os.path.dirname(output_base_name) or '.', exist_ok=True)
+    sizes = [os.path.getsize(fastq_path) for fastq_path, _ in inputs]
+    total_size = sum(sizes) or 1
+
+    tasks = []  # (input bytes, input number, function, arguments)
+    part_bases = [None] * len(inputs)
+    for i, ((fastq_path, output_base_name), size) in enumerate(zip(inputs, sizes)):
+        file_args = dict(parsed_args, **{'fastq_path': fastq_path, '--output_base_name': output_base_name,
+                                         '--threads': 1})
+        profile = None
+        if profiler is not None:
+            profile = {'label': fastq_path, 'progress_interval': profiler.progress_interval}
+        n_parts = min(threads, size * threads // total_size)
+        ranges = []
+        if n_parts > 1 and not parsed_args.get('--dedup') and not parsed_args.get('--metrics_cache') and \
+                detect_format(fastq_path) is None:
+            ranges = split_ranges(fastq_path, n_parts)
+        if len(ranges) < 2:
+            tasks.append((size, i, filter_file, (file_args, flush_size, chunk_size, profile)))
+            continue
+        part_bases[i] = [f'{output_base_name}.part{j}' for j in range(len(ranges))]
+        for j, ((start, end), part_base) in enumerate(zip(ranges, part_bases[i])):
+            if profile is not None:
+                profile = dict(profile, label=f'{fastq_path} part {j}')
+            args = (fastq_path, start, end, part_base, Pipeline.from_args(file_args), keep_filtered, flush_size,
+                    chunk_size, compression, profile)
+            tasks.append((end - start, i, filter_range, args))
+    tasks.sort(key=lambda task: -task[0])
+
+    counts = [[0, 0, None, None] for _ in inputs]
+    remaining = [0] * len(inputs)
+    with ProcessPoolExecutor(threads) as pool:
+        futures = {}
+        for _, i, func, args in tasks:
+            futures[pool.submit(func, *args)] = i
+            remaining[i] += 1
+        for future in as_completed(futures):
+            i = futures[future]
+            result = future.result()
+            counts[i][0] += result[0]
+            counts[i][1] += result[1]
+            if result[3].dedup is not None:
+                counts[i][2] = result[3].dedup.rejected
+            if result[3].adapter_stage() is not None:  # every read is scanned, whatever the worker or chunking
+                counts[i][3] = (counts[i][3] or 0) + int(result[3].adapter_stage().hits.sum())
+            if profiler is not None:
+                profiler.merge(result[2])
+            if pipeline is not None:
+                pipeline.merge(result[3])
+            remaining[i] -= 1
+            if not remaining[i] and part_bases[i] is not None:
+                with (profiler or NULL_PROFILER).stage('concatenate'):
+                    for suffix in suffices:
+                        concatenate([output_path(part_base, suffix, compression) for part_base in part_bases[i]],
+                                    output_path(inputs[i][1], suffix, compression), compression)
+    if profiler is not None:
+        profiler.bytes_in = sum(sizes)  # compressed bytes for compressed input
+    return [(fastq_path, output_base_name, *count) for (fastq_path, output_base_name), count in zip(inputs, counts)]
+
+
+def format_batch_summary(results):
+    """A table of the counts of every input of a batch (see write_to_file_batch) and their total. Reads failed as
+    duplicates and failed or trimmed for adapters get columns of their own when there are any."""
+    width = max(len('total'), *(len(fastq_path) for fastq_path, *_ in results))
+    extra = [(column, name) for column, name in [(4, 'duplicates'), (5, 'adapters')]
+             if any(result[column] is not None for result in results)]
+    lines = [f'{"input":<{width}} {"reads":>12} {"passed":>12} {"%":>7} {"failed":>12} {"%":>7}' +
+             ''.join(f' {name:>12} {"%":>7}' for _, name in extra)]
+    total = ('total', None, *(sum(result[column] or 0 for result in results) for column in range(2, 6)))
+    for result in results + [total]:
+        fastq_path, _, passed, failed = result[:4]
+        reads = passed + failed
+        lines.append(f'{fastq_path:<{width}} {reads:12d} {passed:12d} {passed * 100 / (reads or 1):7.2f} '
+                     f'{failed:12d} {failed * 100 / (reads or 1):7.2f}' +
+                     ''.join(f' {result[column] or 0:12d} {(result[column] or 0) * 100 / (reads or 1):7.2f}'
+                             for column, _ in extra))
+    return '\n'.join(lines)
+
+
+def format_adapter_hits(stage, total):
+    """Lines of the reads found per adapter pattern of an AdapterFilter/AdapterTrimmer, most found first, as parts of
+    the `total` reads. Both stages scan every read, so the counts do not depend on the other filters."""
+    action = 'trimmed' if stage.name == 'adapter_trim' else 'failed'
+    lines = [f'{stage.hits.sum()} ({round(stage.hits.sum() * 100 / total, 2)}%) reads {action} for adapters:']
+    for number in np.argsort(-stage.hits, kind='stable'):
+        if stage.hits[number]:
+            lines.append(f'  {stage.automaton.names[number]}: {stage.hits[number]} '
+                         f'({round(stage.hits[number] * 100 / total, 2)}%)')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parsed_args = parse_args(sys.argv[1:])
+    profiler = None
+    if parsed_args['--profile'] or parsed_args['--stats-json'] is not None:
+        profiler = Profiler(progress_interval=PROGRESS_INTERVAL if parsed_args['--profile'] else None)
+    summary = sys.stderr if parsed_args['--output_base_name'] == '-' else sys.stdout
+    pipeline = Pipeline.from_args(parsed_args)
+    if parsed_args['--batch']:
+        results = write_to_file_batch(parsed_args, profiler=profiler, pipeline=pipeline)
+        passed, failed = sum(result[2] for result in results), sum(result[3] for result in results)
+        print(f'Filtering finished: {len(results)} files.', file=summary)
+        print(format_batch_summary(results), file=summary)
+    elif parsed_args['--paired'] is not None:
+        both, only1, only2, neither = write_to_file_paired(parsed_args, profiler=profiler, pipeline=pipeline)
+        pairs = both + only1 + only2 + neither
+        passed, failed = 2 * both + only1 + only2, only1 + only2 + 2 * neither
+        print('Filtering finished.', file=summary)
+        print(f'Total pairs in {parsed_args["fastq_path"]} and {parsed_args["--paired"]}: {pairs}, of them:\n'
+              f'{both} ({round(both * 100 / pairs, 2)}%) passed as pairs.\n'
+              f'{only1} ({round(only1 * 100 / pairs, 2)}%) R1 and {only2} ({round(only2 * 100 / pairs, 2)}%) R2 '
+              f'mates passed alone (orphans).\n'
+              f'{neither} ({round(neither * 100 / pairs, 2)}%) failed.', file=summary)
+    else:
+        passed, failed = write_to_file(parsed_args, profiler=profiler, pipeline=pipeline)
+        print('Filtering finished.', file=summary)
+        print(f'Total reads in {parsed_args["fastq_path"]}: {passed + failed}, of them:\n'
+              f'{passed} ({round(passed * 100 / (passed + failed), 2)}%) passed.\n'
+              f'{failed} ({round(failed * 100 / (passed + failed), 2)}%) failed.', file=summary)
+        if pipeline.dedup is not None:
+            duplicates = pipeline.dedup.rejected
+            print(f'{duplicates} ({round(duplicates * 100 / (passed + failed), 2)}%) failed as duplicates.',
+                  file=summary)
+            if parsed_args['--dedup_bloom']:
+                print(f'Bloom filter: ~{pipeline.dedup.index.false_positive_rate():.3%} of the last unique reads '
+                      f'were taken for duplicates.', file=summary)
+    if pipeline.adapter_stage() is not None and passed + failed:
+        print(format_adapter_hits(pipeline.adapter_stage(), passed + failed), file=summary)
+    if profiler is not None:
+        report = profiler.report(passed, failed, input=parsed_args['fastq_path'], threads=parsed_args['--threads'],
+                                 args=parsed_args)
+        if parsed_args['--batch']:
+            report['files'] = [{'input': fastq_path, 'output_base_name': output_base_name, 'passed': file_passed,
+                                'failed': file_failed, 'duplicates': duplicates, 'adapters': adapters}
+                               for fastq_path, output_base_name, file_passed, file_failed, duplicates, adapters
+                               in results]
+        elif parsed_args['--paired'] is None and pipeline.dedup is not None:
+            report['duplicates'] = pipeline.dedup.rejected
+        if pipeline.adapter_stage() is not None:
+            stage = pipeline.adapter_stage()
+            report['adapters'] = {name: int(hits) for name, hits in zip(stage.automaton.names, stage.hits)}
+        if parsed_args['--paired'] is not None:
+            report['pairs'] = {'both_passed': both, 'r1_only': only1, 'r2_only': only2, 'neither': neither}
+        if parsed_args['--profile']:
+            print(format_report(report), file=sys.stderr)
+        if parsed_args['--stats-json'] is not None:
+            with open(parsed_args['--stats-json'], 'w') as ouf:
+                json.dump(report, ouf, indent=2)
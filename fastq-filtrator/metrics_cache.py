@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from fastq_reader import FastqReader
+from pipeline import GC_TABLE, PHRED_TABLES, span_bounds
+
+METRICS_VERSION = 1  # bump when the columns change meaning
+METRICS_CHUNK_SIZE = 1 << 18  # reads measured or filtered together
+COLUMNS = {'offsets': np.int64, 'lengths': np.int32, 'gc': np.int32, 'qual_sums': np.int64, 'qual_min': np.uint8}
+
+
+def metrics_path(fastq_path):
+    """The sidecar directory of the metrics of a FASTQ file: a .npy file per column and meta.json."""
+    return f'{fastq_path}.metrics'
+
+
+def input_key(path):
+    """What tells a measured input apart from a changed one: its size and modification time."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def span_sums(ufunc, raw, starts, ends):
+    """ufunc.reduceat of each raw[starts[i]:ends[i]], relative to starts[0], with 0 for empty ranges."""
+    if not ends[-1] > starts[-1]:
+        raw = np.append(raw, raw.dtype.type(0))  # an empty last range starts at the end of the span
+    sums = ufunc.reduceat(raw, span_bounds(starts, ends), dtype=np.int64 if ufunc is np.add else None)[0::2]
+    sums[ends == starts] = 0
+    return sums
+
+
+class ReadMetrics:
+    """Per-read metrics of a FASTQ file as NumPy columns, enough to run the length, GC and quality filters again
+    without the file.
+
+    Read i is bytes offsets[i]:offsets[i + 1] of the file (so `offsets` has one entry more than the other columns)
+    and has lengths[i] bases, gc[i] of them G or C. Its quality characters add up to qual_sums[i] and the lowest is
+    qual_min[i] (0 for an empty read); raw characters are kept so the metrics serve Phred+33 and Phred+64 alike.
+    """
+    def __init__(self, offsets, lengths, gc, qual_sums, qual_min):
+        self.offsets = offsets
+        self.lengths = lengths
+        self.gc = gc
+        self.qual_sums = qual_sums
+        self.qual_min = qual_min
+
+    @classmethod
+    def compute(cls, fastq_path, chunk_size=METRICS_CHUNK_SIZE):
+        """Measure every read of a plain FASTQ file in one pass over its mapping."""
+        columns = {name: [] for name in COLUMNS}
+        with FastqReader(fastq_path) as reader:
+            columns['offsets'].append(np.zeros(1, dtype=np.int64))
+            for starts, seq_starts, seq_ends, qual_starts, qual_ends, ends in reader.chunks(chunk_size):
+                if not len(starts):
+                    continue
+                lengths = seq_ends - seq_starts
+                bad = np.flatnonzero(qual_ends - qual_starts != lengths)
+                if len(bad):
+                    raise ValueError(f'The read at byte {starts[bad[0]]} of {fastq_path} has {lengths[bad[0]]} bases '
+                                     f'but {qual_ends[bad[0]] - qual_starts[bad[0]]} quality characters.')
+                columns['offsets'].append(ends)
+                columns['lengths'].append(lengths)
+                columns['gc'].append(span_sums(np.add, GC_TABLE[reader.array[seq_starts[0]:seq_ends[-1]]],
+                                               seq_starts, seq_ends))
+                qual = reader.array[qual_starts[0]:qual_ends[-1]]
+                columns['qual_sums'].append(span_sums(np.add, qual, qual_starts, qual_ends))
+                columns['qual_min'].append(span_sums(np.minimum, qual, qual_starts, qual_ends))
+        return cls(**{name: np.concatenate(columns[name]).astype(dtype) for name, dtype in COLUMNS.items()})
+
+    def slice(self, start, stop):
+        """The metrics of reads start to stop - 1, as views."""
+        return ReadMetrics(self.offsets[start:stop + 1], self.lengths[start:stop], self.gc[start:stop],
+                           self.qual_sums[start:stop], self.qual_min[start:stop])
+
+    def gc_percent(self, idx):
+        lengths = self.lengths[idx].astype(np.int64)
+        return np.divide(self.gc[idx] * 100, lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+
+    def mean_quality(self, idx, offset=33):
+        lengths = self.lengths[idx].astype(np.int64)
+        return np.divide(self.qual_sums[idx] - offset * lengths, lengths, out=np.zeros(len(lengths)),
+                         where=lengths > 0)
+
+    def min_quality(self, idx, offset=33):
+        return PHRED_TABLES[offset][self.qual_min[idx]]
+
+    def save(self, path, key):
+        """Write the columns and `key` (see input_key) to the directory at `path`, replacing it whole: the columns
+        are written to a temporary directory first, so a crash leaves no half-written sidecar."""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            for name in COLUMNS:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as ouf:
+                json.dump(dict(key, version=METRICS_VERSION, reads=len(self)), ouf)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map the columns of a sidecar directory."""
+        return cls(**{name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS})
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+def load_metrics(fastq_path):
+    """The ReadMetrics of a FASTQ file from its sidecar, or None if there is none or the file changed since."""
+    path = metrics_path(fastq_path)
+    try:
+        with open(os.path.join(path, 'meta.json')) as inf:
+            meta = json.load(inf)
+        if meta.get('version') != METRICS_VERSION or \
+                {key: meta.get(key) for key in ['size', 'mtime_ns']} != input_key(fastq_path):
+            return None
+        metrics = ReadMetrics.load(path)
+    except (OSError, ValueError):
+        return None
+    if len(metrics.offsets) != meta['reads'] + 1 or \
+            any(len(getattr(metrics, name)) != meta['reads'] for name in COLUMNS if name != 'offsets'):
+        return None  # a damaged sidecar is measured again
+    return metrics
+
+
+def get_metrics(fastq_path, chunk_size=METRICS_CHUNK_SIZE):
+    """The ReadMetrics of a FASTQ file from an up-to-date sidecar, measuring the file and writing the sidecar if there
+    is none. A sidecar that cannot be written (e.g. in a read-only directory) is skipped."""
+    metrics = load_metrics(fastq_path)
+    if metrics is None:
+        key = input_key(fastq_path)
+        metrics = ReadMetrics.compute(fastq_path, chunk_size)
+        try:
+            metrics.save(metrics_path(fastq_path), key)
+        except OSError:
+            pass
+    return metrics
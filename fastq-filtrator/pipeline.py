@@ -0,0 +1,448 @@
+import time
+
+import numpy as np
+
+from adapters import cached_automaton
+from dedup import FINGERPRINT_SEED, BloomFilter, FingerprintTable, RangeHasher, fingerprints
+
+GC_TABLE = np.zeros(256, dtype=np.uint8)  # 1 for G/C bytes in either case, 0 for anything else
+GC_TABLE[list(b'GCgc')] = 1
+
+PHRED_TABLES = {offset: np.maximum(np.arange(256, dtype=np.int16) - offset, 0) for offset in (33, 64)}
+
+
+def range_metrics(data, starts, ends):
+    """Return lengths and GC percentages of the sequences at data[starts[i]:ends[i]], which must be in order.
+
+    Only the span from the first start to the last end is scanned, so `data` can be a whole mapped FASTQ file.
+    """
+    lengths = ends - starts
+    if not len(lengths):
+        return lengths, np.zeros(0)
+    low = starts[0]
+    is_gc = np.zeros(ends[-1] - low + 1, dtype=np.uint8)  # one extra 0 so that the last end is a valid index
+    is_gc[:-1] = GC_TABLE[data[low:ends[-1]]]
+    bounds = np.empty(2 * len(lengths), dtype=np.int64)
+    bounds[0::2] = starts - low
+    bounds[1::2] = ends - low
+    gc = np.add.reduceat(is_gc, bounds, dtype=np.int32)[0::2]
+    gc[lengths == 0] = 0
+    gc_percent = np.divide(gc * 100, lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+    return lengths, gc_percent
+
+
+def batch_valid(lengths, gc_percent, minlen, gc_bounds):
+    """Bulk equivalent of valid_gc(...) and valid_len(...): a boolean mask of the reads passing both filters."""
+    mask = lengths >= minlen
+    if gc_bounds[0] == gc_bounds[1]:
+        mask &= gc_percent >= gc_bounds[0]
+    elif gc_bounds[0] < gc_bounds[1]:
+        mask &= (gc_percent >= gc_bounds[0]) & (gc_percent <= gc_bounds[1])
+    return mask
+
+
+def span_bounds(starts, ends):
+    """Interleave starts and ends, relative to the first start, for ufunc.reduceat over data[starts[0]:ends[-1]].
+
+    Even entries of the reduceat result are then the per-read values. The last end is left out, since the last
+    read runs to the end of the span anyway (and the end is not a valid index).
+    """
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts - starts[0]
+    bounds[1::2] = ends - starts[0]
+    return bounds[:-1]
+
+
+def quality_metrics(data, starts, ends, offset=33):
+    """Return mean and minimal Phred quality of the quality strings at data[starts[i]:ends[i]], which must be in order.
+
+    Sums are taken over the raw bytes (a sum of scores is the sum of the bytes minus the offset per byte) and only the
+    per-read minimal bytes go through the Phred lookup table.
+    """
+    lengths = ends - starts
+    if not len(lengths):
+        return np.zeros(0), np.zeros(0, dtype=np.int16)
+    raw = data[starts[0]:ends[-1]]
+    if not lengths[-1]:
+        raw = np.append(raw, 0)  # an empty last read starts at the end of the span
+    bounds = span_bounds(starts, ends)
+    sums = np.add.reduceat(raw, bounds, dtype=np.int32 if len(raw) < 2 ** 31 // 256 else np.int64)[0::2]
+    mean = np.divide(sums - offset * lengths, lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+    minimum = PHRED_TABLES[offset][np.minimum.reduceat(raw, bounds)[0::2]]
+    minimum[lengths == 0] = 0
+    return mean, minimum
+
+
+def window_sums(raw, window):
+    """Sums of every `window` consecutive bytes: result[i] is the sum of raw[i:i + window]."""
+    if window > 256:
+        raw_cumsum = np.zeros(len(raw) + 1, dtype=np.int64)
+        np.cumsum(raw, out=raw_cumsum[1:])
+        return raw_cumsum[window:] - raw_cumsum[:-window]
+    sums = raw[:len(raw) - window + 1].astype(np.uint32 if window > 128 else np.uint16)
+    for shift in range(1, window):
+        sums += raw[shift:len(raw) - window + 1 + shift]
+    return sums
+
+
+def trim_lengths(data, starts, ends, quality, window, offset=33):
+    """Return the lengths of reads trimmed from the 3' end by a sliding window.
+
+    A read is cut right after the 3'-most window of `window` bases whose mean Phred quality is at least `quality`;
+    a read shorter than the window is kept whole if its mean quality is high enough, and emptied otherwise.
+    """
+    lengths = ends - starts
+    if not len(lengths):
+        return lengths
+    low = starts[0]
+    raw = data[low:ends[-1]]
+    starts = starts - low
+    ends = ends - low
+    trimmed = np.zeros(len(lengths), dtype=np.int64)
+    if len(raw) >= window:
+        good = window_sums(raw, window) >= (quality + offset) * window  # good[j]: raw[j:j + window] is good enough
+        run_ends = np.flatnonzero(good[:-1] & ~good[1:])  # the last good window before a bad one
+        last_window = np.maximum(ends - window, 0)  # start of the 3'-most window of each read
+        before = np.searchsorted(run_ends, last_window, side='right') - 1
+        best = np.where(good[last_window], last_window,
+                        np.where(before >= 0, run_ends[np.maximum(before, 0)] if len(run_ends) else -1, -1))
+        trimmed = np.where((best >= starts) & (lengths >= window), best + window - starts, 0)
+    short = np.flatnonzero((lengths < window) & (lengths > 0))
+    for i in short.tolist():  # rare: whole read against the threshold
+        if raw[starts[i]:ends[i]].sum(dtype=np.int64) >= (quality + offset) * lengths[i]:
+            trimmed[i] = lengths[i]
+        else:
+            trimmed[i] = 0
+    return trimmed
+
+
+class Chunk:
+    """A chunk of reads as offsets into byte arrays: sequences at seq_data[seq_starts[i]:seq_ends[i]] and qualities
+    at qual_data[qual_starts[i]:qual_ends[i]]. The two arrays may be the same (a mapped FASTQ file)."""
+    def __init__(self, seq_data, seq_starts, seq_ends, qual_data, qual_starts, qual_ends):
+        self.seq_data = seq_data
+        self.seq_starts = seq_starts
+        self.seq_ends = seq_ends
+        self.qual_data = qual_data
+        self.qual_starts = qual_starts
+        self.qual_ends = qual_ends
+
+    @property
+    def lengths(self):
+        return self.seq_ends - self.seq_starts
+
+    def trim(self, lengths):
+        """Shorten reads to `lengths` from their 3' end."""
+        lengths = np.minimum(self.lengths, lengths)
+        self.seq_ends = self.seq_starts + lengths
+        self.qual_ends = self.qual_starts + lengths
+
+    def __len__(self):
+        return len(self.seq_starts)
+
+
+class Filter:
+    """A pipeline stage that keeps or rejects reads.
+
+    Subclasses implement `batch(chunk, idx)`, returning a boolean mask of the reads at indices `idx` of the chunk
+    that pass. Those that set `supports_metrics` also implement `metrics_batch(metrics, idx)`, the same on the cached
+    columns of a metrics_cache.ReadMetrics. The pipeline records how many reads each stage saw and rejected, and the
+    wall and CPU time it took over how many calls.
+    """
+    name = 'filter'
+    uses_quality = False
+    supports_metrics = False
+
+    def __init__(self):
+        self.evaluated = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.calls = 0
+
+    def batch(self, chunk, idx):
+        raise NotImplementedError
+
+    def metrics_batch(self, metrics, idx):
+        raise NotImplementedError
+
+    def cost(self):
+        """Seconds spent per evaluated read."""
+        return self.seconds / self.evaluated if self.evaluated else 0.0
+
+    def rejection_rate(self):
+        return self.rejected / self.evaluated if self.evaluated else 0.0
+
+    def rank(self):
+        """Cost per rejected read: running stages in increasing rank minimizes the total cost of the conjunction."""
+        rejection_rate = self.rejection_rate()
+        return self.cost() / rejection_rate if rejection_rate else float('inf')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name})'
+
+
+class LengthFilter(Filter):
+    name = 'length'
+    supports_metrics = True
+
+    def __init__(self, minlen):
+        super().__init__()
+        self.minlen = minlen
+
+    def batch(self, chunk, idx):
+        return chunk.seq_ends[idx] - chunk.seq_starts[idx] >= self.minlen
+
+    def metrics_batch(self, metrics, idx):
+        return metrics.lengths[idx] >= self.minlen
+
+
+class GcFilter(Filter):
+    name = 'gc'
+    supports_metrics = True
+
+    def __init__(self, gc_bounds):
+        super().__init__()
+        self.gc_bounds = gc_bounds
+
+    def batch(self, chunk, idx):
+        lengths, gc_percent = range_metrics(chunk.seq_data, chunk.seq_starts[idx], chunk.seq_ends[idx])
+        return batch_valid(lengths, gc_percent, 0, self.gc_bounds)
+
+    def metrics_batch(self, metrics, idx):
+        return batch_valid(metrics.lengths[idx], metrics.gc_percent(idx), 0, self.gc_bounds)
+
+
+class MeanQualityFilter(Filter):
+    name = 'mean_quality'
+    uses_quality = True
+    supports_metrics = True
+
+    def __init__(self, min_mean, offset=33):
+        super().__init__()
+        self.min_mean = min_mean
+        self.offset = offset
+
+    def batch(self, chunk, idx):
+        mean, _ = quality_metrics(chunk.qual_data, chunk.qual_starts[idx], chunk.qual_ends[idx], self.offset)
+        return mean >= self.min_mean
+
+    def metrics_batch(self, metrics, idx):
+        return metrics.mean_quality(idx, self.offset) >= self.min_mean
+
+
+class MinQualityFilter(Filter):
+    name = 'min_quality'
+    uses_quality = True
+    supports_metrics = True
+
+    def __init__(self, min_base, offset=33):
+        super().__init__()
+        self.min_base = min_base
+        self.offset = offset
+
+    def batch(self, chunk, idx):
+        _, minimum = quality_metrics(chunk.qual_data, chunk.qual_starts[idx], chunk.qual_ends[idx], self.offset)
+        return minimum >= self.min_base
+
+    def metrics_batch(self, metrics, idx):
+        return metrics.min_quality(idx, self.offset) >= self.min_base
+
+
+class DedupFilter(Filter):
+    """Rejects reads whose fingerprint was seen before (see dedup.fingerprints): exact duplicates, or reads equal in
+    their first `length` bases, optionally with the first `quality` quality characters. Fingerprints are kept in an
+    exact dedup.FingerprintTable, or in a dedup.BloomFilter of `bloom_bytes` bytes.
+
+    The first read of a group is kept, so the pipeline runs this stage last and in input order.
+    """
+    name = 'dedup'
+
+    def __init__(self, length=None, quality=0, bloom_bytes=None):
+        super().__init__()
+        self.length = length
+        self.quality = quality
+        self.uses_quality = quality > 0
+        self.seq_hasher = RangeHasher(fold_case=True)
+        self.qual_hasher = RangeHasher(seed=FINGERPRINT_SEED + 1) if quality else None
+        self.index = BloomFilter(bloom_bytes) if bloom_bytes else FingerprintTable()
+
+    def batch(self, chunk, idx):
+        return self.index.add(fingerprints(chunk, idx, self.seq_hasher, self.qual_hasher, self.length, self.quality))
+
+
+class AdapterFilter(Filter):
+    """Rejects reads that contain a pattern of an adapters.Automaton (adapter or contaminant sequences) or its reverse
+    complement. `hits` counts the rejected reads by the pattern found first in them.
+
+    The pipeline runs this stage first, on every read, so `hits` counts all reads with a pattern however the other
+    filters are ordered.
+    """
+    name = 'adapter'
+
+    def __init__(self, automaton):
+        super().__init__()
+        self.automaton = automaton
+        self.hits = np.zeros(len(automaton.names), dtype=np.int64)
+
+    def batch(self, chunk, idx):
+        match_starts, patterns = self.automaton.scan(chunk.seq_data, chunk.seq_starts[idx], chunk.seq_ends[idx])
+        self.hits += np.bincount(patterns[patterns >= 0], minlength=len(self.hits))
+        return match_starts < 0
+
+
+class AdapterTrimmer:
+    """A pipeline stage that cuts every read before the first match of a pattern of an adapters.Automaton, as in 3'
+    adapter trimming. `hits` counts the trimmed reads by the pattern found first in them."""
+    name = 'adapter_trim'
+    uses_quality = False
+
+    def __init__(self, automaton):
+        self.automaton = automaton
+        self.hits = np.zeros(len(automaton.names), dtype=np.int64)
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.calls = 0
+
+    def apply(self, chunk):
+        match_starts, patterns = self.automaton.scan(chunk.seq_data, chunk.seq_starts, chunk.seq_ends)
+        self.hits += np.bincount(patterns[patterns >= 0], minlength=len(self.hits))
+        chunk.trim(np.where(match_starts >= 0, match_starts - chunk.seq_starts, chunk.lengths))
+
+
+class QualityTrimmer:
+    """A pipeline stage that trims the 3' end of every read before the filters run (see trim_lengths)."""
+    name = 'trim'
+    uses_quality = True
+
+    def __init__(self, quality, window=4, offset=33):
+        self.quality = quality
+        self.window = window
+        self.offset = offset
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.calls = 0
+
+    def apply(self, chunk):
+        chunk.trim(trim_lengths(chunk.qual_data, chunk.qual_starts, chunk.qual_ends, self.quality, self.window,
+                                self.offset))
+
+
+class Pipeline:
+    """Trimmers followed by filters, evaluated on chunks of reads.
+
+    Each filter only sees the reads that passed the filters before it. After every chunk the filters are reordered
+    by their measured cost per rejected read, so cheap and selective filters run first; `reorder=False` keeps the
+    given order. A read passes if it passes all filters, so the order never changes the result. An AdapterFilter
+    (`adapters`) always runs first, so its per-pattern counts do not depend on the order either. A DedupFilter
+    (`dedup`) does depend on the reads it sees, so it always runs last, on the reads that passed everything else.
+    """
+    def __init__(self, filters=(), trimmers=(), reorder=True, dedup=None, adapters=None):
+        self.filters = list(filters)
+        self.trimmers = list(trimmers)
+        self.reorder = reorder
+        self.dedup = dedup
+        self.adapters = adapters
+
+    @classmethod
+    def from_args(cls, parsed_args):
+        """Build the pipeline for filter_fastq2 command line arguments (see filter_fastq2.parse_args)."""
+        offset = 64 if parsed_args.get('--phred64') else 33
+        trimmers = []
+        filters = []
+        adapters = None
+        if parsed_args.get('--adapters'):
+            automaton = cached_automaton(parsed_args['--adapters'])
+            if parsed_args.get('--trim_adapters'):
+                trimmers.append(AdapterTrimmer(automaton))
+            else:
+                adapters = AdapterFilter(automaton)
+        trim = parsed_args.get('--trim_quality')
+        if trim:
+            trimmers.append(QualityTrimmer(trim[0], trim[1], offset))
+        if parsed_args.get('--min_length'):
+            filters.append(LengthFilter(parsed_args['--min_length']))
+        gc_bounds = parsed_args.get('--gc_bounds')
+        if gc_bounds and gc_bounds[0] <= gc_bounds[1] and (gc_bounds[0] > 0 or gc_bounds[0] < gc_bounds[1] < 100):
+            filters.append(GcFilter(gc_bounds))
+        if parsed_args.get('--min_mean_quality'):
+            filters.append(MeanQualityFilter(parsed_args['--min_mean_quality'], offset))
+        if parsed_args.get('--min_base_quality'):
+            filters.append(MinQualityFilter(parsed_args['--min_base_quality'], offset))
+        dedup = None
+        if parsed_args.get('--dedup'):
+            bloom = parsed_args.get('--dedup_bloom')
+            dedup = DedupFilter(parsed_args.get('--dedup_length'), parsed_args.get('--dedup_quality', 0),
+                                int(bloom * 2 ** 20) if bloom else None)
+        return cls(filters, trimmers, dedup=dedup, adapters=adapters)
+
+    def adapter_stage(self):
+        """The AdapterFilter or AdapterTrimmer, or None."""
+        for stage in self.trimmers + self.stages():
+            if isinstance(stage, (AdapterFilter, AdapterTrimmer)):
+                return stage
+        return None
+
+    def merge(self, other):
+        """Add the counts and timings of the stages of another Pipeline built from the same arguments, e.g. of a worker
+        process."""
+        stages = {stage.name: stage for stage in self.trimmers + self.stages()}
+        for stage in other.trimmers + other.stages():
+            merged = stages[stage.name]
+            merged.seconds += stage.seconds
+            merged.cpu_seconds += stage.cpu_seconds
+            merged.calls += stage.calls
+            if isinstance(stage, Filter):
+                merged.evaluated += stage.evaluated
+                merged.rejected += stage.rejected
+            if isinstance(stage, (AdapterFilter, AdapterTrimmer)):
+                merged.hits += stage.hits
+        return self
+
+    def stages(self):
+        """All filters in the order they run, the AdapterFilter and DedupFilter included."""
+        return ([self.adapters] if self.adapters is not None else []) + self.filters + \
+            ([self.dedup] if self.dedup is not None else [])
+
+    def supports_metrics(self):
+        """Whether evaluate_metrics can stand in for evaluate: no trimmers or dedup, and filters of cached metrics only.
+        """
+        return not self.trimmers and self.dedup is None and all(stage.supports_metrics for stage in self.stages())
+
+    def needs_quality(self):
+        """Whether any stage reads quality lines, so callers can skip preparing them."""
+        return any(stage.uses_quality for stage in self.trimmers + self.stages())
+
+    def evaluate(self, chunk):
+        """Trim and filter a Chunk in place. Returns the mask of passed reads and the (trimmed) read lengths."""
+        for trimmer in self.trimmers:
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            trimmer.apply(chunk)
+            trimmer.seconds += time.perf_counter() - start
+            trimmer.cpu_seconds += time.thread_time() - start_cpu
+            trimmer.calls += 1
+        return self._filter(len(chunk), lambda stage, idx: stage.batch(chunk, idx)), chunk.lengths
+
+    def evaluate_metrics(self, metrics):
+        """Filter reads by their metrics_cache.ReadMetrics (see supports_metrics). Returns the mask of passed reads."""
+        return self._filter(len(metrics), lambda stage, idx: stage.metrics_batch(metrics, idx))
+
+    def _filter(self, n_reads, batch):
+        """Run the filters on n_reads reads, `batch(stage, idx)` being the mask of the reads at idx a stage passes."""
+        idx = np.arange(n_reads)
+        for stage in self.stages():
+            if not len(idx):
+                break
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            keep = batch(stage, idx)
+            stage.seconds += time.perf_counter() - start
+            stage.cpu_seconds += time.thread_time() - start_cpu
+            stage.calls += 1
+            stage.evaluated += len(idx)
+            idx = idx[keep]
+            stage.rejected += len(keep) - len(idx)
+        mask = np.zeros(n_reads, dtype=bool)
+        mask[idx] = True
+        if self.reorder:
+            self.filters.sort(key=Filter.rank)
+        return mask
@@ -0,0 +1,180 @@
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+PROGRESS_INTERVAL = 5.0  # seconds between progress lines
+
+
+class Stage:
+    """Wall time and CPU time of the calling thread spent in one stage, summed over calls. A context manager."""
+    __slots__ = ('wall', 'cpu', 'calls', 'started_wall', 'started_cpu')
+
+    def __init__(self):
+        self.wall = self.cpu = 0.0
+        self.calls = 0
+        self.started_wall = self.started_cpu = 0.0
+
+    def __enter__(self):
+        self.started_wall = time.perf_counter()
+        self.started_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall += time.perf_counter() - self.started_wall
+        self.cpu += time.thread_time() - self.started_cpu
+        self.calls += 1
+
+    def add(self, wall, cpu, calls=1):
+        self.wall += wall
+        self.cpu += cpu
+        self.calls += calls
+
+    def to_dict(self):
+        return {'wall_seconds': self.wall, 'cpu_seconds': self.cpu, 'calls': self.calls}
+
+
+class NullStage:
+    """A Stage that measures nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class NullProfiler:
+    """Stands in for a Profiler when profiling is off, so the filter loops need no checks of their own."""
+    null_stage = NullStage()
+
+    def stage(self, name):
+        return self.null_stage
+
+    def advance(self, records, position=None):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def peak_rss(who='self'):
+    """Peak resident set size in bytes of this process ('self') or of its largest finished child ('children')."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)  # bytes on macOS, KiB on Linux
+
+
+class Profiler:
+    """Collects per-stage timings, record and byte counts of a filtering run, and prints progress lines.
+
+    Stages are 'read' (pulling lines or scanning the mapped file), 'parse' (building the arrays of a chunk), the
+    pipeline's trimmers and filters, and 'write'. `advance` is called once per chunk; with `progress_interval`
+    set it prints a progress line to `stream` at most that often. Profilers of parallel workers are merged.
+    """
+    def __init__(self, label='filter_fastq2', progress_interval=None, total_bytes=None, stream=None):
+        self.label = label
+        self.progress_interval = progress_interval
+        self.total_bytes = total_bytes
+        self.stream = stream
+        self.stages = {}
+        self.filters = {}
+        self.records = 0
+        self.bytes_in = None
+        self.bytes_out = 0
+        self.started_wall = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.next_progress = self.started_wall + (progress_interval or 0)
+
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage()
+        return stage
+
+    def advance(self, records, position=None):
+        """Count `records` more records; `position` is the number of input bytes done so far, if known."""
+        self.records += records
+        if position is not None:
+            self.bytes_in = position
+        if self.progress_interval is not None and time.perf_counter() >= self.next_progress:
+            self.print_progress()
+
+    def print_progress(self):
+        now = time.perf_counter()
+        elapsed = now - self.started_wall
+        line = f'[{self.label}] {self.records} reads in {elapsed:.1f} s ({self.records / elapsed:.0f} reads/s'
+        if self.bytes_in is not None:
+            line += f', {self.bytes_in / elapsed / 1e6:.1f} MB/s'
+            if self.total_bytes:
+                line += f', {self.bytes_in * 100 / self.total_bytes:.1f}% of input'
+        print(line + ')', file=self.stream or sys.stderr, flush=True)
+        self.next_progress = now + self.progress_interval
+
+    def add_pipeline(self, pipeline):
+        """Take the timings and counts of the trimmers and filters of a Pipeline after a run."""
+        for trimmer in pipeline.trimmers:
+            self.stage(trimmer.name).add(trimmer.seconds, trimmer.cpu_seconds, trimmer.calls)
+        for stage in pipeline.stages():
+            self.stage(f'filter:{stage.name}').add(stage.seconds, stage.cpu_seconds, stage.calls)
+            self.filters[stage.name] = {'evaluated': stage.evaluated, 'rejected': stage.rejected}
+
+    def merge(self, other):
+        """Add the stages and counts of another Profiler, e.g. of a worker process."""
+        for name, stage in other.stages.items():
+            self.stage(name).add(stage.wall, stage.cpu, stage.calls)
+        for name, counts in other.filters.items():
+            merged = self.filters.setdefault(name, {'evaluated': 0, 'rejected': 0})
+            merged['evaluated'] += counts['evaluated']
+            merged['rejected'] += counts['rejected']
+        self.records += other.records
+        if other.bytes_in is not None:
+            self.bytes_in = (self.bytes_in or 0) + other.bytes_in
+        self.bytes_out += other.bytes_out
+        return self
+
+    def report(self, passed, failed, **fields):
+        """The run summary as a JSON-serializable dict; `fields` are added as they are."""
+        wall = time.perf_counter() - self.started_wall
+        cpu = time.process_time() - self.started_cpu
+        records = passed + failed
+        report = dict(fields)
+        report.update({
+            'passed': passed,
+            'failed': failed,
+            'records': records,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'records_per_second': records / wall if wall else None,
+            'input_bytes': self.bytes_in,
+            'input_bytes_per_second': self.bytes_in / wall if wall and self.bytes_in is not None else None,
+            'output_bytes': self.bytes_out,
+            'peak_rss_bytes': peak_rss('self'),
+            'peak_rss_children_bytes': peak_rss('children'),
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()},
+            'filters': self.filters,
+        })
+        return report
+
+
+def format_report(report):
+    """A report of Profiler.report as a table of stages and a few summary lines."""
+    lines = [f'{"stage":<22} {"wall s":>10} {"cpu s":>10} {"calls":>8}']
+    for name, stage in report['stages'].items():
+        lines.append(f'{name:<22} {stage["wall_seconds"]:10.3f} {stage["cpu_seconds"]:10.3f} {stage["calls"]:8d}')
+    lines.append(f'{"total":<22} {report["wall_seconds"]:10.3f} {report["cpu_seconds"]:10.3f}')
+    for name, counts in report['filters'].items():
+        lines.append(f'filter {name}: {counts["rejected"]} of {counts["evaluated"]} evaluated reads rejected')
+    lines.append(f'{report["records"]} reads, {report["records_per_second"] or 0:.0f} reads/s')
+    if report['input_bytes'] is not None:
+        lines.append(f'{report["input_bytes"] / 1e6:.1f} MB in ({(report["input_bytes_per_second"] or 0) / 1e6:.1f} '
+                     f'MB/s), {report["output_bytes"] / 1e6:.1f} MB out')
+    if report['peak_rss_bytes'] is not None:
+        lines.append(f'peak RSS {report["peak_rss_bytes"] / 2 ** 20:.1f} MiB '
+                     f'(workers {report["peak_rss_children_bytes"] / 2 ** 20:.1f} MiB)')
+    return '\n'.join(lines)
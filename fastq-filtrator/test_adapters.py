@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from adapters import SEGMENT_LENGTH, Automaton, cache_dir, cached_automaton, load_automaton, read_patterns, \
+    reverse_complement
+from filter_fastq2 import seqs_to_array
+
+
+def naive_scan(patterns, seq):
+    """The earliest match start in seq and a pattern number matched there, by str.find over both strands."""
+    best = (-1, -1)
+    for number, (_, pattern) in enumerate(patterns):
+        for strand in [pattern, reverse_complement(pattern)]:
+            start = seq.find(strand)
+            if start >= 0 and (best[0] < 0 or start < best[0]):
+                best = (start, number)
+    return best
+
+
+class TestAdapters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'adapters.fasta')
+        with open(self.path, 'w') as ouf:
+            ouf.write('>truseq Illumina TruSeq\nAGATCGGAAG\nAGC\n>polyA\nAAAAAAAAAA\n>short\nCGTTA\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_patterns(self):
+        self.assertEqual(read_patterns(self.path), [('truseq', 'AGATCGGAAGAGC'), ('polyA', 'AAAAAAAAAA'),
+                                                    ('short', 'CGTTA')])
+        path = os.path.join(self.tmp.name, 'plain.txt')
+        for text, expected in [('acgt\n\nTTGA\n', [('ACGT', 'ACGT'), ('TTGA', 'TTGA')]),
+                               ('ACGN\n', None), ('>a\n>b\nACGT\n', None), ('\n', None)]:
+            with open(path, 'w') as ouf:
+                ouf.write(text)
+            if expected is None:
+                self.assertRaises(ValueError, read_patterns, path)
+            else:
+                self.assertEqual(read_patterns(path), expected)
+
+    def test_scan(self):
+        rng = np.random.default_rng(5)
+        patterns = read_patterns(self.path) + [(f'random{i}', ''.join(rng.choice(list('ACGT'), size=size)))
+                                               for i, size in enumerate(rng.integers(3, 8, size=20))]
+        automaton = Automaton.build(patterns)
+        # long reads are scanned in segments, so some have to be longer than one
+        seqs = [''.join(rng.choice(list('ACGTN'), size=size, p=[0.24, 0.24, 0.24, 0.24, 0.04]))
+                for size in rng.integers(0, 3 * SEGMENT_LENGTH, size=300)]
+        seqs[:3] = ['GCTCTTCCGATCT', 'NNAGATCGGAAGAGCNN', 'C' * SEGMENT_LENGTH + 'AGATCGGAAGAGC']
+        data, offsets = seqs_to_array(seqs)
+        match_starts, numbers = automaton.scan(data, offsets[:-1], offsets[1:])
+        for seq, offset, match_start, number in zip(seqs, offsets, match_starts.tolist(), numbers.tolist()):
+            start, _ = naive_scan(patterns, seq)
+            self.assertEqual(match_start - offset if match_start >= 0 else -1, start)
+            if start >= 0:  # of the patterns starting there, any one may be reported
+                pattern = patterns[number][1]
+                self.assertIn(seq[start:start + len(pattern)], [pattern, reverse_complement(pattern)])
+        self.assertEqual(numbers[:3].tolist(), [0, 0, 0])  # a reverse complement counts for its pattern
+
+    def test_cache(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}):
+            built = load_automaton(self.path)
+            self.assertEqual(len(os.listdir(cache_dir())), 1)
+            with mock.patch('adapters.Automaton.build', side_effect=AssertionError('compiled again')):
+                cached = load_automaton(self.path)
+            self.assertEqual(cached.names, built.names)
+            for array in ['delta', 'out_length', 'out_pattern']:
+                self.assertEqual(getattr(cached, array).tolist(), getattr(built, array).tolist())
+            with open(os.path.join(cache_dir(), os.listdir(cache_dir())[0]), 'wb') as ouf:
+                ouf.write(b'damaged')
+            self.assertEqual(load_automaton(self.path).names, built.names)
+
+    def test_cached_automaton(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}):
+            loaded = cached_automaton(self.path)
+            with mock.patch('adapters.load_automaton', side_effect=AssertionError('loaded again')):
+                self.assertIs(cached_automaton(self.path), loaded)
+            with open(self.path, 'a') as ouf:  # a changed file is loaded again
+                ouf.write('>extra\nGGGCCC\n')
+            self.assertEqual(cached_automaton(self.path).names, ['truseq', 'polyA', 'short', 'extra'])
+
+
+if __name__ == '__main__':
+    unittest.main()
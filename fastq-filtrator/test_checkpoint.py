@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+
+from checkpoint import Checkpointer, filter_args, load_checkpoint, truncate_outputs, write_atomically
+
+
+class FakeWriter:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def sync(self):
+        return self.size
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_write_atomically(self):
+        path = os.path.join(self.tmp, 'atomic_test.json')
+        write_atomically(path, '{"offset": 1}')
+        write_atomically(path, '{"offset": 2}')
+        with open(path) as inf:
+            self.assertEqual(json.load(inf), {'offset': 2})
+        self.assertFalse(os.path.exists(path + '.tmp'))
+
+    def test_checkpointer(self):
+        args = {'--min_length': 10, '--gc_bounds': [0.0, 0.0], '--threads': 4, 'fastq_path': 'test.fastq'}
+        output = os.path.join(self.tmp, 'checkpoint_out.fastq')
+        path = os.path.join(self.tmp, 'test.checkpoint.json')
+        with open(output, 'wb') as ouf:
+            ouf.write(b'0123456789')
+        writer = FakeWriter(output, 4)
+        checkpointer = Checkpointer(path, 'test.fastq', args, [writer], interval=3600)
+        writer.size = 8
+        checkpointer.advance(3, 1, 400)  # not due yet
+        state = load_checkpoint(path, 'test.fastq', dict(args, **{'--threads': 1}))
+        self.assertEqual((state['offset'], state['outputs']), (0, {output: 4}))
+        checkpointer.interval = 0
+        checkpointer.save(400, 3, 1)
+        state = load_checkpoint(path, 'test.fastq', args)
+        self.assertEqual((state['offset'], state['records'], state['args']), (400, 4, filter_args(args)))
+        truncate_outputs(state)
+        self.assertEqual(os.path.getsize(output), 8)
+        resumed = Checkpointer(path, 'test.fastq', args, [writer], interval=0, state=state)
+        resumed.advance(2, 2)
+        with open(path) as inf:
+            self.assertEqual((json.load(inf)['passed'], resumed.state['failed']), (5, 3))
+        self.assertRaises(ValueError, load_checkpoint, path, 'test.fastq', dict(args, **{'--min_length': 20}))
+        resumed.remove()
+        self.assertRaises(ValueError, load_checkpoint, path, 'test.fastq', args)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from dedup import BloomFilter, FingerprintTable, RangeHasher, fingerprints, mix
+from filter_fastq2 import reads_to_chunk
+
+
+def reference(values):
+    """Plain Python first-occurrence mask to check against."""
+    seen = set()
+    mask = []
+    for value in values:
+        mask.append(value not in seen)
+        seen.add(value)
+    return mask
+
+
+class TestDedup(unittest.TestCase):
+    def test_fingerprint_table(self):
+        rng = np.random.default_rng(0)
+        table = FingerprintTable(capacity=4)  # grows many times
+        seen = []
+        for _ in range(20):
+            values = mix(rng.integers(1, 5000, size=3000).astype(np.uint64))
+            mask = table.add(values)
+            self.assertEqual(mask.tolist(), reference(seen + values.tolist())[len(seen):])
+            seen += values.tolist()
+        self.assertEqual(len(table), len(set(seen)))
+        self.assertTrue(len(table) <= 0.5 * len(table.slots))
+        collide = np.array([1, 1 + 2 ** 20, 1 + 2 ** 21, 1], dtype=np.uint64)  # one slot, probed past
+        self.assertEqual(FingerprintTable().add(collide).tolist(), [True, True, True, False])
+
+    def test_bloom_filter(self):
+        rng = np.random.default_rng(1)
+        bloom = BloomFilter(1 << 14)
+        values = mix(rng.integers(1, 20000, size=20000).astype(np.uint64))
+        mask = np.concatenate([bloom.add(values[i:i + 1000]) for i in range(0, len(values), 1000)])
+        expected = np.array(reference(values.tolist()))
+        self.assertFalse((mask & ~expected).any())  # a duplicate is never taken for a new read
+        self.assertTrue(np.count_nonzero(expected & ~mask) <= 0.01 * np.count_nonzero(expected))
+        self.assertTrue(0 < bloom.false_positive_rate() < 0.01)
+
+    def test_fingerprints(self):
+        reads = [['@r1', 'ACGTACGTAA', '+', 'IIIIIIIIII'], ['@r2', 'acgtacgtaa', '+', 'IIIIIIIIII'],
+                 ['@r3', 'ACGTACGTCC', '+', 'IIIIIIIIII'], ['@r4', 'ACGTACGTAA', '+', '#IIIIIIIII'],
+                 ['@r5', 'ACGTACGTA', '+', 'IIIIIIIII'], ['@r6', '', '+', '']]
+        chunk = reads_to_chunk(reads)
+        idx = np.arange(len(reads))
+        hasher, qual_hasher = RangeHasher(fold_case=True), RangeHasher(seed=1)
+        values = fingerprints(chunk, idx, hasher).tolist()
+        self.assertEqual(values[0], values[1])
+        self.assertEqual(len(set(values)), 4)  # r1, r2 and r4 have the same sequence
+        self.assertEqual(len(set(fingerprints(chunk, idx, hasher, length=8).tolist())), 2)  # all but r6 alike
+        with_quality = fingerprints(chunk, idx, hasher, qual_hasher, quality=1).tolist()
+        self.assertEqual((with_quality[0] == with_quality[1], with_quality[0] == with_quality[3]), (True, False))
+        self.assertEqual(fingerprints(chunk, idx[2:4], hasher).tolist(), values[2:4])
+        self.assertNotIn(0, values)
+
+    def test_thue_morse(self):  # the classic breaker of polynomial hashes modulo 2 ** 64
+        bits = [bin(i).count('1') % 2 for i in range(2048)]
+        reads = [['@a', ''.join('AC'[bit] for bit in bits), '+', ''],
+                 ['@b', ''.join('CA'[bit] for bit in bits), '+', '']]
+        values = fingerprints(reads_to_chunk(reads, quality=False), np.arange(2), RangeHasher())
+        self.assertNotEqual(values[0], values[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
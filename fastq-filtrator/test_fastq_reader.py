@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from fastq_reader import FastqReader
+
+
+class TestFastqReader(unittest.TestCase):
+    def setUp(self):
+        with open('test.fastq', 'r') as inf:
+            lines = [line.strip() for line in inf]
+        self.reads = [lines[i:i + 4] for i in range(0, len(lines), 4)]
+
+    def test_iter(self):
+        with FastqReader('test.fastq') as reader:
+            records = [(record.name, record.seq, record.qual, len(record), record.lines()) for record in reader]
+        self.assertEqual(len(records), 25)
+        for (name, seq, qual, length, lines), read in zip(records, self.reads):
+            self.assertEqual(name, read[0][1:])
+            self.assertEqual((seq, qual, length, lines), (read[1], read[3], len(read[1]), read))
+
+    def test_raw(self):
+        with FastqReader('test.fastq') as reader:
+            raw = b''.join(bytes(record.raw) for record in reader)
+        with open('test.fastq', 'rb') as inf:
+            self.assertEqual(raw, inf.read())
+
+    def test_chunks(self):
+        with FastqReader('test.fastq') as reader:
+            chunks = list(reader.chunks(10))
+            self.assertEqual([chunk.shape for chunk in chunks], [(6, 10), (6, 10), (6, 5)])
+            starts, seq_starts, seq_ends = chunks[0][0], chunks[0][1], chunks[0][2]
+            self.assertEqual(bytes(reader.view[seq_starts[1]:seq_ends[1]]).decode(), self.reads[1][1])
+            self.assertEqual(chunks[1][0][0], chunks[0][5][-1])
+            self.assertEqual(starts[0], 0)
+
+    def test_range(self):
+        with open('test.fastq', 'rb') as inf:
+            data = inf.read()
+        middle = data.index(b'\n@', len(data) // 2) + 1
+        with FastqReader('test.fastq', 0, middle) as first, FastqReader('test.fastq', middle) as second:
+            names = [record.name for record in first] + [record.name for record in second]
+        self.assertEqual(names, [read[0][1:] for read in self.reads])
+
+    def test_incomplete(self):
+        with open('test.fastq', 'rb') as inf:
+            data = inf.read()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'incomplete.fastq')
+        for tail, n_reads in [(b'', 25), (b'@extra\nACGT\n', 25), (b'@extra\nACGT\n+\nIIII', 26)]:
+            with open(path, 'wb') as ouf:
+                ouf.write(data + tail)
+            with FastqReader(path) as reader:
+                self.assertEqual(sum(1 for _ in reader), n_reads)
+                self.assertEqual(reader.newline_at_eof, tail != b'@extra\nACGT\n+\nIIII')
+
+
+if __name__ == '__main__':
+    unittest.main()
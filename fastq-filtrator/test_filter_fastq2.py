@@ -1,9 +1,26 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
+from adapters import reverse_complement
 from filter_fastq2 import *
 
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class TestFilterFastq2(unittest.TestCase):
     def setUp(self):
+        # every test runs in a directory of its own with a copy of test.fastq, so outputs never outlive it
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        shutil.copy(os.path.join(MODULE_DIR, 'test.fastq'), tmp.name)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
         self.arg_lst_full = ['filter_fastq2.py', '--min_length', '60', '--gc_bounds', '55', '60', '--keep_filtered',
                              '--output_base_name', 'filtered', 'test.fastq']  # full correct input
         self.parsed_args_full = {
@@ -11,6 +28,25 @@ class TestFilterFastq2(unittest.TestCase):
             '--keep_filtered': True,
             '--gc_bounds': [55.0, 60.0],
             '--output_base_name': 'filtered',
+            '--threads': 1,
+            '--compress': None,
+            '--failed_output': None,
+            '--min_mean_quality': 0.0,
+            '--min_base_quality': 0,
+            '--trim_quality': [],
+            '--phred64': False,
+            '--profile': False,
+            '--stats-json': None,
+            '--paired': None,
+            '--resume': False,
+            '--dedup': False,
+            '--dedup_length': None,
+            '--dedup_quality': 0,
+            '--dedup_bloom': None,
+            '--batch': False,
+            '--adapters': None,
+            '--trim_adapters': False,
+            '--metrics_cache': False,
             'fastq_path': 'test.fastq'
         }
         self.parsed_args_no_opt = {
@@ -18,6 +54,25 @@ class TestFilterFastq2(unittest.TestCase):
             '--keep_filtered': False,
             '--gc_bounds': [0.0, 0.0],
             '--output_base_name': 'test',
+            '--threads': 1,
+            '--compress': None,
+            '--failed_output': None,
+            '--min_mean_quality': 0.0,
+            '--min_base_quality': 0,
+            '--trim_quality': [],
+            '--phred64': False,
+            '--profile': False,
+            '--stats-json': None,
+            '--paired': None,
+            '--resume': False,
+            '--dedup': False,
+            '--dedup_length': None,
+            '--dedup_quality': 0,
+            '--dedup_bloom': None,
+            '--batch': False,
+            '--adapters': None,
+            '--trim_adapters': False,
+            '--metrics_cache': False,
             'fastq_path': 'test.fastq'
         }
         self.read1 = ['@test_read1\n',
@@ -108,6 +163,58 @@ class TestFilterFastq2(unittest.TestCase):
             parse_file_name(self.arg_lst_no_file)
             parse_file_name(self.arg_lst_faq)
 
+    def test_parse_threads(self):
+        self.assertEqual(parse_threads(self.arg_lst_no_opt), 1)
+        self.assertEqual(parse_threads(['filter_fastq2.py', '--threads', '4', 'test.fastq']), 4)
+        with self.assertRaises(ValueError):
+            parse_threads(['filter_fastq2.py', '--threads', '0', 'test.fastq'])
+        with self.assertRaises(ValueError):
+            parse_threads(['filter_fastq2.py', '--threads', 'test.fastq'])
+
+    def test_parse_compress(self):
+        self.assertEqual(parse_compress(self.arg_lst_no_opt), None)
+        self.assertEqual(parse_compress(['filter_fastq2.py', '--compress', 'bgzip', 'test.fastq']), 'bgzip')
+        with self.assertRaises(ValueError):
+            parse_compress(['filter_fastq2.py', '--compress', 'rar', 'test.fastq'])
+
+    def test_strip_fastq_extension(self):
+        self.assertEqual(strip_fastq_extension('reads.fastq'), 'reads')
+        self.assertEqual(strip_fastq_extension('reads.fq.gz'), 'reads')
+        self.assertEqual(strip_fastq_extension('reads.fastq.zst'), 'reads')
+        self.assertEqual(strip_fastq_extension('reads.faq'), None)
+
+    def test_parse_failed_output(self):
+        self.assertEqual(parse_failed_output(self.arg_lst_no_opt), None)
+        self.assertEqual(parse_failed_output(['filter_fastq2.py', '--failed_output', 'fifo', '-']), 'fifo')
+        with self.assertRaises(ValueError):
+            parse_failed_output(['filter_fastq2.py', '--failed_output', '-'])
+
+    def test_parse_args_stdin(self):
+        parsed = parse_args(['filter_fastq2.py', '--failed_output', 'fifo', '-'])
+        self.assertEqual((parsed['fastq_path'], parsed['--output_base_name'], parsed['--keep_filtered']),
+                         ('-', '-', True))
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--keep_filtered', '-'])
+
+    def test_output_path(self):
+        self.assertEqual(output_path('reads', 'passed'), 'reads__passed.fastq')
+        self.assertEqual(output_path('reads', 'failed', 'zstd'), 'reads__failed.fastq.zst')
+        self.assertEqual(output_path('-', 'passed', 'gzip'), '-')
+        self.assertEqual(output_path('-', 'failed', None, '/dev/fd/3'), '/dev/fd/3')
+
+    def test_parse_quality(self):
+        args = ['filter_fastq2.py', '--min_mean_quality', '30.5', '--min_base_quality', '2', '--trim_quality', '20',
+                '--phred64', 'test.fastq']
+        self.assertEqual(parse_min_mean_quality(args), 30.5)
+        self.assertEqual(parse_min_base_quality(args), 2)
+        self.assertEqual(parse_trim_quality(args), [20, 4])
+        self.assertEqual(parse_trim_quality(['filter_fastq2.py', '--trim_quality', '20', '5', 'test.fastq']), [20, 5])
+        self.assertEqual(parse_phred64(args), True)
+        with self.assertRaises(ValueError):
+            parse_min_mean_quality(['filter_fastq2.py', '--min_mean_quality', 'high', 'test.fastq'])
+        with self.assertRaises(ValueError):
+            parse_trim_quality(['filter_fastq2.py', '--trim_quality', '20', '0', 'test.fastq'])
+
     def test_parse_args(self):
         self.assertEqual(parse_args(self.arg_lst_full), self.parsed_args_full)
         self.assertEqual(parse_args(self.arg_lst_no_opt), self.parsed_args_no_opt)
@@ -148,6 +255,454 @@ class TestFilterFastq2(unittest.TestCase):
             test_passed = len(inf.readlines())
         self.assertEqual(test_passed, 25 * 4)
 
+    def test_batch_metrics(self):
+        seqs = [self.read1[1].strip(), self.read2[1].strip(), self.read3[1].strip().lower()]
+        lengths, gc_percent = batch_metrics(*seqs_to_array(seqs))
+        self.assertEqual(lengths.tolist(), [len(seq) for seq in seqs])
+        self.assertEqual(gc_percent.tolist(), [gc_count(seq) for seq in seqs])
+
+    def test_batch_valid(self):
+        seqs = [self.read1[1].strip(), self.read2[1].strip(), self.read3[1].strip()]
+        lengths, gc_percent = batch_metrics(*seqs_to_array(seqs))
+        for gc_bounds in [self.gc_bounds1, self.gc_bounds2, self.gc_bounds3, [60.0, 40.0]]:
+            self.assertEqual(batch_valid(lengths, gc_percent, self.minlen, gc_bounds).tolist(),
+                             [valid_gc(seq, gc_bounds) and valid_len(seq, self.minlen) for seq in seqs])
+
+    def test_read_chunk(self):
+        with open('test.fastq', 'r') as inf:
+            chunk = read_chunk(inf, 10)
+            self.assertEqual(len(chunk), 10)
+            self.assertTrue(chunk[0][0].startswith('@SRR1363257.37'))
+            self.assertEqual(len(read_chunk(inf, 100)), 15)
+            self.assertEqual(read_chunk(inf, 100), [])
+
+    def test_split_ranges(self):
+        ranges = split_ranges('test.fastq', 4)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize('test.fastq'))
+        with open('test.fastq', 'rb') as inf:
+            for start, end in ranges:
+                inf.seek(start)
+                self.assertTrue(inf.readline().startswith(b'@SRR'))
+                self.assertEqual(find_record_start(inf, start), start)
+
+    def test_write_to_file_parallel(self):
+        serial_args = dict(self.parsed_args_full, **{'--output_base_name': 'serial'})
+        parallel_args = dict(self.parsed_args_full, **{'--output_base_name': 'parallel', '--threads': 3})
+        self.assertEqual(write_to_file(serial_args), write_to_file(parallel_args))
+        with open('stdout.part0__passed.fastq', 'w') as ouf:  # once the name of a part of the stdout output
+            ouf.write('not a part\n')
+        files = sorted(os.listdir('.'))
+        args = ['--min_length', '60', '--gc_bounds', '55', '60', '--threads', '3', '--output_base_name', '-',
+                'test.fastq']
+        result = subprocess.run([sys.executable, os.path.join(MODULE_DIR, 'filter_fastq2.py')] + args,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        with open('serial__passed.fastq', 'rb') as serial:
+            self.assertEqual(result.stdout, serial.read())
+        self.assertEqual(sorted(os.listdir('.')), files)  # the parts went to a temporary directory
+        with open('stdout.part0__passed.fastq') as inf:
+            self.assertEqual(inf.read(), 'not a part\n')
+        for suffix in ['passed', 'failed']:
+            with open(f'serial__{suffix}.fastq', 'rb') as serial, open(f'parallel__{suffix}.fastq', 'rb') as parallel:
+                self.assertEqual(serial.read(), parallel.read())
+            os.remove(f'serial__{suffix}.fastq')
+            os.remove(f'parallel__{suffix}.fastq')
+
+    def test_write_to_file_compressed(self):
+        with open('test.fastq', 'rb') as inf, gzip.open('test_gz.fastq.gz', 'wb') as ouf:
+            ouf.write(inf.read())
+        for compression in ['gzip', 'bgzip']:
+            args = dict(self.parsed_args_full, **{'fastq_path': 'test_gz.fastq.gz', '--output_base_name': 'gz',
+                                                  '--compress': compression, '--threads': 2})
+            self.assertEqual(write_to_file(args), (2, 23))
+            with gzip.open('gz__failed.fastq.gz', 'rt') as inf:
+                self.assertEqual(len(inf.readlines()), 23 * 4)
+            for suffix in ['passed', 'failed']:
+                os.remove(f'gz__{suffix}.fastq.gz')
+        os.remove('test_gz.fastq.gz')
+
+    def test_write_to_file_parallel_bgzip(self):
+        args = dict(self.parsed_args_full, **{'--output_base_name': 'bgzf', '--compress': 'bgzip', '--threads': 3})
+        self.assertEqual(write_to_file(args), (2, 23))
+        with open('bgzf__failed.fastq.gz', 'rb') as inf:
+            data = inf.read()
+        self.assertTrue(data.endswith(BGZF_EOF))
+        self.assertEqual(data.count(BGZF_EOF), 1)
+        write_to_file(dict(self.parsed_args_full, **{'--output_base_name': 'plain'}))
+        with open('plain__failed.fastq', 'rb') as inf:
+            self.assertEqual(gzip.decompress(data), inf.read())
+        for suffix in ['passed', 'failed']:
+            os.remove(f'bgzf__{suffix}.fastq.gz')
+            os.remove(f'plain__{suffix}.fastq')
+
+    def test_pipeline(self):
+        with open('test.fastq', 'rb') as inf:
+            args = ['--min_length', '60', '--gc_bounds', '55', '60', '--failed_output', 'pipe_failed.fastq', '-']
+            result = subprocess.run([sys.executable, os.path.join(MODULE_DIR, 'filter_fastq2.py')] + args,
+                                    stdin=inf, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        self.assertEqual(result.stdout.count(b'\n'), 2 * 4)
+        self.assertIn(b'2 (8.0%) passed.', result.stderr)
+        with open('pipe_failed.fastq', 'r') as inf:
+            self.assertEqual(len(inf.readlines()), 23 * 4)
+        os.remove('pipe_failed.fastq')
+
+    def test_write_to_file_no_final_newline(self):
+        with open('test.fastq', 'rb') as inf, open('no_newline.fastq', 'wb') as ouf:
+            ouf.write(inf.read().rstrip(b'\n'))
+        args = dict(self.parsed_args_no_opt, **{'fastq_path': 'no_newline.fastq', '--output_base_name': 'no_newline'})
+        self.assertEqual(write_to_file(args), (25, 0))
+        with open('no_newline__passed.fastq', 'rb') as inf, open('test.fastq', 'rb') as expected:
+            self.assertEqual(inf.read(), expected.read())
+        os.remove('no_newline.fastq')
+        os.remove('no_newline__passed.fastq')
+
+    def test_quality_metrics(self):
+        quals = ['IIII', '!!I', '', 'I#']  # Phred+33: I = 40, ! = 0, # = 2
+        data, offsets = seqs_to_array(quals)
+        mean, minimum = quality_metrics(data, offsets[:-1], offsets[1:])
+        self.assertEqual(mean.tolist(), [40.0, 40 / 3, 0.0, 21.0])
+        self.assertEqual(minimum.tolist(), [40, 0, 0, 2])
+        mean, minimum = quality_metrics(data, offsets[:-1], offsets[1:], 64)  # below the offset counts as 0
+        self.assertEqual(minimum.tolist(), [9, 0, 0, 0])
+
+    def test_trim_lengths(self):
+        quals = ['IIIIIIII!!!!', 'IIIII!I!!!!!', '!!!!!!', 'II', '!I', '']
+        data, offsets = seqs_to_array(quals)
+        self.assertEqual(trim_lengths(data, offsets[:-1], offsets[1:], 20, 4).tolist(), [10, 8, 0, 2, 2, 0])
+
+    def test_write_to_file_quality(self):
+        with open('test.fastq', 'rb') as inf, gzip.open('quality.fastq.gz', 'wb') as ouf:
+            ouf.write(inf.read())
+        outputs = []
+        for fastq_path, base in [('test.fastq', 'mapped'), ('quality.fastq.gz', 'lines')]:
+            args = dict(self.parsed_args_full, **{'fastq_path': fastq_path, '--output_base_name': base,
+                                                  '--min_length': 50, '--gc_bounds': [0.0, 0.0],
+                                                  '--min_mean_quality': 30, '--trim_quality': [30, 4]})
+            counts = write_to_file(args)
+            with open(f'{base}__passed.fastq', 'r') as passed, open(f'{base}__failed.fastq', 'r') as failed:
+                outputs.append((counts, passed.read(), failed.read()))
+            os.remove(f'{base}__passed.fastq')
+            os.remove(f'{base}__failed.fastq')
+        os.remove('quality.fastq.gz')
+        self.assertEqual(outputs[0], outputs[1])
+        (passed, failed), passed_reads, _ = outputs[0]
+        self.assertEqual(passed + failed, 25)
+        lines = passed_reads.splitlines()
+        for seq, qual in zip(lines[1::4], lines[3::4]):
+            self.assertEqual(len(seq), len(qual))
+            self.assertTrue(len(seq) >= 50)
+            self.assertTrue(sum(ord(char) - 33 for char in qual[-4:]) >= 30 * 4)
+
+    def test_parse_profile(self):
+        args = ['filter_fastq2.py', '--profile', '--stats-json', 'stats.json', 'test.fastq']
+        self.assertEqual((parse_profile(args), parse_stats_json(args)), (True, 'stats.json'))
+        with self.assertRaises(ValueError):
+            parse_stats_json(['filter_fastq2.py', '--stats-json', '--profile', 'test.fastq'])
+
+    def test_write_to_file_profile(self):
+        with open('test.fastq', 'rb') as inf, gzip.open('profile_gz.fastq.gz', 'wb') as ouf:
+            ouf.write(inf.read())
+        for threads, path in [(1, 'test.fastq'), (1, 'profile_gz.fastq.gz'), (3, 'test.fastq')]:
+            profiler = Profiler()
+            args = dict(self.parsed_args_full, **{'--output_base_name': 'profiled', '--threads': threads,
+                                                  'fastq_path': path})
+            counts = write_to_file(args, profiler=profiler)
+            self.assertEqual(counts, (2, 23))
+            report = profiler.report(*counts)
+            self.assertEqual(report['records'], 25)
+            self.assertEqual(report['filters']['gc'], {'evaluated': 25, 'rejected': 23})  # no read is too short
+            self.assertTrue({'read', 'parse', 'write', 'filter:length', 'filter:gc'} <= set(report['stages']))
+            self.assertEqual(report['input_bytes'], os.path.getsize(path))
+            self.assertEqual(report['output_bytes'], os.path.getsize('test.fastq'))  # nothing trimmed, all kept
+            json.dumps(report)
+            for suffix in ['passed', 'failed']:
+                os.remove(f'profiled__{suffix}.fastq')
+        os.remove('profile_gz.fastq.gz')
+
+    def test_parse_paired(self):
+        self.assertEqual(parse_paired(['filter_fastq2.py', '--paired', 'test.fastq', 'test.fastq']), 'test.fastq')
+        with self.assertRaises(ValueError):
+            parse_paired(['filter_fastq2.py', '--paired', 'test.fastq'])
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--paired', 'test.fastq', '--output_base_name', '-', 'test.fastq'])
+        self.assertEqual(mate_name('@read1/2 comment'), mate_name('@read1/1'))
+
+    def test_write_to_file_paired(self):
+        with open('test.fastq') as inf:
+            reads = read_chunk(inf)
+        with open('mates.fastq', 'w') as ouf:  # R2: the sequence of the next read under each name
+            for read, other in zip(reads, reads[1:] + reads[:1]):
+                ouf.write('\n'.join([read[0], other[1], read[2], other[3]]) + '\n')
+        args = dict(self.parsed_args_full, **{'--output_base_name': 'paired', '--paired': 'mates.fastq',
+                                              '--gc_bounds': [50.0, 80.0]})
+        single = {}
+        for path in ['test.fastq', 'mates.fastq']:
+            write_to_file(dict(args, **{'fastq_path': path, '--output_base_name': 'single'}))
+            with open('single__passed.fastq') as inf:
+                single[path] = {read[0] for read in read_chunk(inf)}
+            os.remove('single__passed.fastq')
+            os.remove('single__failed.fastq')
+        both = single['test.fastq'] & single['mates.fastq']
+        only1, only2 = single['test.fastq'] - both, single['mates.fastq'] - both
+        self.assertTrue(both and only1 and only2)
+        counts = write_to_file_paired(args)
+        self.assertEqual(counts, (len(both), len(only1), len(only2), 25 - len(single['test.fastq'] | only2)))
+        expected = {'R1_passed': both, 'R2_passed': both, 'R1_orphan': only1, 'R2_orphan': only2,
+                    'R1_failed': {read[0] for read in reads} - single['test.fastq'],
+                    'R2_failed': {read[0] for read in reads} - single['mates.fastq']}
+        for suffix, names in expected.items():
+            with open(f'paired__{suffix}.fastq') as inf:
+                self.assertEqual([read[0] for read in read_chunk(inf)], [read[0] for read in reads if read[0] in names])
+            os.remove(f'paired__{suffix}.fastq')
+        with open('mates.fastq', 'w') as ouf:
+            ouf.write(''.join('\n'.join(read) + '\n' for read in reads[:-1]))
+        with self.assertRaises(ValueError):
+            write_to_file_paired(args)
+        for suffix in expected:
+            os.remove(f'paired__{suffix}.fastq')
+        os.remove('mates.fastq')
+
+    def test_resume(self):
+        with open('test.fastq', 'rb') as inf, gzip.open('resume_gz.fastq.gz', 'wb') as ouf:
+            ouf.write(inf.read())
+        for path, compression in [('test.fastq', None), ('resume_gz.fastq.gz', 'bgzip')]:
+            args = dict(self.parsed_args_full, **{'fastq_path': path, '--compress': compression,
+                                                  '--gc_bounds': [50.0, 80.0]})
+            paths = [output_path(base, suffix, compression) for base in ['clean', 'resumed'] for suffix in
+                     ['passed', 'failed']]
+            expected = write_to_file(dict(args, **{'--output_base_name': 'clean'}), chunk_size=5)
+            evaluate = Pipeline.evaluate
+            calls = []
+
+            def crash(pipeline, chunk):  # dies in the third chunk, after two checkpoints
+                calls.append(chunk)
+                if len(calls) == 3:
+                    raise RuntimeError('killed')
+                return evaluate(pipeline, chunk)
+            resumed_args = dict(args, **{'--output_base_name': 'resumed'})
+            with mock.patch.object(Pipeline, 'evaluate', crash), self.assertRaises(RuntimeError):
+                write_to_file(resumed_args, chunk_size=5, checkpoint_interval=0)
+            with open(paths[2], 'ab') as ouf:
+                ouf.write(b'@partial read written after the checkpoint\nAC')
+            with self.assertRaises(ValueError):  # the checkpoint is not silently overwritten
+                write_to_file(resumed_args, chunk_size=5)
+            with self.assertRaises(ValueError):  # nor resumed with other options
+                write_to_file(dict(resumed_args, **{'--min_length': 10, '--resume': True}), chunk_size=5)
+            self.assertEqual(write_to_file(dict(resumed_args, **{'--resume': True}), chunk_size=5), expected)
+            self.assertFalse(os.path.exists('resumed.checkpoint.json'))
+            for clean, resumed in [paths[:3:2], paths[1::2]]:
+                with open(clean, 'rb') as inf_clean, open(resumed, 'rb') as inf_resumed:
+                    if compression is None:
+                        self.assertEqual(inf_clean.read(), inf_resumed.read())
+                    else:
+                        self.assertEqual(gzip.decompress(inf_clean.read()), gzip.decompress(inf_resumed.read()))
+            for path in paths:
+                os.remove(path)
+            with self.assertRaises(ValueError):
+                write_to_file(dict(resumed_args, **{'--resume': True}))
+        os.remove('resume_gz.fastq.gz')
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--resume', '--compress', 'gzip', 'test.fastq'])
+
+    def test_write_to_file_dedup(self):
+        with open('test.fastq') as inf:
+            reads = read_chunk(inf)
+        with open('dup.fastq', 'w') as ouf:  # every read twice, the second copy with another name and 3' end
+            for i, read in enumerate(reads + reads):
+                seq = read[1] if i < len(reads) else read[1][:-3] + 'NNN'
+                ouf.write('\n'.join([f'@read{i}', seq, '+', read[3]]) + '\n')
+        args = dict(self.parsed_args_no_opt, **{'fastq_path': 'dup.fastq', '--output_base_name': 'dup',
+                                                '--keep_filtered': True, '--threads': 2})
+        self.assertEqual(write_to_file(dict(args, **{'--dedup': True})), (50, 0))
+        for suffix in ['passed', 'failed']:
+            os.remove(f'dup__{suffix}.fastq')
+        for options in [{'--dedup_length': 50}, {'--dedup_length': 50, '--dedup_bloom': 1.0}]:
+            pipeline = Pipeline.from_args(dict(args, **dict(options, **{'--dedup': True})))
+            self.assertEqual(write_to_file(dict(args, **dict(options, **{'--dedup': True})), chunk_size=7,
+                                           pipeline=pipeline), (25, 25))
+            self.assertEqual(pipeline.dedup.rejected, 25)
+            with open('dup__passed.fastq') as inf:
+                self.assertEqual([read[0] for read in read_chunk(inf)], [f'@read{i}' for i in range(25)])
+            for suffix in ['passed', 'failed']:
+                os.remove(f'dup__{suffix}.fastq')
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--dedup', '--paired', 'test.fastq', 'test.fastq'])
+        self.assertEqual(parse_args(['filter_fastq2.py', '--dedup_quality', '5', 'test.fastq'])['--dedup'], True)
+        os.remove('dup.fastq')
+
+    def test_write_to_file_adapters(self):
+        with open('test.fastq') as inf:
+            reads = read_chunk(inf)
+        with open('adapters.txt', 'w') as ouf:  # one sequence from a read, one reverse complemented
+            ouf.write(reads[3][1][20:35] + '\n' + reverse_complement(reads[7][1][5:20]) + '\n')
+        args = dict(self.parsed_args_no_opt, **{'--output_base_name': 'adapters', '--keep_filtered': True,
+                                                '--adapters': 'adapters.txt'})
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': tmp}):
+            for options, expected in [({'--threads': 1}, (23, 2)), ({'--threads': 2}, (23, 2)),
+                                      ({'--trim_adapters': True}, (25, 0))]:
+                pipeline = Pipeline.from_args(dict(args, **options))
+                self.assertEqual(write_to_file(dict(args, **options), chunk_size=7, pipeline=pipeline), expected)
+                self.assertEqual(pipeline.adapter_stage().hits.tolist(), [1, 1])
+                with open('adapters__passed.fastq') as inf:
+                    passed = read_chunk(inf)
+                for suffix in ['passed', 'failed']:
+                    os.remove(f'adapters__{suffix}.fastq')
+        self.assertEqual([read[1] for read in passed[:8]], [read[1] for read in reads[:3]] +
+                         [reads[3][1][:20]] + [read[1] for read in reads[4:7]] + [reads[7][1][:5]])
+        self.assertEqual(len(passed[3][3]), 20)
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--trim_adapters', 'test.fastq'])
+
+        with open('adapters.txt', 'w') as ouf:  # short patterns found in many reads, some failing other filters too
+            ouf.write('>a1\nGCGGC\n>a2\nCCGCC\n>a3\nAAGT\n')
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': tmp}):
+            pipeline = Pipeline.from_args(dict(args, **{'--keep_filtered': False}))
+            write_to_file(dict(args, **{'--keep_filtered': False}), pipeline=pipeline)
+            expected = pipeline.adapter_stage().hits.tolist()
+            os.remove('adapters__passed.fastq')
+            self.assertGreater(min(expected), 0)
+            args = dict(self.parsed_args_full, **{'--output_base_name': 'adapters', '--adapters': 'adapters.txt'})
+            for threads, chunk_size, reverse in [(1, 7, False), (1, 3, True), (4, 7, False), (4, 2, False)]:
+                pipeline = Pipeline.from_args(dict(args, **{'--threads': threads}))
+                if reverse:
+                    pipeline.filters.reverse()
+                write_to_file(dict(args, **{'--threads': threads}), chunk_size=chunk_size, pipeline=pipeline)
+                self.assertEqual(pipeline.adapter_stage().hits.tolist(), expected)
+                for suffix in ['passed', 'failed']:
+                    os.remove(f'adapters__{suffix}.fastq')
+            summaries = []
+            for threads in ['1', '4']:  # the summary and the stats JSON report the same counts
+                result = subprocess.run([sys.executable, os.path.join(MODULE_DIR, 'filter_fastq2.py'), '--adapters',
+                                         'adapters.txt', '--min_length', '60', '--gc_bounds', '55', '60', '--threads',
+                                         threads, '--stats-json', 'stats.json', '--output_base_name', 'adapters',
+                                         'test.fastq'], env=dict(os.environ, XDG_CACHE_HOME=tmp),
+                                        stdout=subprocess.PIPE, check=True, text=True)
+                summaries.append(result.stdout.splitlines()[-4:])
+                self.assertEqual(summaries[-1][0],
+                                 f'{sum(expected)} ({sum(expected) * 4.0}%) reads failed for adapters:')  # of 25
+                with open('stats.json') as inf:
+                    self.assertEqual(json.load(inf)['adapters'], {'a1': expected[0], 'a2': expected[1],
+                                                                  'a3': expected[2]})
+                os.remove('stats.json')
+                os.remove('adapters__passed.fastq')
+            self.assertEqual(summaries[0], summaries[1])
+        os.remove('adapters.txt')
+
+    def test_write_to_file_metrics(self):
+        args = dict(self.parsed_args_no_opt, **{'--keep_filtered': True})
+        for options in [{'--min_length': 60}, {'--gc_bounds': [45.0, 55.0], '--min_mean_quality': 30.0},
+                        {'--min_base_quality': 5, '--phred64': True}, {}]:
+            expected = write_to_file(dict(args, **dict(options, **{'--output_base_name': 'plain'})))
+            pipeline = Pipeline.from_args(dict(args, **options))
+            counts = write_to_file(dict(args, **dict(options, **{'--output_base_name': 'cached',
+                                                                 '--metrics_cache': True})), pipeline=pipeline)
+            self.assertEqual(counts, expected)
+            self.assertEqual(sum(stage.rejected for stage in pipeline.filters), expected[1])
+            for suffix in ['passed', 'failed']:
+                with open(f'plain__{suffix}.fastq') as plain, open(f'cached__{suffix}.fastq') as cached:
+                    self.assertEqual(cached.read(), plain.read())
+                os.remove(f'plain__{suffix}.fastq')
+                os.remove(f'cached__{suffix}.fastq')
+        self.assertTrue(os.path.isfile('test.fastq.metrics/meta.json'))
+        shutil.rmtree('test.fastq.metrics')
+        for args_lst in [['--metrics_cache', '--trim_quality', '20', 'test.fastq'], ['--metrics_cache', '-'],
+                         ['--metrics_cache', '--dedup', 'test.fastq']]:
+            with self.assertRaises(ValueError):
+                parse_args(['filter_fastq2.py'] + args_lst)
+
+    def test_write_to_file_batch(self):
+        os.makedirs('batch_in', exist_ok=True)
+        shutil.copy('test.fastq', 'batch_in/a.fastq')
+        with open('test.fastq', 'rb') as inf, gzip.open('batch_in/b.fq.gz', 'wb') as ouf:
+            ouf.write(inf.read())
+        with open('test.fastq') as inf, open('batch_in/c.fastq', 'w') as ouf:  # the first 10 reads
+            ouf.writelines(line + '\n' for read in read_chunk(inf, 10) for line in read)
+        with open('batch_in/notes.txt', 'w') as ouf:
+            ouf.write('not a FASTQ file\n')
+        single_args = dict(self.parsed_args_full, **{'--output_base_name': 'single', '--keep_filtered': True})
+        expected = write_to_file(single_args)
+        args = dict(single_args, **{'--batch': True, 'fastq_path': 'batch_in', '--output_base_name': 'batch_out',
+                                    '--threads': 3})
+        results = write_to_file_batch(args, chunk_size=7)
+        self.assertEqual([result[:2] for result in results], [('batch_in/a.fastq', 'batch_out/a'),
+                                                              ('batch_in/b.fq.gz', 'batch_out/b'),
+                                                              ('batch_in/c.fastq', 'batch_out/c')])
+        self.assertEqual([result[2:4] for result in results[:2]], [expected, expected])
+        self.assertEqual(sum(results[2][2:4]), 10)
+        for suffix in ['passed', 'failed']:
+            with open(f'single__{suffix}.fastq', 'rb') as inf:
+                single = inf.read()
+            for base in ['a', 'b']:
+                with open(f'batch_out/{base}__{suffix}.fastq', 'rb') as inf:
+                    self.assertEqual(inf.read(), single)
+            os.remove(f'single__{suffix}.fastq')
+        self.assertEqual(sorted(os.listdir('batch_out')),
+                         sorted(f'{base}__{suffix}.fastq' for base in 'abc' for suffix in ['passed', 'failed']))
+        self.assertIn('total', format_batch_summary(results).splitlines()[-1])
+        self.assertNotIn('duplicates', format_batch_summary(results))
+        with self.assertRaises(ValueError):  # the outputs exist
+            write_to_file_batch(args)
+        shutil.rmtree('batch_out')
+
+        with open('test.fastq') as inf:
+            reads = read_chunk(inf)
+        with open('batch_in/d.fastq', 'w') as ouf:  # every read twice
+            ouf.writelines(line + '\n' for read in reads + reads for line in read)
+        with open('adapters.txt', 'w') as ouf:
+            ouf.write(reads[3][1][20:35] + '\n')
+        args = dict(self.parsed_args_no_opt, **{'--batch': True, 'fastq_path': 'batch_in', '--threads': 3,
+                                                '--output_base_name': 'batch_out', '--dedup': True,
+                                                '--adapters': 'adapters.txt'})
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': tmp}):
+            results = write_to_file_batch(args)
+        self.assertEqual([result[4:] for result in results], [(0, 1), (0, 1), (0, 1), (24, 2)])
+        summary = format_batch_summary(results).splitlines()
+        self.assertEqual(summary[0].split()[-4:], ['duplicates', '%', 'adapters', '%'])
+        self.assertEqual(summary[-1].split()[-4:], ['24', '21.82', '5', '4.55'])  # of 110 reads
+        shutil.rmtree('batch_out')
+        os.remove('batch_in/d.fastq')
+
+        with open('adapters.txt', 'w') as ouf:  # short patterns found in many reads, some failing other filters too
+            ouf.write('>a1\nGCGGC\n>a2\nCCGCC\n>a3\nAAGT\n')
+        args = dict(self.parsed_args_full, **{'--adapters': 'adapters.txt', '--keep_filtered': False})
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': tmp}):
+            expected = []
+            for fastq_path in ['batch_in/a.fastq', 'batch_in/c.fastq']:
+                pipeline = Pipeline.from_args(dict(args, fastq_path=fastq_path))
+                write_to_file(dict(args, fastq_path=fastq_path), pipeline=pipeline)
+                expected.append(int(pipeline.adapter_stage().hits.sum()))
+                os.remove('filtered__passed.fastq')
+            self.assertGreater(min(expected), 0)
+            for chunk_size in [7, 2]:  # the adapters column of a file matches its single-file run
+                results = write_to_file_batch(dict(args, **{'--batch': True, 'fastq_path': 'batch_in', '--threads': 3,
+                                                            '--output_base_name': 'batch_out'}), chunk_size=chunk_size)
+                self.assertEqual([results[0][5], results[2][5]], expected)
+                shutil.rmtree('batch_out')
+        os.remove('adapters.txt')
+
+        with open('batch_in/manifest.tsv', 'w') as ouf:
+            ouf.write('# input\toutput\nbatch_in/c.fastq\tbatch_c\n\nbatch_in/a.fastq\n')
+        self.assertEqual(batch_inputs('batch_in/manifest.tsv'), [('batch_in/c.fastq', 'batch_c'),
+                                                                 ('batch_in/a.fastq', 'a')])
+        with open('batch_in/manifest.tsv', 'w') as ouf:
+            ouf.write('batch_in/a.fastq\nbatch_in/a.fastq\n')
+        with self.assertRaises(ValueError):  # both would be written to a__passed.fastq
+            batch_inputs('batch_in/manifest.tsv')
+        with self.assertRaises(ValueError):
+            parse_args(['filter_fastq2.py', '--batch', '--paired', 'test.fastq', 'batch_in'])
+        self.assertEqual(parse_args(['filter_fastq2.py', '--batch', 'batch_in'])['--output_base_name'], '')
+        shutil.rmtree('batch_in')
+
+    def test_fastq_writer(self):
+        with FastqWriter('writer_test.fastq', flush_size=100) as ouf:
+            ouf.write([line.strip() for line in self.read3])
+            self.assertEqual(ouf.buffered, 34)  # below flush_size, nothing written yet
+            ouf.write([line.strip() for line in self.read1])
+            self.assertEqual(ouf.buffer, [])
+        with open('writer_test.fastq', 'r') as inf:
+            self.assertEqual(inf.readlines(), self.read3 + self.read1)
+        os.remove('writer_test.fastq')
+
 
 if __name__ == '__main__':
     unittest.main()
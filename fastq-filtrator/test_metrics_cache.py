@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from fastq_reader import FastqReader
+from metrics_cache import ReadMetrics, get_metrics, load_metrics, metrics_path
+from pipeline import quality_metrics, range_metrics
+
+
+class TestMetricsCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'reads.fastq')
+        with open(self.path, 'w', newline='') as ouf:
+            for i, size in enumerate(rng.integers(0, 60, size=200)):
+                seq = ''.join(rng.choice(list('ACGTNgc'), size=size))
+                qual = ''.join(chr(c) for c in rng.integers(35, 75, size=size))
+                line_end = '\r\n' if i % 9 == 4 else '\n'
+                ouf.write(line_end.join([f'@read{i}', seq, '+', qual]) + ('' if i == 199 else line_end))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_compute(self):
+        metrics = ReadMetrics.compute(self.path, chunk_size=16)
+        with FastqReader(self.path) as reader:
+            starts, seq_starts, seq_ends, qual_starts, qual_ends, _ = np.concatenate(list(reader.chunks(1000)), axis=1)
+            self.assertEqual(metrics.offsets.tolist(), starts.tolist() + [os.path.getsize(self.path)])
+            lengths, gc_percent = range_metrics(reader.array, seq_starts, seq_ends)
+            idx = np.arange(len(metrics))
+            self.assertEqual(metrics.lengths.tolist(), lengths.tolist())
+            self.assertEqual(metrics.gc_percent(idx).tolist(), gc_percent.tolist())
+            for offset in [33, 64]:
+                mean, minimum = quality_metrics(reader.array, qual_starts, qual_ends, offset)
+                self.assertEqual(metrics.mean_quality(idx, offset).tolist(), mean.tolist())
+                self.assertEqual(metrics.min_quality(idx, offset).tolist(), minimum.tolist())
+        part = metrics.slice(10, 20)
+        self.assertEqual((len(part), part.offsets.tolist()), (10, metrics.offsets[10:21].tolist()))
+
+    def test_sidecar(self):
+        self.assertIsNone(load_metrics(self.path))
+        built = get_metrics(self.path)
+        loaded = load_metrics(self.path)
+        self.assertIsInstance(loaded.lengths, np.memmap)
+        for column in ['offsets', 'lengths', 'gc', 'qual_sums', 'qual_min']:
+            self.assertEqual(getattr(loaded, column).tolist(), getattr(built, column).tolist())
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # the input changed since
+        self.assertIsNone(load_metrics(self.path))
+        self.assertEqual(len(get_metrics(self.path)), 200)
+        self.assertIsNotNone(load_metrics(self.path))
+        with open(os.path.join(metrics_path(self.path), 'gc.npy'), 'r+b') as ouf:
+            ouf.truncate(200)
+        self.assertIsNone(load_metrics(self.path))
+
+    def test_invalid(self):
+        with open(self.path, 'w') as ouf:
+            ouf.write('@read\nACGT\n+\nIII\n')
+        self.assertRaises(ValueError, ReadMetrics.compute, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import numpy as np
+from adapters import Automaton
+from filter_fastq2 import parse_args, seqs_to_array
+from pipeline import AdapterFilter, AdapterTrimmer, Chunk, DedupFilter, Filter, GcFilter, LengthFilter, \
+    MeanQualityFilter, MinQualityFilter, Pipeline, QualityTrimmer
+
+
+def make_chunk(seqs, quals):
+    seq_data, seq_offsets = seqs_to_array(seqs)
+    qual_data, qual_offsets = seqs_to_array(quals)
+    return Chunk(seq_data, seq_offsets[:-1], seq_offsets[1:], qual_data, qual_offsets[:-1], qual_offsets[1:])
+
+
+class CountingFilter(Filter):
+    """Keeps every read and remembers how many it was given."""
+    name = 'counting'
+
+    def __init__(self):
+        super().__init__()
+        self.given = []
+
+    def batch(self, chunk, idx):
+        self.given.append(len(idx))
+        return np.ones(len(idx), dtype=bool)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.seqs = ['GGGGCCCC', 'AAAA', 'GCGCAT', 'ATATATATAT', '']
+        self.quals = ['IIIIIIII', 'IIII', '!!!!!!', 'IIIIII!!!!', '']
+
+    def test_stages(self):
+        chunk = make_chunk(self.seqs, self.quals)
+        idx = np.arange(len(chunk))
+        self.assertEqual(LengthFilter(5).batch(chunk, idx).tolist(), [True, False, True, True, False])
+        self.assertEqual(GcFilter([50.0, 100.0]).batch(chunk, idx).tolist(), [True, False, True, False, False])
+        self.assertEqual(GcFilter([50.0, 100.0]).batch(chunk, idx[[1, 2]]).tolist(), [False, True])
+        self.assertEqual(MeanQualityFilter(20).batch(chunk, idx).tolist(), [True, True, False, True, False])
+        self.assertEqual(MinQualityFilter(20).batch(chunk, idx).tolist(), [True, True, False, False, False])
+
+    def test_evaluate(self):
+        pipeline = Pipeline([LengthFilter(5), GcFilter([50.0, 100.0]), MinQualityFilter(20)])
+        mask, lengths = pipeline.evaluate(make_chunk(self.seqs, self.quals))
+        self.assertEqual(mask.tolist(), [True, False, False, False, False])
+        self.assertEqual(lengths.tolist(), [8, 4, 6, 10, 0])
+
+    def test_trim(self):
+        pipeline = Pipeline([LengthFilter(5)], [QualityTrimmer(20, 2)])
+        mask, lengths = pipeline.evaluate(make_chunk(self.seqs, self.quals))
+        self.assertEqual(lengths.tolist(), [8, 4, 0, 7, 0])
+        self.assertEqual(mask.tolist(), [True, False, False, True, False])
+
+    def test_short_circuit(self):
+        counting = CountingFilter()
+        pipeline = Pipeline([LengthFilter(5), counting], reorder=False)
+        pipeline.evaluate(make_chunk(self.seqs, self.quals))
+        self.assertEqual(counting.given, [3])
+        self.assertEqual((pipeline.filters[0].evaluated, pipeline.filters[0].rejected), (5, 2))
+        self.assertEqual((counting.evaluated, counting.rejected), (3, 0))
+
+    def test_reorder(self):
+        counting = CountingFilter()
+        length = LengthFilter(5)
+        pipeline = Pipeline([counting, length])
+        chunk = make_chunk(self.seqs, self.quals)
+        first, _ = pipeline.evaluate(chunk)
+        self.assertEqual(pipeline.filters, [length, counting])  # a filter that rejects nothing goes last
+        second, _ = pipeline.evaluate(chunk)
+        self.assertEqual(counting.given, [5, 3])
+        self.assertEqual(first.tolist(), second.tolist())
+        self.assertEqual(length.rejection_rate(), 0.4)
+
+    def test_from_args(self):
+        pipeline = Pipeline.from_args(parse_args(['filter_fastq2.py', 'test.fastq']))
+        self.assertEqual((pipeline.filters, pipeline.trimmers, pipeline.needs_quality()), ([], [], False))
+        mask, _ = pipeline.evaluate(make_chunk(self.seqs, self.quals))
+        self.assertTrue(mask.all())
+        pipeline = Pipeline.from_args(parse_args(['filter_fastq2.py', '--min_length', '5', '--gc_bounds', '40', '60',
+                                                  '--min_mean_quality', '20', '--trim_quality', '20', '--phred64',
+                                                  'test.fastq']))
+        self.assertEqual([stage.name for stage in pipeline.filters], ['length', 'gc', 'mean_quality'])
+        self.assertEqual([(stage.quality, stage.window, stage.offset) for stage in pipeline.trimmers], [(20, 4, 64)])
+        self.assertTrue(pipeline.needs_quality())
+        self.assertFalse(pipeline.supports_metrics())  # trimming changes the reads the metrics were taken of
+        self.assertTrue(Pipeline(pipeline.filters).supports_metrics())
+
+    def test_dedup(self):  # a copy that fails another filter does not make the next copy a duplicate
+        seqs = ['GGGG', 'GGGGCCCC', 'GGGGCCCC', 'AAAAAAAA', 'GGGG', 'GGGGCCCC']
+        quals = ['!!!!', 'IIIIIIII', 'IIIIIIII', 'IIIIIIII', 'IIII', 'IIIIIIII']
+        dedup = DedupFilter()
+        pipeline = Pipeline([MeanQualityFilter(20)], dedup=dedup)
+        mask, _ = pipeline.evaluate(make_chunk(seqs[:3], quals[:3]))
+        self.assertEqual(mask.tolist(), [False, True, False])
+        mask, _ = pipeline.evaluate(make_chunk(seqs[3:], quals[3:]))
+        self.assertEqual(mask.tolist(), [True, True, False])  # duplicates are found across chunks
+        self.assertEqual((dedup.evaluated, dedup.rejected), (5, 2))
+        self.assertEqual(pipeline.stages()[-1], dedup)
+        self.assertTrue(DedupFilter(quality=4).uses_quality)
+        self.assertEqual(Pipeline.from_args(parse_args(['filter_fastq2.py', '--dedup_bloom', '2', 'test.fastq']))
+                         .dedup.index.nbytes, 2 ** 21)
+
+    def test_adapters(self):
+        automaton = Automaton.build([('a', 'GCGC'), ('b', 'TATA')])
+        adapter = AdapterFilter(automaton)
+        mask, lengths = Pipeline(adapters=adapter).evaluate(make_chunk(self.seqs, self.quals))
+        self.assertEqual(mask.tolist(), [True, True, False, False, True])
+        self.assertEqual(adapter.hits.tolist(), [1, 1])
+        # the adapter stage runs first, so the counts do not depend on the order of the other filters
+        for filters in [[LengthFilter(5), MinQualityFilter(20)], [MinQualityFilter(20), LengthFilter(5)]]:
+            adapter = AdapterFilter(automaton)
+            pipeline = Pipeline(filters, adapters=adapter, reorder=False)
+            mask, _ = pipeline.evaluate(make_chunk(self.seqs, self.quals))
+            self.assertEqual(mask.tolist(), [True, False, False, False, False])
+            self.assertEqual((pipeline.stages()[0], adapter.hits.tolist()), (adapter, [1, 1]))
+        trimmer = AdapterTrimmer(automaton)
+        pipeline = Pipeline([LengthFilter(3)], [trimmer])
+        mask, lengths = pipeline.evaluate(make_chunk(self.seqs, self.quals))
+        self.assertEqual(lengths.tolist(), [8, 4, 0, 1, 0])
+        self.assertEqual(mask.tolist(), [True, True, False, False, False])
+        self.assertEqual(pipeline.adapter_stage(), trimmer)
+        other = Pipeline([LengthFilter(3)], [AdapterTrimmer(automaton)])
+        other.evaluate(make_chunk(self.seqs, self.quals))
+        pipeline.merge(other)
+        self.assertEqual(trimmer.hits.tolist(), [2, 2])
+        self.assertEqual((pipeline.filters[0].evaluated, pipeline.filters[0].rejected), (10, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import io
+import unittest
+
+from profiling import NULL_PROFILER, Profiler, format_report
+
+
+class TestProfiling(unittest.TestCase):
+    def test_stage(self):
+        profiler = Profiler()
+        for _ in range(3):
+            with profiler.stage('read'):
+                sum(range(1000))
+        self.assertEqual(profiler.stage('read').calls, 3)
+        self.assertTrue(profiler.stage('read').wall > 0)
+        with NULL_PROFILER.stage('read'):
+            NULL_PROFILER.advance(10)
+
+    def test_progress(self):
+        stream = io.StringIO()
+        profiler = Profiler(label='test', progress_interval=0, total_bytes=200, stream=stream)
+        profiler.advance(10, 50)
+        self.assertTrue(stream.getvalue().startswith('[test] 10 reads in '))
+        self.assertIn('25.0% of input', stream.getvalue())
+        quiet = Profiler(stream=stream)
+        quiet.advance(10, 50)
+        self.assertEqual(stream.getvalue().count('\n'), 1)
+
+    def test_merge_report(self):
+        first, second = Profiler(), Profiler()
+        for profiler, records in [(first, 10), (second, 5)]:
+            with profiler.stage('write'):
+                pass
+            profiler.filters['gc'] = {'evaluated': records, 'rejected': 1}
+            profiler.advance(records, records * 100)
+            profiler.bytes_out = records * 10
+        first.merge(second)
+        report = first.report(12, 3, input='test.fastq')
+        self.assertEqual((report['records'], report['input_bytes'], report['output_bytes']), (15, 1500, 150))
+        self.assertEqual(report['stages']['write']['calls'], 2)
+        self.assertEqual(report['filters']['gc'], {'evaluated': 15, 'rejected': 2})
+        self.assertEqual(report['input'], 'test.fastq')
+        self.assertIn('filter gc: 2 of 15 evaluated reads rejected', format_report(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
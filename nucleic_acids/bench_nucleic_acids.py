@@ -0,0 +1,94 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from nucleic_acids import Dna, batch_reverse_complement
+
+
+class StrDna:
+    """The pre-packing storage: an upper-case str and an iterator index in the instance __dict__. For comparison."""
+    def __init__(self, seq):
+        self.seq = seq.upper()
+        self.index = 0
+
+
+def validate_per_base(seq):
+    """The pre-table validation loop of NucleicAcid.__init__, quadratic in the sequence length. For comparison."""
+    seq = seq.upper()
+    for i in seq:
+        if 'T' in seq and 'U' in seq:
+            raise ValueError('Wrong sequence: T and U cannot be found together in a nucleic acid sequence.')
+        if i not in {'A', 'C', 'T', 'G', 'U'}:
+            raise ValueError(seq + ' is not a nucleic acid sequence.')
+
+
+def reverse_complement_per_base(seq):
+    """The pre-table Dna.reverse_complement: a dict lookup per base and two joins. For comparison."""
+    chargaff = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G'}
+    comp = ''.join([chargaff.get(base, base) for base in list(seq)])
+    return ''.join(reversed(comp))
+
+
+def random_seqs(n_seqs, length, seed=42):
+    rng = random.Random(seed)
+    return [''.join(rng.choice('ACGT') for _ in range(length)) for _ in range(n_seqs)]
+
+
+def bench_memory(cls, seqs):
+    """Bytes allocated per object for holding `cls` objects made from `seqs` (the input strings not counted)."""
+    tracemalloc.start()
+    objects = [cls(seq) for seq in seqs]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current / len(seqs)
+
+
+def bench_construction(lengths, max_per_base=10 ** 4):
+    """Seconds to validate one sequence of each length with the per-base loop (up to `max_per_base`), and to make a
+    Dna with and without validation."""
+    results = {}
+    for length in lengths:
+        seq = random_seqs(1, length)[0]
+        timings = []
+        for func in [validate_per_base, Dna, Dna.from_trusted]:
+            if func is validate_per_base and length > max_per_base:
+                timings.append(None)
+                continue
+            start = time.perf_counter()
+            func(seq)
+            timings.append(time.perf_counter() - start)
+        results[length] = timings
+    return results
+
+
+def bench_reverse_complement(seqs):
+    """Sequences/s of reverse-complementing str reads with the per-base loop, Dna objects and the batch function."""
+    dnas = [Dna(seq) for seq in seqs]
+    results = {}
+    for name, func in [('per-base loop', lambda: [reverse_complement_per_base(seq) for seq in seqs]),
+                       ('Dna method', lambda: [dna.reverse_complement() for dna in dnas]),
+                       ('batch function', lambda: batch_reverse_complement(seqs))]:
+        start = time.perf_counter()
+        func()
+        results[name] = len(seqs) / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    n_seqs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'{n_seqs} random DNA sequences, bytes per sequence object')
+    for length in [50, 150, 1000, 10000]:
+        seqs = random_seqs(n_seqs if length < 10000 else n_seqs // 10, length)
+        before = bench_memory(StrDna, seqs)
+        after = bench_memory(Dna, seqs)
+        print(f'{length:>6} bp: str {before:10.0f}, packed {after:10.0f} ({before / after:.2f}x smaller)')
+    print('construction, seconds (ns per base)')
+    for length, timings in bench_construction([10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]).items():
+        cells = ['-' if t is None else f'{t:.4f} ({t / length * 1e9:.1f})' for t in timings]
+        print(f'{length:>9} bp: per-base loop {cells[0]:>18}, Dna {cells[1]:>18}, from_trusted {cells[2]:>18}')
+    print(f'reverse complement, {n_seqs * 10} reads of 150 bp')
+    results = bench_reverse_complement(random_seqs(n_seqs * 10, 150))
+    for name, seqs_per_sec in results.items():
+        print(f'{name + ":":<16} {seqs_per_sec:12.0f} reads/s ({seqs_per_sec / results["per-base loop"]:.1f}x)')
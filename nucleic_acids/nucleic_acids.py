@@ -1,84 +1,215 @@
+import numpy as np
+
+# 2-bit codes of the bases: A = 0, C = 1, G = 2, T/U = 3, four bases per byte with the first one in the high bits
+CODES = np.zeros(256, dtype=np.uint8)
+for code, bases in enumerate([b'Aa', b'Cc', b'Gg', b'TtUu']):
+    CODES[list(bases)] = code
+LETTERS = {False: np.frombuffer(b'ACGT', dtype=np.uint8), True: np.frombuffer(b'ACGU', dtype=np.uint8)}
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+GC_PER_BYTE = np.array([sum((byte >> shift) & 3 in (1, 2) for shift in (6, 4, 2, 0)) for byte in range(256)],
+                       dtype=np.int64)  # G and C bases in each packed byte; padding is A and counts as 0
+ITER_BLOCK = 4096  # bases unpacked at a time by __iter__
+# packed byte -> its four bases, and -> the reverse complement of them; a str join of these is faster than NumPy for
+# sequences of up to TABLE_MAX bases
+UNPACKED = {rna: [''.join(letters[(byte >> shift) & 3] for shift in (6, 4, 2, 0)) for byte in range(256)]
+            for rna, letters in [(False, 'ACGT'), (True, 'ACGU')]}
+REVERSE_COMPLEMENTED = {rna: [''.join(letters[3 - ((byte >> shift) & 3)] for shift in (0, 2, 4, 6))
+                              for byte in range(256)] for rna, letters in [(False, 'ACGT'), (True, 'ACGU')]}
+TABLE_MAX = 1024
+NUCLEOTIDES = b'ACGTU'  # what any nucleic acid may contain; Dna and Rna allow a part of it
+COMPLEMENT_BYTES = bytes(byte ^ 0xFF for byte in range(256))  # complements the four bases of a packed byte (code ^ 3)
+
+# tables for plain str sequences; other characters (N, gaps) are kept as they are
+DNA_COMPLEMENT = str.maketrans('ACGTacgt', 'TGCAtgca')
+DNA_TRANSCRIBE = str.maketrans('ACGTacgt', 'UGCAugca')
+
+
+def pack(codes):
+    """Pack an array of 2-bit base codes into bytes, four per byte, padding the last byte with A."""
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    return np.bitwise_or.reduce(padded.reshape(-1, 4) << SHIFTS, axis=1).astype(np.uint8).tobytes()
+
+
 class NucleicAcid:
-    def __init__(self, seq):
-        alphabet = {'A', 'C', 'T', 'G', 'U'}
-        self.seq = seq
-        if type(self.seq) is not str:
-            raise TypeError(f'{self.seq} is not a nucleic acid sequence.')
-        if self.seq == '':
+    """A nucleic acid sequence stored 2-bit packed: four bases per byte, plus whether it has U instead of T.
+
+    The sequence is unpacked to a str only when asked for with `seq`; length, indexing, slicing, iteration and
+    GC-content work on the packed bytes.
+    """
+    __slots__ = ('_packed', '_length', '_uracil')
+    _kind = 'nucleic acid'
+    _bases = NUCLEOTIDES
+    _rna = None  # whether the sequence is RNA: known for Dna and Rna, told by the presence of U otherwise
+
+    def __init__(self, seq, validate=True):
+        """Make a sequence from a str. With validate=False only the alphabet is checked, in one pass and without
+        upper-casing (see from_trusted)."""
+        raw = self._validate(seq) if validate else self._check_bases(seq)
+        rna = self._rna if self._rna is not None else b'U' in raw or b'u' in raw
+        self._set(CODES[np.frombuffer(raw, dtype=np.uint8)], rna)
+
+    @classmethod
+    def _check_bases(cls, seq):
+        """Return a str of bases in either case as bytes, raising ValueError for anything else (e.g. N), which CODES
+        would silently turn into A."""
+        raw = seq.encode('ascii')
+        if raw.translate(None, NUCLEOTIDES + NUCLEOTIDES.lower()):
+            raise ValueError(f'{seq.upper()} is not a nucleic acid sequence.')
+        if raw.translate(None, cls._bases + cls._bases.lower()):
+            raise ValueError(f'{seq.upper()} is not a {cls._kind} sequence.')
+        if cls._rna is None and (b'U' in raw or b'u' in raw) and (b'T' in raw or b't' in raw):
+            raise ValueError('Wrong sequence: T and U cannot be found together in a nucleic acid sequence.')
+        return raw
+
+    @classmethod
+    def _validate(cls, seq):
+        """Check a sequence in linear time and return it upper-cased as bytes."""
+        if type(seq) is not str:
+            raise TypeError(f'{seq} is not a nucleic acid sequence.')
+        if seq == '':
             raise ValueError('Please specify a non-empty sequence.')
-        self.seq = seq.upper()
-        self.index = 0
-        for i in self.seq:
-            if 'T' in self.seq and 'U' in self.seq:
-                raise ValueError('Wrong sequence: T and U cannot be found together in a nucleic acid sequence.')
-            if i not in alphabet:
-                raise ValueError(self.seq + ' is not a nucleic acid sequence.')
+        if not seq.isascii():
+            raise ValueError(f'{seq.upper()} is not a nucleic acid sequence.')
+        raw = seq.encode('ascii').upper()
+        if b'T' in raw and b'U' in raw:
+            raise ValueError('Wrong sequence: T and U cannot be found together in a nucleic acid sequence.')
+        if raw.translate(None, NUCLEOTIDES):  # anything left after deleting the bases of any nucleic acid
+            raise ValueError(f'{seq.upper()} is not a nucleic acid sequence.')
+        if raw.translate(None, cls._bases):  # a T in RNA or a U in DNA
+            raise ValueError(f'{seq.upper()} is not a {cls._kind} sequence.')
+        return raw
+
+    @classmethod
+    def from_trusted(cls, seq):
+        """Make a sequence from a str that is known to be valid, e.g. a read that passed filter_fastq2, skipping the
+        type check and upper-casing. Characters outside the alphabet still raise ValueError."""
+        return cls(seq, validate=False)
+
+    def _set(self, codes, uracil):
+        self._packed = pack(codes)
+        self._length = len(codes)
+        self._uracil = uracil
+
+    @classmethod
+    def _from_codes(cls, codes, uracil):
+        """Make an object of this class from base codes, without validation."""
+        obj = cls.__new__(cls)
+        obj._set(codes, uracil)
+        return obj
+
+    @classmethod
+    def _from_packed(cls, packed, length, uracil):
+        obj = cls.__new__(cls)
+        obj._packed = packed
+        obj._length = length
+        obj._uracil = uracil
+        return obj
+
+    def _complemented(self, cls):
+        """The complementary sequence as an object of `cls`, made by flipping the packed bits."""
+        packed = self._packed.translate(COMPLEMENT_BYTES)
+        if self._length % 4:  # padding must stay A
+            packed = packed[:-1] + bytes([packed[-1] & (0xFF << 2 * (4 - self._length % 4)) & 0xFF])
+        return cls._from_packed(packed, self._length, cls._rna if cls._rna is not None else self._uracil)
+
+    def _codes(self, start, stop):
+        """Unpack the codes of bases start to stop (0 <= start <= stop <= len(self))."""
+        packed = np.frombuffer(self._packed, dtype=np.uint8, count=(stop + 3) // 4 - start // 4, offset=start // 4)
+        codes = ((packed[:, None] >> SHIFTS) & 3).ravel()
+        return codes[start % 4:start % 4 + stop - start]
+
+    def _unpack(self, start, stop):
+        if stop - start <= TABLE_MAX:
+            unpacked = ''.join(map(UNPACKED[self._uracil].__getitem__, self._packed[start // 4:(stop + 3) // 4]))
+            return unpacked[start % 4:start % 4 + stop - start]
+        return LETTERS[self._uracil][self._codes(start, stop)].tobytes().decode('ascii')
+
+    @property
+    def seq(self):
+        """The sequence as an upper-case str."""
+        return self._unpack(0, self._length)
+
+    def __str__(self):
+        return self.seq
 
     def __len__(self):
-        return len(self.seq)
+        return self._length
 
     def __iter__(self):
-        return self
+        for start in range(0, self._length, ITER_BLOCK):
+            yield from self._unpack(start, min(start + ITER_BLOCK, self._length))
 
-    def __next__(self):
-        try:
-            result = self.seq[self.index]
-        except IndexError:
-            raise StopIteration
-        self.index += 1
-        return result
+    def __getitem__(self, key):
+        """A base as a str for an int key; a sequence of the same class for a slice."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                codes = self._codes(start, max(start, stop))
+            else:
+                codes = self._codes(0, self._length)[np.arange(start, stop, step)]
+            return self._from_codes(codes, self._uracil)
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('sequence index out of range')
+        code = (self._packed[key // 4] >> (6 - 2 * (key % 4))) & 3
+        return 'ACGU'[code] if self._uracil and code == 3 else 'ACGT'[code]
 
     def gc_content(self):
         """Count GC-content of the sequence"""
-        gc = 0
-        for i in self.seq:
-            if i == 'G' or i == 'C':
-                gc += 1
+        if not self._length:
+            return 0
+        gc = int(GC_PER_BYTE[np.frombuffer(self._packed, dtype=np.uint8)].sum())
         # return f"Sequence {self.seq}: GC content {round(gc / len(self) * 100, 2)}%"
         return round(gc / len(self), 2)
 
 
 class Dna(NucleicAcid):
     """A DNA sequence."""
-    def __init__(self, seq):
-        super().__init__(seq)
-        for i in self.seq:
-            if i not in {'A', 'C', 'T', 'G'}:
-                raise ValueError(self.seq + ' is not a DNA sequence.')
+    __slots__ = ()
+    _kind = 'DNA'
+    _bases = b'ACGT'
+    _rna = False
 
     def complement(self):
         """Returns the complementary DNA sequence"""
-        chargaff = {'A': 'T', 'T': 'A', 'G': 'C', 'C': 'G'}
-        bases = list(self.seq)
-        comp = [chargaff.get(base, base) for base in bases]
-        return ''.join(comp)
+        return self._complemented(Dna).seq
 
     def reverse_complement(self):
         """Returns the reverse complement of given DNA sequence."""
-        revcomp = reversed(self.complement())
-        return ''.join(revcomp)
+        if self._length <= TABLE_MAX:
+            padding = -self._length % 4  # the padding bases come first once the bytes are reversed
+            return ''.join(map(REVERSE_COMPLEMENTED[False].__getitem__, self._packed[::-1]))[padding:]
+        return LETTERS[False][self._codes(0, self._length)[::-1] ^ 3].tobytes().decode('ascii')
 
     def transcribe(self):
         """Returns a RNA sequence corresponding to the given DNA sequence."""
-        chargaff = {'A': 'U', 'T': 'A', 'G': 'C', 'C': 'G'}
-        bases = list(self.seq)
-        trscr = [chargaff.get(base, base) for base in bases]
-        transcribed = ''.join(trscr)
-        return Rna(transcribed)
+        return self._complemented(Rna)
 
 
 class Rna(NucleicAcid):
     """Creates a RNA sequence object."""
-    def __init__(self, seq):
-        super().__init__(seq)
-        for i in self.seq:
-            if i not in {'A', 'U', 'G', 'C'}:
-                raise ValueError(self.seq + ' is not a RNA sequence.')
+    __slots__ = ()
+    _kind = 'RNA'
+    _bases = b'ACGU'
+    _rna = True
 
     def complement(self):
         """Returns the complementary RNA sequence."""
-        chargaff = {'A': 'U', 'U': 'A', 'G': 'C', 'C': 'G'}
-        bases = list(self.seq)
-        comp = [chargaff.get(base, base) for base in bases]
-        return ''.join(comp)
+        return self._complemented(Rna).seq
+
+
+def batch_complement(seqs):
+    """Complement many DNA sequences given as str, e.g. reads. Case and non-ACGT characters are kept."""
+    return [seq.translate(DNA_COMPLEMENT) for seq in seqs]
+
+
+def batch_reverse_complement(seqs):
+    """Reverse-complement many DNA sequences given as str (see batch_complement)."""
+    return [seq.translate(DNA_COMPLEMENT)[::-1] for seq in seqs]
+
 
+def batch_transcribe(seqs):
+    """Bulk equivalent of Dna.transcribe for str sequences: the complementary RNA of each one, as str."""
+    return [seq.translate(DNA_TRANSCRIBE) for seq in seqs]
@@ -1,5 +1,5 @@
 import unittest
-from nucleic_acids import NucleicAcid, Dna, Rna
+from nucleic_acids import NucleicAcid, Dna, Rna, batch_complement, batch_reverse_complement, batch_transcribe
 
 
 class TestNucleicAcid(unittest.TestCase):
@@ -7,6 +7,30 @@ class TestNucleicAcid(unittest.TestCase):
         self.assertRaises(ValueError, NucleicAcid, 'atucatagatau')  # T and U cannot be found together in nucleic acid
         self.assertRaises(ValueError, NucleicAcid, 'donotcallcthulhu')  # test for random string
         self.assertRaises(ValueError, NucleicAcid, '')  # test for empty string
+        self.assertRaises(ValueError, NucleicAcid, 'gattacä')  # non-ASCII letters
+
+    def test_messages(self):  # a character of no nucleic acid is reported as such, a T or U of the wrong kind by kind
+        for cls, seq, message in [(Dna, 'acgn', 'ACGN is not a nucleic acid sequence.'),
+                                  (Rna, 'ACGN', 'ACGN is not a nucleic acid sequence.'),
+                                  (Dna, 'gattacä', 'GATTACÄ is not a nucleic acid sequence.'),
+                                  (Dna, 'ACGU', 'ACGU is not a DNA sequence.'),
+                                  (Rna, 'ACGT', 'ACGT is not a RNA sequence.')]:
+            with self.assertRaises(ValueError) as context:
+                cls(seq)
+            self.assertEqual(str(context.exception), message)
+            if seq.isascii():
+                with self.assertRaises(ValueError) as context:
+                    cls.from_trusted(seq)
+                self.assertEqual(str(context.exception), message)
+
+    def test_trusted(self):  # no validation for sequences from already checked sources
+        self.assertEqual(NucleicAcid.from_trusted('gauuaca').seq, 'GAUUACA')
+        self.assertEqual(Dna('GATTACA', validate=False).seq, 'GATTACA')
+        self.assertIsInstance(Rna.from_trusted('GAUUACA'), Rna)
+        # the alphabet is still checked, so N or mixed T and U are not stored as other bases
+        for cls, seq in [(Dna, 'ACGNNT'), (NucleicAcid, 'ATU'), (NucleicAcid, 'acgn'), (Dna, 'ACGU'), (Rna, 'ACGT')]:
+            self.assertRaises(ValueError, cls.from_trusted, seq)
+            self.assertRaises(ValueError, cls, seq, validate=False)
 
     def test_types(self):
         self.assertRaises(TypeError, NucleicAcid, True)  # object must be instantiated only with str input, not bool
@@ -22,6 +46,23 @@ class TestNucleicAcid(unittest.TestCase):
             gc = sequence.gc_content()
             self.assertAlmostEqual(gc, test_gc[seq])
 
+    def test_packed(self):  # storage, iteration, indexing and slicing on the packed form
+        seq = 'GATTACATTGCAG'
+        sequence = NucleicAcid(seq.lower())
+        self.assertEqual((sequence.seq, str(sequence), len(sequence)), (seq, seq, 13))
+        self.assertEqual(len(sequence._packed), 4)
+        self.assertFalse(hasattr(sequence, '__dict__'))
+        self.assertEqual(list(sequence), list(seq))
+        self.assertEqual(list(sequence), list(seq))  # every iteration starts anew
+        self.assertEqual([sequence[i] for i in range(-13, 13)], list(seq + seq))
+        self.assertRaises(IndexError, sequence.__getitem__, 13)
+        for key in [slice(2, 9), slice(5, None), slice(None, -3), slice(None, None, -1), slice(1, 12, 3),
+                    slice(7, 3)]:
+            self.assertEqual(sequence[key].seq, seq[key])
+        self.assertEqual(sequence[8:].gc_content(), 0.6)
+        self.assertEqual(Rna('GAUUACA')[2:5].seq, 'UUA')
+        self.assertIsInstance(Dna('GATTACA')[1:3], Dna)
+
 
 class TestDna(unittest.TestCase):
     def test_insufficient_args(self):  # as for NucleicAcid, but with Dna
@@ -29,6 +70,7 @@ class TestDna(unittest.TestCase):
         self.assertRaises(ValueError, Dna, 'uaauagugagcgcaa')
         self.assertRaises(ValueError, Dna, 'intentional_bullshit')
         self.assertRaises(ValueError, Dna, '')
+        self.assertRaisesRegex(ValueError, 'GAUUACA is not a DNA sequence', Dna, 'gauuaca')
 
     def test_complement(self):  # correctness of transcription
         test_complement = {'atgcgcatgtgtccat': 'TACGCGTACACAGGTA', 'GATTACAT': 'CTAATGTA',
@@ -46,6 +88,20 @@ class TestDna(unittest.TestCase):
             revcomp = sequence.reverse_complement()
             self.assertEqual(revcomp, test_revcomp[seq])
 
+    def test_transcribe(self):
+        test_transcribe = {'atgcgcatgtgtccat': 'UACGCGUACACAGGUA', 'GATTACAT': 'CUAAUGUA', 'GAT': 'CUA'}
+        for seq, transcribed in test_transcribe.items():
+            rna = Dna(seq).transcribe()
+            self.assertIsInstance(rna, Rna)
+            self.assertEqual(rna.seq, transcribed)
+            self.assertEqual(rna._packed, Rna(transcribed)._packed)  # padding bits are not complemented
+
+    def test_batch(self):  # bulk functions on plain str reads
+        seqs = ['atgcgcatgtgtccat', 'GATTACAT', 'GGNCC', '']
+        self.assertEqual(batch_complement(seqs), ['tacgcgtacacaggta', 'CTAATGTA', 'CCNGG', ''])
+        self.assertEqual(batch_reverse_complement(seqs), ['atggacacatgcgcat', 'ATGTAATC', 'GGNCC', ''])
+        self.assertEqual(batch_transcribe(seqs), ['uacgcguacacaggua', 'CUAAUGUA', 'CCNGG', ''])
+
 
 class TestRna(unittest.TestCase):
     def test_insufficient_args(self):  # as for NucleicAcid, but with Dna
@@ -53,6 +109,7 @@ class TestRna(unittest.TestCase):
         self.assertRaises(ValueError, Rna, 'taatagtgagcgcaa')
         self.assertRaises(ValueError, Rna, 'intentional_bullshit')
         self.assertRaises(ValueError, Rna, '')
+        self.assertRaisesRegex(ValueError, 'GATTACA is not a RNA sequence', Rna, 'gattaca')
 
     def test_complement(self):
         test_complement = {'agcgcauguguccau': 'UCGCGUACACAGGUA',
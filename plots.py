@@ -1,38 +1,117 @@
-import matplotlib.pyplot as plt
-import numpy as np
-import seaborn as sns
-from Bio import SeqIO
-
-#--------1. Line plot--------
-x = np.arange(1, 23, 2)
-y = np.arange(20, 42, 2)
-
-plt.xticks(x)
-plt.yticks(y)
-plt.xlim(1, 21)
-plt.ylim(20,40)
-plt.plot(x, y)
-
-plt.xlabel('Odd numbers')
-plt.ylabel('Even numbers')
-plt.title('1. Line plot')
-plt.savefig('lineplot.png')
-
-#--------2. Sequence length distribution--------
-
-def seq_length_distribution(path):
-    sizes = [len(rec) for rec in SeqIO.parse(path, 'fasta')]
-    plt.hist(sizes, edgecolor='black')
-    plt.title("%i sequences\nLengths %i to %i" % (len(sizes), min(sizes), max(sizes)))
+"""Plotting helpers. Importing this module is cheap: matplotlib, seaborn and NumPy are loaded on first use, and
+matplotlib uses the headless Agg backend unless pyplot was already set up by the caller.
+
+Usage: python plots.py                                   the demo plots (example.fasta for the length plot)
+       python plots.py <file.fasta|file.fastq> [--bins <int>] [--log]   the length distribution of a file
+"""
+import sys
+
+
+def pyplot():
+    """Import matplotlib.pyplot, with the Agg backend if pyplot has not been imported yet."""
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# --------1. Line plot--------
+
+def line_plot():
+    import numpy as np
+    plt = pyplot()
+    x = np.arange(1, 23, 2)
+    y = np.arange(20, 42, 2)
+
+    fig = plt.figure()
+    plt.xticks(x)
+    plt.yticks(y)
+    plt.xlim(1, 21)
+    plt.ylim(20, 40)
+    plt.plot(x, y)
+
+    plt.xlabel('Odd numbers')
+    plt.ylabel('Even numbers')
+    plt.title('1. Line plot')
+    plt.savefig('lineplot.png')
+    plt.close(fig)
+
+# --------2. Sequence length distribution--------
+
+
+def seq_length_distribution(path, bins=10, log=False):
+    """Plot the histogram of sequence lengths of a FASTA/FASTQ file to <path>.png and return the length Histogram.
+
+    Lengths are streamed into fine bins (exact up to 1 kb, ~1% wide above), which are then summed into `bins` plot
+    bins, equally wide on a linear or a log scale, so memory does not grow with the number of sequences. With an
+    up-to-date .fai/.fqi index of the file (python seq_index.py <file>) the lengths are read from the index.
+    """
+    import numpy as np
+    from seq_stats import length_histogram
+    histogram = length_histogram(path)
+    if not histogram.count:
+        raise ValueError(f'No sequences in {path}.')
+    if histogram.min == histogram.max:
+        edges = np.linspace(histogram.min - 0.5, histogram.max + 0.5, bins + 1)
+    elif log:
+        edges = np.geomspace(max(histogram.min, 1), max(histogram.max, 2), bins + 1)
+    else:
+        edges = np.linspace(histogram.min, histogram.max, bins + 1)
+    counts = histogram.rebin(edges)
+
+    plt = pyplot()
+    fig = plt.figure()
+    plt.hist(edges[:-1], bins=edges, weights=counts, edgecolor='black')
+    if log:
+        plt.xscale('log')
+    plt.title("%i sequences\nLengths %i to %i" % (histogram.count, histogram.min, histogram.max))
     plt.xlabel('Sequence length (bp)')
     plt.ylabel('Count')
     plt.savefig(path + '.png')
+    plt.close(fig)
+    return histogram
+
+# --------3. My favourite plot--------
+
+
+def heatmap():
+    import numpy as np
+    import seaborn as sns
+    plt = pyplot()
+    plot_data = np.random.rand(10, 12)
+    fig = plt.figure()
+    sns.heatmap(plot_data)
+    plt.title('My favourite plot is heatmap!')
+    plt.savefig('heatmap.png')
+    plt.close(fig)
+
 
-seq_length_distribution('example.fasta')
+def main(args):
+    if '--help' in args:
+        print(__doc__.split('\n\n')[1])
+        return
+    if not args:
+        line_plot()
+        seq_length_distribution('example.fasta')
+        heatmap()
+        return
+    bins = 10
+    if '--bins' in args:
+        idx = args.index('--bins')
+        try:
+            bins = int(args[idx + 1])
+        except (IndexError, ValueError):
+            raise ValueError('Please specify a valid number for --bins. Type --help for usage.')
+        del args[idx:idx + 2]
+    log = '--log' in args
+    if log:
+        args.remove('--log')
+    for path in args:
+        histogram = seq_length_distribution(path, bins, log)
+        print(f'{path}: {histogram.count} sequences, lengths {histogram.min} to {histogram.max}, '
+              f'plot saved to {path}.png')
 
-#--------3. My favourite plot--------
 
-plot_data = np.random.rand(10, 12)
-ax = sns.heatmap(plot_data)
-plt.title('My favourite plot is heatmap!')
-plt.savefig('heatmap.png')
+if __name__ == '__main__':
+    main(sys.argv[1:])
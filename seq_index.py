@@ -0,0 +1,333 @@
+"""Indexes of plain FASTA and FASTQ files for random access, in the layout of samtools faidx.
+
+An index has a tab-separated line per record: the name, the sequence length, the byte offset of the first base, the
+bases per line and the bytes per line (line end included); a FASTQ index also has the byte offset of the first quality
+character. FASTA indexes are written to <file>.fai, FASTQ indexes to <file>.fqi. With an index, a record or a region
+of it is read by seeking straight to its bytes, and lengths are known without reading any sequence.
+
+Usage: python seq_index.py <file.fasta|file.fastq>...                  build the indexes
+       python seq_index.py <file> <name|#number>[:<start>-<end>]...    print records (1-based, inclusive regions)
+"""
+import mmap
+import os
+import sys
+
+import numpy as np
+
+BLOCK_SIZE = 1 << 24  # bytes scanned for line ends at a time
+INDEX_EXTENSIONS = {'fasta': '.fai', 'fastq': '.fqi'}
+
+
+def sniff_format(path):
+    """'fasta' or 'fastq', by the first byte of a plain file."""
+    with open(path, 'rb') as inf:
+        head = inf.read(2)
+    if head == b'\x1f\x8b':
+        raise ValueError(f'{path} is compressed; only plain files can be indexed.')
+    if head[:1] == b'>':
+        return 'fasta'
+    if head[:1] == b'@':
+        return 'fastq'
+    raise ValueError(f'{path} is not a FASTA or FASTQ file.')
+
+
+def index_path(path, fmt=None):
+    return path + INDEX_EXTENSIONS[fmt or sniff_format(path)]
+
+
+def line_bounds(array, block_size=BLOCK_SIZE):
+    """Yield (starts, ends, next starts) of the lines of a byte array, a block at a time.
+
+    A line is array[start:end] without its line end (\\n or \\r\\n); the next line starts at the next start.
+    """
+    pos = 0
+    size = len(array)
+    window = block_size
+    while pos < size:
+        stop = min(pos + window, size)
+        newlines = np.flatnonzero(array[pos:stop] == 10) + pos
+        if not len(newlines):
+            if stop < size:
+                window *= 2
+                continue
+            newlines = np.array([size], dtype=np.int64)  # a last line without a newline
+        nexts = np.minimum(newlines + 1, size)
+        starts = np.concatenate(([pos], nexts[:-1]))
+        ends = newlines - ((newlines > starts) & (array[newlines - 1] == 13))
+        yield starts, ends, nexts
+        pos = int(nexts[-1])
+
+
+def record_name(mapping, start, end):
+    """The name in a header line: up to the first whitespace, without the '>' or '@'."""
+    return (mapping[start + 1:end].split(None, 1) or [b''])[0].decode()
+
+
+def fastq_records(mapping, array, block_size=BLOCK_SIZE):
+    """Yield index columns (names, lengths, offsets, line bases, line widths, quality offsets) of single-line FASTQ
+    records, as arrays per block."""
+    empty = np.zeros(0, dtype=np.int64)
+    carry = (empty, empty, empty)  # lines of a record cut by the end of the block
+    for bounds in line_bounds(array, block_size):
+        starts, ends, nexts = [np.concatenate(pair) for pair in zip(carry, bounds)]
+        n = len(starts) // 4 * 4
+        carry = (starts[n:], ends[n:], nexts[n:])
+        starts, ends, nexts = starts[:n].reshape(-1, 4), ends[:n].reshape(-1, 4), nexts[:n].reshape(-1, 4)
+        if not n:
+            continue
+        bad = np.flatnonzero((array[starts[:, 0]] != ord('@')) | (array[starts[:, 2]] != ord('+')) |
+                             (ends[:, 1] - starts[:, 1] != ends[:, 3] - starts[:, 3]))
+        if len(bad):
+            raise ValueError(f'Not a FASTQ record with a quality per base at byte {starts[bad[0], 0]}.')
+        lengths = ends[:, 1] - starts[:, 1]
+        names = [record_name(mapping, start, end) for start, end in zip(starts[:, 0].tolist(), ends[:, 0].tolist())]
+        yield names, lengths, starts[:, 1], lengths, nexts[:, 1] - starts[:, 1], starts[:, 3]
+    if (carry[1] > carry[0]).any():
+        raise ValueError(f'The last FASTQ record, at byte {carry[0][0]}, is incomplete.')
+
+
+def fasta_records(mapping, array, block_size=BLOCK_SIZE):
+    """Yield index columns (names, lengths, offsets, line bases, line widths) of FASTA records, as lists per block.
+
+    All sequence lines of a record but the last must have the same length and line end, and the last may not be
+    longer, as samtools requires; otherwise regions could not be found by arithmetic.
+    """
+    record = None  # [name, length, offset, line bases, line width, a shorter line was seen] of the open record
+    for starts, ends, nexts in line_bounds(array, block_size):
+        is_header = array[starts] == ord('>')
+        numbers = np.cumsum(is_header)  # 0: lines of the record open before the block, i: of the i-th header
+        headers = np.flatnonzero(is_header)
+        seq_lines = np.flatnonzero(~is_header)
+        lengths = ends - starts
+        widths = nexts - starts
+        n_records = len(headers) + 1
+        bases = np.bincount(numbers[seq_lines], weights=lengths[seq_lines], minlength=n_records).astype(np.int64)
+        first_numbers, first_idx = np.unique(numbers[seq_lines], return_index=True)
+        last_idx = len(seq_lines) - 1 - np.unique(numbers[seq_lines][::-1], return_index=True)[1]
+        line_bases = np.zeros(n_records, dtype=np.int64)
+        line_widths = np.zeros(n_records, dtype=np.int64)
+        offsets = np.zeros(n_records, dtype=np.int64)
+        offsets[1:] = nexts[headers]  # where an empty sequence would start
+        firsts = seq_lines[first_idx]
+        line_bases[first_numbers], line_widths[first_numbers], offsets[first_numbers] = \
+            lengths[firsts], widths[firsts], starts[firsts]
+        if record is not None and record[3] is not None:  # the open record keeps the layout of its first line
+            line_bases[0], line_widths[0], offsets[0] = record[3], record[4], record[2]
+
+        seq_numbers = numbers[seq_lines]
+        short = (lengths[seq_lines] != line_bases[seq_numbers]) | (widths[seq_lines] != line_widths[seq_numbers])
+        is_last = np.zeros(len(seq_lines), dtype=bool)
+        is_last[last_idx] = True
+        bad = (short & ~is_last) | (lengths[seq_lines] > line_bases[seq_numbers])
+        if record is not None and record[5] and 0 in first_numbers:
+            bad[0] = True
+        if bad.any():
+            number = seq_numbers[np.argmax(bad)]
+            name = record[0] if number == 0 else record_name(mapping, starts[headers[number - 1]],
+                                                             ends[headers[number - 1]])
+            raise ValueError(f'The lines of {name} differ in length; the file has to be rewrapped to be indexed.')
+        short_last = np.zeros(n_records, dtype=bool)
+        short_last[seq_numbers[short]] = True
+
+        names, columns = [], [[], [], [], []]
+        if record is not None:
+            record[1] += int(bases[0])
+            if record[3] is None and 0 in first_numbers:
+                record[2:5] = int(offsets[0]), int(line_bases[0]), int(line_widths[0])
+            record[5] = record[5] or bool(short_last[0])
+            if len(headers):
+                names.append(record[0])
+                for column, value in zip(columns, record[1:5]):
+                    column.append(value or 0)
+        header_names = [record_name(mapping, start, end)
+                        for start, end in zip(starts[headers].tolist(), ends[headers].tolist())]
+        if len(headers) > 1:
+            names += header_names[:-1]
+            for column, values in zip(columns, [bases, offsets, line_bases, line_widths]):
+                column += values[1:-1].tolist()
+        if len(headers):
+            last = len(headers)
+            record = [header_names[-1], int(bases[last]), int(offsets[last]),
+                      int(line_bases[last]) if last in first_numbers else None,
+                      int(line_widths[last]), bool(short_last[last])]
+        if names:
+            yield [names] + columns
+    if record is not None:
+        yield [[record[0]], [record[1]], [record[2]], [record[3] or 0], [record[4] or 0]]
+
+
+class SeqIndex:
+    """The index of a FASTA or FASTQ file: record names and NumPy arrays of the other index columns.
+
+    Records are looked up by number or by name; `fetch` and `fetch_qual` read a record or a region of it (0-based,
+    end excluded) by seeking into the file, so each lookup reads only the bytes asked for. `names` may be given as
+    a function returning them, to decode them only when they are first used.
+    """
+    def __init__(self, path, names, lengths, offsets, line_bases, line_widths, qual_offsets=None):
+        self.path = path
+        self._names = names
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.line_bases = np.asarray(line_bases, dtype=np.int64)
+        self.line_widths = np.asarray(line_widths, dtype=np.int64)
+        self.qual_offsets = None if qual_offsets is None else np.asarray(qual_offsets, dtype=np.int64)
+        self._rows = None
+
+    @property
+    def names(self):
+        if callable(self._names):
+            self._names = self._names()
+        return self._names
+
+    @property
+    def fastq(self):
+        return self.qual_offsets is not None
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def row(self, key):
+        """The number of a record given by number (negative counts from the end) or by name."""
+        if isinstance(key, str):
+            if self._rows is None:
+                self._rows = {name: i for i, name in reversed(list(enumerate(self.names)))}  # the first of equal names
+            if key not in self._rows:
+                raise KeyError(f'No record {key} in {self.path}.')
+            return self._rows[key]
+        if not -len(self) <= key < len(self):
+            raise IndexError(f'Record number {key} is out of range: {self.path} has {len(self)} records.')
+        return key % len(self)
+
+    def length(self, key):
+        return int(self.lengths[self.row(key)])
+
+    def region(self, row, start, end):
+        length = int(self.lengths[row])
+        start = min(max(start, 0), length)
+        end = length if end is None else min(max(end, start), length)
+        return start, end
+
+    def fetch(self, key, start=0, end=None):
+        """The sequence of a record, or its bases start to end."""
+        row = self.row(key)
+        start, end = self.region(row, start, end)
+        if start == end:
+            return ''
+        offset, line_bases, line_width = int(self.offsets[row]), int(self.line_bases[row]), int(self.line_widths[row])
+        first = offset + start // line_bases * line_width + start % line_bases
+        last = offset + (end - 1) // line_bases * line_width + (end - 1) % line_bases + 1
+        with open(self.path, 'rb') as inf:
+            inf.seek(first)
+            data = inf.read(last - first)
+        return data.replace(b'\r', b'').replace(b'\n', b'').decode()
+
+    def fetch_qual(self, key, start=0, end=None):
+        """The quality string of a FASTQ record, or its characters start to end."""
+        if not self.fastq:
+            raise ValueError(f'{self.path} is not a FASTQ file and has no qualities.')
+        row = self.row(key)
+        start, end = self.region(row, start, end)
+        with open(self.path, 'rb') as inf:
+            inf.seek(int(self.qual_offsets[row]) + start)
+            return inf.read(end - start).decode()
+
+    def save(self, path):
+        columns = [self.lengths, self.offsets, self.line_bases, self.line_widths]
+        if self.fastq:
+            columns.append(self.qual_offsets)
+        with open(path, 'w') as ouf:
+            for name, *values in zip(self.names, *[column.tolist() for column in columns]):
+                ouf.write('\t'.join([name] + [str(value) for value in values]) + '\n')
+
+    @classmethod
+    def load(cls, path, index_path):
+        """Read the index of the file at `path` from `index_path`."""
+        with open(index_path) as inf:
+            first = inf.readline()
+        n_columns = first.count('\t')
+        if first and n_columns not in (4, 5):
+            raise ValueError(f'{index_path} is not a FASTA or FASTQ index.')
+        columns = np.loadtxt(index_path, dtype=np.int64, delimiter='\t', usecols=range(1, n_columns + 1),
+                             comments=None, ndmin=2).T if first else np.zeros((4, 0), dtype=np.int64)
+
+        def names():
+            with open(index_path) as inf:
+                return [line.split('\t', 1)[0] for line in inf]
+        return cls(path, names, *columns)
+
+
+def build_index(path, out_path=None, block_size=BLOCK_SIZE):
+    """Index a plain FASTA or FASTQ file, save the index to `out_path` (<file>.fai or <file>.fqi by default) and
+    return it as a SeqIndex. The file is memory-mapped and scanned for line ends with NumPy."""
+    fmt = sniff_format(path)
+    with open(path, 'rb') as inf:
+        mapping = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        array = np.frombuffer(mapping, dtype=np.uint8)
+        records = fastq_records if fmt == 'fastq' else fasta_records
+        blocks = list(records(mapping, array, block_size))
+    finally:
+        array = None
+        try:
+            mapping.close()
+        except BufferError:  # arrays of a raised error still point into the mapping; it is unmapped once freed
+            pass
+    n_columns = 6 if fmt == 'fastq' else 5
+    names = [name for block in blocks for name in block[0]]
+    columns = [np.concatenate([np.asarray(block[i], dtype=np.int64) for block in blocks])
+               if blocks else np.zeros(0, dtype=np.int64) for i in range(1, n_columns)]
+    index = SeqIndex(path, names, *columns)
+    index.save(out_path or index_path(path, fmt))
+    return index
+
+
+def load_index(path):
+    """The index of a file from <file>.fai or <file>.fqi, or None if there is none or it is older than the file."""
+    for extension in INDEX_EXTENSIONS.values():
+        if os.path.isfile(path + extension) and os.stat(path + extension).st_mtime_ns >= os.stat(path).st_mtime_ns:
+            return SeqIndex.load(path, path + extension)
+    return None
+
+
+def get_index(path):
+    """The index of a file, built if it is missing or out of date."""
+    index = load_index(path)
+    return build_index(path) if index is None else index
+
+
+def parse_region(query):
+    """Split '<name|#number>[:<start>-<end>]' (1-based, inclusive) into a lookup key and a 0-based region."""
+    key, start, end = query, 0, None
+    if ':' in query:
+        key, region = query.rsplit(':', 1)
+        try:
+            first, last = region.split('-')
+            start, end = int(first) - 1, int(last)
+        except ValueError:
+            raise ValueError(f'Please specify a region as <start>-<end>, not {region}.')
+    if key.startswith('#'):
+        key = int(key[1:])
+    return key, start, end
+
+
+def main(args):
+    if not args or '--help' in args:
+        print(__doc__.split('\n\n')[-1])
+        return
+    if len(args) == 1 or all(os.path.isfile(arg) for arg in args):
+        for path in args:
+            index = build_index(path)
+            print(f'{path}: {len(index)} records indexed to {index_path(path)}')
+        return
+    index = get_index(args[0])
+    for query in args[1:]:
+        key, start, end = parse_region(query)
+        row = index.row(key)
+        if index.fastq:
+            print(f'@{index.names[row]}\n{index.fetch(row, start, end)}\n+\n{index.fetch_qual(row, start, end)}')
+        else:
+            print(f'>{index.names[row]}\n{index.fetch(row, start, end)}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,483 @@
+import gzip
+import json
+import sys
+from itertools import islice
+
+import numpy as np
+
+from seq_index import load_index
+
+# base codes: A = 0, C = 1, G = 2, T/U = 3, anything else (N, IUPAC, gaps) = 4; 5 separates sequences in a batch
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for code, bases in enumerate([b'Aa', b'Cc', b'Gg', b'TtUu']):
+    BASE_CODES[list(bases)] = code
+BASE_CODES[ord('\n')] = 5
+BASES = 'ACGTN'
+
+BATCH_BASES = 1 << 20  # bases per batch: bounds the NumPy arrays made for one batch
+SLICE_BASES = 1 << 20  # longer sequences are read and added in slices of this many bases
+DENSE_KMERS = 1 << 22  # k-mers are counted in a 4 ** k array up to this size (k <= 11), in sorted arrays above
+MAX_K = 31  # a k-mer has to fit a uint64 at 2 bits per base
+# length bins: one per length up to 1024, then 64 per doubling (about 1% wide) up to 2 ** 40
+LENGTH_EDGES = np.unique(np.concatenate([np.arange(1025), np.round(1024 * 2 ** (np.arange(1, 64 * 30 + 1) / 64))]))
+
+
+class Histogram:
+    """Counts of values in fixed bins [edges[i], edges[i + 1]), with the count, sum, min and max of the values.
+
+    Values below the first or above the last edge are counted in the first or last bin. Histograms with the same
+    edges can be merged.
+    """
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def linear(cls, low, high, bins):
+        return cls(np.linspace(low, high, bins + 1))
+
+    @classmethod
+    def log(cls, low, high, bins_per_doubling=16):
+        """Bins of equal width on a log scale from low (> 0) to high."""
+        n = max(1, int(np.ceil(np.log2(high / low) * bins_per_doubling)))
+        return cls(low * 2 ** (np.arange(n + 1) / bins_per_doubling))
+
+    def add(self, values):
+        values = np.asarray(values)
+        if not len(values):
+            return
+        bins = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.count += len(values)
+        self.total += float(values.sum())
+        low, high = values.min().item(), values.max().item()
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('Only histograms with the same bins can be merged.')
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def rebin(self, edges):
+        """Counts in coarser bins `edges`, each fine bin going to the coarse bin of its low edge (fine bins below or
+        above all the coarse ones go to the first or last)."""
+        bins = np.clip(np.searchsorted(edges, self.edges[:-1], side='right') - 1, 0, len(edges) - 2)
+        return np.bincount(bins, weights=self.counts, minlength=len(edges) - 1).astype(np.int64)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        """Non-empty bins as [low edge, count] pairs and the exact count/min/max/mean."""
+        nonzero = np.flatnonzero(self.counts)
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean(),
+                'bins': [[self.edges[i].item(), self.counts[i].item()] for i in nonzero]}
+
+
+def kmer_values(codes, k):
+    """2-bit values of the k-mers of base codes (see BASE_CODES) that contain only A, C, G and T."""
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    values = np.zeros(n, dtype=np.uint64)
+    for j in range(k):  # roll each base in: value = value << 2 | code, for all windows at once
+        values <<= np.uint64(2)
+        values |= codes[j:j + n] & 3
+    invalid = np.concatenate(([0], np.cumsum(codes >= 4)))
+    return values[invalid[k:] == invalid[:n]]
+
+
+def decode_kmer(value, k):
+    return ''.join(BASES[(value >> (2 * (k - 1 - j))) & 3] for j in range(k))
+
+
+def encode_kmer(kmer):
+    value = 0
+    for base in kmer.upper().encode('ascii'):
+        code = int(BASE_CODES[base])
+        if code >= 4:
+            raise ValueError(f'{kmer} is not a k-mer of A, C, G and T.')
+        value = value << 2 | code
+    return value
+
+
+class KmerCounter:
+    """Counts of k-mers (k up to 31) kept as 2-bit integers.
+
+    Small k use a dense array of 4 ** k counts. Larger k keep sorted unique values and their counts; counts of new
+    batches are collected and folded in once they outgrow the sorted arrays, so each k-mer is re-sorted a
+    logarithmic number of times.
+    """
+    def __init__(self, k):
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f'k must be from 1 to {MAX_K}.')
+        self.k = k
+        self.dense = 4 ** k <= DENSE_KMERS
+        if self.dense:
+            self.counts = np.zeros(4 ** k, dtype=np.int64)
+        else:
+            self.values = np.zeros(0, dtype=np.uint64)
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.pending = []
+            self.pending_size = 0
+
+    def add_values(self, values, counts=None):
+        if self.dense:
+            if counts is None:
+                self.counts += np.bincount(values.astype(np.int64), minlength=len(self.counts))
+            else:
+                np.add.at(self.counts, values.astype(np.int64), counts)
+            return
+        if counts is None:
+            values, counts = np.unique(values, return_counts=True)
+        self.pending.append((values, counts))
+        self.pending_size += len(values)
+        if self.pending_size >= max(len(self.values), 1 << 20):
+            self._compact()
+
+    def add_codes(self, codes):
+        self.add_values(kmer_values(codes, self.k))
+
+    def _compact(self):
+        if self.dense or not self.pending:
+            return
+        values = np.concatenate([self.values] + [values for values, _ in self.pending])
+        counts = np.concatenate([self.counts] + [counts for _, counts in self.pending])
+        order = np.argsort(values, kind='stable')
+        values, counts = values[order], counts[order]
+        if len(values):
+            first = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+            values, counts = values[first], np.add.reduceat(counts, first)
+        self.values = values
+        self.counts = counts
+        self.pending = []
+        self.pending_size = 0
+
+    def arrays(self):
+        """Sorted 2-bit values of the counted k-mers and their counts."""
+        if self.dense:
+            values = np.flatnonzero(self.counts)
+            return values.astype(np.uint64), self.counts[values]
+        self._compact()
+        return self.values, self.counts
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError('Only k-mer counts with the same k can be merged.')
+        if self.dense:
+            self.counts += other.counts
+        else:
+            self.add_values(*other.arrays())
+        return self
+
+    def __getitem__(self, kmer):
+        value = encode_kmer(kmer)
+        if self.dense:
+            return int(self.counts[value])
+        values, counts = self.arrays()
+        i = np.searchsorted(values, np.uint64(value))
+        return int(counts[i]) if i < len(values) and values[i] == value else 0
+
+    def __len__(self):
+        """The number of distinct k-mers."""
+        return len(self.arrays()[0])
+
+    def most_common(self, n=10):
+        values, counts = self.arrays()
+        top = np.argsort(-counts, kind='stable')[:n]
+        return [(decode_kmer(int(values[i]), self.k), int(counts[i])) for i in top]
+
+
+class SeqStats:
+    """One-pass statistics of a stream of sequences, added in batches.
+
+    Collects a length histogram, a histogram of per-sequence GC percentages, base counts (A, C, G, T, other) for
+    each of the first `max_position` positions and in total, and k-mer counts when `k` is given. Memory does not
+    depend on the number of sequences (only the k-mer table for large k grows with the number of distinct k-mers),
+    nor on their length when they are added in slices (see add_slices). Stats of separate batches, chunks or files
+    can be merged, e.g. after computing them in parallel.
+    """
+    def __init__(self, k=None, max_position=1000):
+        self.k = k
+        self.max_position = max_position
+        self.lengths = Histogram(LENGTH_EDGES)
+        self.gc = Histogram.linear(0, 100, 100)
+        self.composition = np.zeros((max_position, len(BASES)), dtype=np.int64)
+        self.base_counts = np.zeros(len(BASES), dtype=np.int64)
+        self.kmers = KmerCounter(k) if k else None
+        self.open_length = 0  # bases and G/C bases of the sequence whose last slice is still to come
+        self.open_gc = 0
+        self.open_tail = b''  # its last k - 1 bases, for the k-mers across the next slice
+
+    def add(self, seqs):
+        """Add a batch of sequences given as bytes or str."""
+        self.add_slices([(seq, 0, True) for seq in seqs])
+
+    def add_slices(self, slices):
+        """Add a batch of (bases, offset, last) slices of sequences, as read_sequences yields them: the bases (bytes
+        or str) from position `offset` of a sequence, which ends with this slice if `last`. The slices of a sequence
+        come in order and may be spread over several batches; the sequence counts once its last slice is added.
+        """
+        if not slices:
+            return
+        seqs = [seq.encode('ascii') if isinstance(seq, str) else seq for seq, _, _ in slices]
+        offsets = np.array([offset for _, offset, _ in slices], dtype=np.int64)
+        last = np.array([last for _, _, last in slices], dtype=bool)
+        lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        codes = BASE_CODES[np.frombuffer(b'\n'.join(seqs), dtype=np.uint8)]
+        starts = np.concatenate(([0], np.cumsum(lengths[:-1] + 1)))
+
+        is_gc = ((codes == 1) | (codes == 2)).astype(np.int64)
+        gc = np.add.reduceat(np.append(is_gc, 0), starts)
+        gc[lengths == 0] = 0
+        # the slices of a sequence are adjacent, and the first one may continue a sequence of the previous batch
+        firsts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+        seq_lengths = np.add.reduceat(lengths, firsts)
+        seq_gc = np.add.reduceat(gc, firsts)
+        seq_lengths[0] += self.open_length
+        seq_gc[0] += self.open_gc
+        if last[-1]:
+            self.open_length = self.open_gc = 0
+        else:
+            self.open_length, self.open_gc = int(seq_lengths[-1]), int(seq_gc[-1])
+            seq_lengths, seq_gc = seq_lengths[:-1], seq_gc[:-1]
+        self.lengths.add(seq_lengths)
+        nonempty = seq_lengths > 0
+        self.gc.add(seq_gc[nonempty] * 100 / seq_lengths[nonempty])
+
+        positions = np.arange(len(codes)) - np.repeat(starts - offsets, lengths + 1)[:len(codes)]
+        bases = (codes < 5) & (positions < self.max_position)
+        self.composition += np.bincount(positions[bases] * len(BASES) + codes[bases],
+                                        minlength=self.composition.size).reshape(self.composition.shape)
+        self.base_counts += np.bincount(codes, minlength=6)[:len(BASES)]
+        if self.kmers is not None:
+            # slices of one sequence are joined without a separator, the first one to the tail of the previous batch
+            data = self.open_tail + b''.join(seq + b'\n' if end else seq for seq, end in zip(seqs, last.tolist()))
+            self.kmers.add_codes(BASE_CODES[np.frombuffer(data, dtype=np.uint8)])
+            self.open_tail = b'' if last[-1] else data[max(len(data) - self.k + 1, 0):]
+
+    def merge(self, other):
+        """Add the statistics of another SeqStats with the same settings to this one."""
+        if (other.k, other.max_position) != (self.k, self.max_position):
+            raise ValueError('Only statistics with the same k and max_position can be merged.')
+        self.lengths.merge(other.lengths)
+        self.gc.merge(other.gc)
+        self.composition += other.composition
+        self.base_counts += other.base_counts
+        if self.kmers is not None:
+            self.kmers.merge(other.kmers)
+        return self
+
+    def gc_percent(self):
+        """GC content of all A, C, G and T bases, in percent."""
+        acgt = self.base_counts[:4].sum()
+        return float(self.base_counts[1:3].sum() * 100 / acgt) if acgt else 0.0
+
+    def summary(self, top_kmers=10):
+        summary = {
+            'sequences': self.lengths.count,
+            'bases': int(self.lengths.total),
+            'lengths': self.lengths.to_dict(),
+            'gc_percent': self.gc_percent(),
+            'read_gc_percent': self.gc.to_dict(),
+            'base_counts': dict(zip(BASES, self.base_counts.tolist())),
+        }
+        if self.kmers is not None:
+            summary['kmers'] = {'k': self.k, 'distinct': len(self.kmers), 'top': self.kmers.most_common(top_kmers)}
+        return summary
+
+
+def open_sequences(path):
+    """Open a plain or gzip-compressed FASTA/FASTQ file for reading bytes."""
+    with open(path, 'rb') as inf:
+        magic = inf.read(2)
+    return gzip.open(path, 'rb') if magic == b'\x1f\x8b' else open(path, 'rb')
+
+
+def read_sequences(inf, slice_bases=SLICE_BASES):
+    """Yield the sequences of a FASTA or FASTQ file opened in binary mode, told apart by the first byte, as
+    (bases, offset, last) slices of at most `slice_bases` bases (see SeqStats.add_slices).
+
+    FASTA lines are read `slice_bases` bytes at a time, so a whole chromosome never has to fit in memory.
+    """
+    first = inf.readline()
+    if first.startswith(b'@'):
+        while first:
+            lines = list(islice(inf, 3))
+            if len(lines) < 3:
+                break
+            seq = lines[0].strip()
+            for offset in range(0, len(seq), slice_bases):
+                yield seq[offset:offset + slice_bases], offset, offset + slice_bases >= len(seq)
+            if not seq:
+                yield seq, 0, True
+            first = inf.readline()
+    elif first.startswith(b'>'):
+        parts = []
+        size = offset = 0
+        line_start = True  # whether the next read starts a line, rather than continuing a long one
+        while True:
+            line = inf.readline(slice_bases)
+            if not line or line_start and line.startswith(b'>'):
+                yield b''.join(parts), offset, True
+                if not line:
+                    break
+                if not line.endswith(b'\n'):
+                    inf.readline()  # the rest of a long header
+                parts = []
+                size = offset = 0
+                continue
+            line_start = line.endswith(b'\n')
+            parts.append(line.strip())
+            size += len(parts[-1])
+            if size > slice_bases:
+                seq = b''.join(parts)
+                while len(seq) > slice_bases:
+                    yield seq[:slice_bases], offset, False
+                    seq = seq[slice_bases:]
+                    offset += slice_bases
+                parts = [seq]
+                size = len(seq)
+    elif first.strip():
+        raise ValueError('Not a FASTA or FASTQ file.')
+
+
+def line_blocks(inf, block_size=1 << 20):
+    """Yield (first bytes, lengths without line ends) of the lines of a binary file, as arrays per block read.
+
+    Only the first byte, length and last byte of a line that continues into the next block are carried over, so
+    lines of any length take constant memory.
+    """
+    first = length = last = 0  # of the unfinished line at the end of the previous block
+    while True:
+        block = inf.read(block_size)
+        if not block:
+            if length:  # a last line without a newline
+                yield np.array([first], dtype=np.uint8), np.array([length - (last == 13)], dtype=np.int64)
+            return
+        data = np.frombuffer(block, dtype=np.uint8)
+        newlines = np.flatnonzero(data == 10)
+        if not len(newlines):
+            first = first if length else data[0]
+            length += len(data)
+            last = data[-1]
+            continue
+        starts = np.concatenate(([0], newlines[:-1] + 1))
+        lengths = newlines - starts
+        firsts = np.where(lengths > 0, data[np.minimum(starts, len(data) - 1)], 0)
+        carriage_returns = (lengths > 0) & (data[np.maximum(newlines - 1, 0)] == 13)
+        if length:
+            firsts[0] = first
+            lengths[0] += length
+            carriage_returns[0] = data[newlines[0] - 1] == 13 if newlines[0] else last == 13
+        yield firsts, lengths - carriage_returns
+        rest = data[newlines[-1] + 1:]
+        length = len(rest)
+        first, last = (rest[0], rest[-1]) if length else (0, 0)
+
+
+def read_length_batches(inf, block_size=1 << 20):
+    """Yield arrays of the sequence lengths of a FASTA or FASTQ file opened in binary mode, one per block read.
+
+    Lines are only measured, never joined, so this works for contigs of any length in constant memory.
+    """
+    lines = 0  # lines before this block (FASTQ)
+    carry = None  # bases of the FASTA record started before this block, None before the first header
+    fasta = None
+    for first, lengths in line_blocks(inf, block_size):
+        if fasta is None:
+            if not len(first) or first[0] not in b'>@':
+                if lengths.any():
+                    raise ValueError('Not a FASTA or FASTQ file.')
+                continue
+            fasta = first[0] == ord('>')
+        if not fasta:
+            yield lengths[(1 - lines) % 4::4]
+            lines += len(lengths)
+            continue
+        is_header = first == ord('>')
+        bases = np.concatenate(([0], np.cumsum(np.where(is_header, 0, lengths))))  # bases[i]: in lines before i
+        headers = np.flatnonzero(is_header)
+        if not len(headers):
+            carry += int(bases[-1])
+            continue
+        record_starts = np.concatenate(([0], headers[:-1] + 1))  # the first record continues the carried one
+        record_lengths = bases[headers] - bases[record_starts]
+        if carry is None:
+            record_lengths = record_lengths[1:]
+        else:
+            record_lengths[0] += carry
+        yield record_lengths
+        carry = int(bases[-1] - bases[headers[-1] + 1])
+    if fasta and carry is not None:
+        yield np.array([carry], dtype=np.int64)
+
+
+def length_histogram(path, edges=LENGTH_EDGES, block_size=1 << 20):
+    """Histogram of the sequence lengths of a FASTA or FASTQ file, read `block_size` bytes at a time.
+
+    If the file has an up-to-date index (see seq_index.py), the lengths are taken from it instead.
+    """
+    histogram = Histogram(edges)
+    index = load_index(path)
+    if index is not None:
+        histogram.add(index.lengths)
+        return histogram
+    with open_sequences(path) as inf:
+        for lengths in read_length_batches(inf, block_size):
+            histogram.add(lengths)
+    return histogram
+
+
+def batches(seqs, batch_bases=BATCH_BASES, size_of=len):
+    """Group sequences into lists of about `batch_bases` bases, `size_of(seq)` being the bases of one."""
+    batch = []
+    size = 0
+    for seq in seqs:
+        batch.append(seq)
+        size += size_of(seq) + 1
+        if size >= batch_bases:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def file_stats(path, k=None, max_position=1000, batch_bases=BATCH_BASES, slice_bases=SLICE_BASES):
+    """Compute SeqStats of a FASTA or FASTQ file (gzip-compressed or not) in one pass, reading sequences longer than
+    `slice_bases` in slices."""
+    stats = SeqStats(k, max_position)
+    with open_sequences(path) as inf:
+        for batch in batches(read_sequences(inf, slice_bases), batch_bases, lambda piece: len(piece[0])):
+            stats.add_slices(batch)
+    return stats
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or '--help' in sys.argv:
+        print('Usage: python seq_stats.py [--k <int>] <file.fasta|file.fastq>...\n'
+              'Prints length, GC, base composition and k-mer statistics of all the files as JSON.')
+        sys.exit()
+    args = sys.argv[1:]
+    k = None
+    if '--k' in args:
+        idx = args.index('--k')
+        k = int(args[idx + 1])
+        del args[idx:idx + 2]
+    total = SeqStats(k)
+    for path in args:
+        total.merge(file_stats(path, k))
+    print(json.dumps(total.summary(), indent=2))
@@ -0,0 +1,101 @@
+"""Seeded generators of synthetic FASTQ and FASTA data for benchmarks and tests.
+
+Read lengths come from a 'fixed', 'normal', 'uniform' or 'lognormal' distribution around `length`, and the GC content
+of each read from a normal distribution around `gc` percent; the same arguments and seed give the same bytes.
+"""
+import numpy as np
+
+DNA_LETTERS = np.frombuffer(b'ATCG', dtype=np.uint8)  # codes 0, 1: A/T, codes 2, 3: C/G
+BATCH_READS = 1 << 14
+LENGTH_DISTRIBUTIONS = ['fixed', 'normal', 'uniform', 'lognormal']
+
+
+def random_lengths(rng, n, length, length_sd=0.0, distribution='normal', min_length=1):
+    """`n` read lengths around `length`: normal with sd `length_sd`, uniform within `length` +- `length_sd`,
+    lognormal with median `length` and sigma `length_sd` (of the log), or fixed. At least `min_length`.
+    """
+    if distribution == 'fixed' or (length_sd == 0 and distribution != 'lognormal'):
+        lengths = np.full(n, length, dtype=float)
+    elif distribution == 'normal':
+        lengths = rng.normal(length, length_sd, n)
+    elif distribution == 'uniform':
+        lengths = rng.uniform(length - length_sd, length + length_sd + 1, n)
+    elif distribution == 'lognormal':
+        lengths = rng.lognormal(np.log(length), length_sd, n)
+    else:
+        raise ValueError(f'Unknown length distribution {distribution}, expected one of {LENGTH_DISTRIBUTIONS}.')
+    return np.maximum(lengths.astype(np.int64), min_length)
+
+
+def random_seqs(rng, lengths, gc=50.0, gc_sd=0.0):
+    """Random DNA of the given lengths as one uint8 array of letters, and the offsets of the sequences in it.
+
+    Every sequence gets its own GC probability drawn around `gc` percent with sd `gc_sd`, clipped to 0..100.
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    gc_share = np.clip(rng.normal(gc, gc_sd, len(lengths)) if gc_sd else np.full(len(lengths), float(gc)), 0, 100)
+    is_gc = rng.random(offsets[-1]) * 100 < np.repeat(gc_share, lengths)
+    codes = is_gc.astype(np.uint8) * 2 + rng.integers(0, 2, offsets[-1], dtype=np.uint8)
+    return DNA_LETTERS[codes], offsets
+
+
+def random_quals(rng, lengths, offsets, high=38, drop=12, sd=5, offset=33):
+    """Illumina-like Phred qualities as one uint8 array of letters: around `high` at the 5' end, `drop` lower at the
+    3' end, clipped to 2..41.
+    """
+    positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    mean = high - drop * positions / np.repeat(np.maximum(lengths, 1), lengths)
+    return (np.clip(np.rint(rng.normal(mean, sd)), 2, 41) + offset).astype(np.uint8)
+
+
+def fastq_records(n_reads, length=150, length_sd=0.0, length_distribution='normal', gc=50.0, gc_sd=0.0, seed=42,
+                  name='synthetic_read'):
+    """Yield synthetic FASTQ records as bytes, in batches of up to BATCH_READS reads."""
+    rng = np.random.default_rng(seed)
+    for first in range(0, n_reads, BATCH_READS):
+        lengths = random_lengths(rng, min(BATCH_READS, n_reads - first), length, length_sd, length_distribution)
+        seq_data, offsets = random_seqs(rng, lengths, gc, gc_sd)
+        seqs = seq_data.tobytes()
+        quals = random_quals(rng, lengths, offsets).tobytes()
+        bounds = offsets.tolist()
+        yield b''.join(b'@%s%d\n%s\n+\n%s\n' % (name.encode(), first + i, seqs[start:end], quals[start:end])
+                       for i, (start, end) in enumerate(zip(bounds, bounds[1:])))
+
+
+def fasta_records(n_seqs, length=1000, length_sd=1.0, length_distribution='lognormal', gc=50.0, gc_sd=0.0,
+                  line_width=60, seed=42, name='contig'):
+    """Yield synthetic FASTA records as bytes, wrapped at `line_width`, in batches of up to BATCH_READS sequences."""
+    rng = np.random.default_rng(seed)
+    for first in range(0, n_seqs, BATCH_READS):
+        lengths = random_lengths(rng, min(BATCH_READS, n_seqs - first), length, length_sd, length_distribution)
+        seq_data, offsets = random_seqs(rng, lengths, gc, gc_sd)
+        seqs = seq_data.tobytes()
+        bounds = offsets.tolist()
+        yield b''.join(b'>%s%d\n' % (name.encode(), first + i) +
+                       b''.join(seqs[pos:min(pos + line_width, end)] + b'\n' for pos in range(start, end, line_width))
+                       for i, (start, end) in enumerate(zip(bounds, bounds[1:])))
+
+
+def write_fastq(path, n_reads, **kwargs):
+    """Write `n_reads` synthetic reads to a FASTQ file; keyword arguments as of fastq_records."""
+    with open(path, 'wb') as ouf:
+        for block in fastq_records(n_reads, **kwargs):
+            ouf.write(block)
+
+
+def write_fasta(path, n_seqs, **kwargs):
+    """Write `n_seqs` synthetic sequences to a FASTA file; keyword arguments as of fasta_records."""
+    with open(path, 'wb') as ouf:
+        for block in fasta_records(n_seqs, **kwargs):
+            ouf.write(block)
+
+
+def synthetic_seqs(n_seqs, length=150, length_sd=0.0, length_distribution='normal', gc=50.0, gc_sd=0.0, seed=42):
+    """`n_seqs` synthetic DNA sequences as a list of str, for in-memory benchmarks."""
+    rng = np.random.default_rng(seed)
+    lengths = random_lengths(rng, n_seqs, length, length_sd, length_distribution)
+    seq_data, offsets = random_seqs(rng, lengths, gc, gc_sd)
+    seqs = seq_data.tobytes().decode('ascii')
+    bounds = offsets.tolist()
+    return [seqs[start:end] for start, end in zip(bounds, bounds[1:])]
@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bench_suite import BENCHMARKS, compare, main, run_suite
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_run_suite(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': tmp}):
+            results = run_suite(list(BENCHMARKS), scale=0.001, repeat=1)  # no compiled adapters left in ~/.cache
+        self.assertEqual(set(results['results']), set(BENCHMARKS))
+        self.assertEqual(results['meta']['scale'], 0.001)
+        self.assertEqual(results['results']['gc_count']['items'], 200)
+        json.dumps(results)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'per_second': 100.0}, 'b': {'per_second': 100.0}, 'c': {'per_second': 100.0},
+                                'gone': {'per_second': 100.0}}}
+        current = {'results': {'a': {'per_second': 85.0}, 'b': {'per_second': 95.0}, 'c': {'per_second': 150.0},
+                               'new': {'per_second': 1.0}}}
+        self.assertEqual([(row[0], row[4]) for row in compare(baseline, current, 0.1)],
+                         [('a', 'regression'), ('b', 'ok'), ('c', 'improvement')])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, 'baseline.json')
+            self.assertEqual(main(['--only', 'gc_count', '--scale', '0.001', '--repeat', '1', '--output', baseline]), 0)
+            with open(baseline) as inf:
+                results = json.load(inf)
+            results['results']['gc_count']['per_second'] *= 1000
+            with open(baseline, 'w') as ouf:
+                json.dump(results, ouf)
+            self.assertEqual(main(['--only', 'gc_count', '--scale', '0.001', '--baseline', baseline]), 1)
+        self.assertRaises(ValueError, main, ['--only', 'nothing'])
+        self.assertRaises(ValueError, main, ['--scale', 'big'])
+
+
+if __name__ == '__main__':
+    unittest.main()
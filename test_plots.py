@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from plots import main, seq_length_distribution
+
+
+class TestPlots(unittest.TestCase):
+    def test_lazy_import(self):  # importing plots loads no plotting libraries and draws nothing
+        loaded = subprocess.run([sys.executable, '-c', 'import sys, plots; print(sorted({"numpy", "matplotlib", '
+                                 '"seaborn", "Bio"} & {name.split(".")[0] for name in sys.modules}))'],
+                                capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__) or '.')
+        self.assertEqual(loaded.stdout.strip(), '[]')
+
+    def test_seq_length_distribution(self):
+        lengths = [5, 7, 7, 20, 3000, 120]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'example.fasta')
+            with open(path, 'w') as ouf:
+                for i, length in enumerate(lengths):
+                    ouf.write(f'>contig{i}\n' + ''.join('A' * min(60, length - j) + '\n' for j in range(0, length, 60)))
+            histogram = seq_length_distribution(path)
+            self.assertTrue(os.path.exists(path + '.png'))
+            self.assertEqual((histogram.count, histogram.min, histogram.max), (6, 5, 3000))
+            edges = np.linspace(5, 3000, 11)
+            self.assertEqual(histogram.rebin(edges).tolist(), np.histogram(lengths, edges)[0].tolist())
+            seq_length_distribution(path, bins=4, log=True)
+            os.remove(path + '.png')
+            main([path, '--bins', '4', '--log'])
+            self.assertTrue(os.path.exists(path + '.png'))
+            self.assertRaises(ValueError, main, [path, '--bins', 'many'])
+            with open(path, 'w'):
+                pass
+            self.assertRaises(ValueError, seq_length_distribution, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from seq_index import build_index, get_index, index_path, load_index, parse_region
+from seq_stats import length_histogram
+
+
+class TestSeqIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.seqs = [''.join(rng.choice(list('ACGT'), size=size)) for size in rng.integers(0, 200, size=50)]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmp.name, 'test.fasta')
+        with open(self.fasta, 'w', newline='') as ouf:
+            for i, seq in enumerate(self.seqs):
+                line_end = '\r\n' if i % 7 == 3 else '\n'
+                ouf.write(f'>seq{i} description{line_end}' +
+                          ''.join(seq[j:j + 60] + line_end for j in range(0, len(seq), 60)))
+        self.fastq = os.path.join(self.tmp.name, 'test.fastq')
+        with open(self.fastq, 'w') as ouf:
+            for i, seq in enumerate(self.seqs):
+                ouf.write(f'@seq{i}\n{seq}\n+\n{"ABCDEFGHIJ" * 20:.{len(seq)}}\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_samtools_layout(self):
+        path = os.path.join(self.tmp.name, 'small.fasta')
+        with open(path, 'w') as ouf:
+            ouf.write('>a desc\nACGTA\nCGTAC\nGT\n>empty\n>c\nACG')
+        build_index(path)
+        with open(path + '.fai') as inf:
+            self.assertEqual(inf.read(), 'a\t12\t8\t5\t6\nempty\t0\t30\t0\t0\nc\t3\t33\t3\t3\n')
+
+    def test_fetch(self):
+        for path in [self.fasta, self.fastq]:
+            for block_size in [16, 1 << 20]:  # records cut by block ends, and whole
+                index = build_index(path, block_size=block_size)
+                self.assertEqual(index.names, [f'seq{i}' for i in range(len(self.seqs))])
+                self.assertEqual(index.lengths.tolist(), [len(seq) for seq in self.seqs])
+                self.assertEqual([index.fetch(i) for i in range(len(index))], self.seqs)
+            self.assertEqual(index.fetch('seq5', 55, 130), self.seqs[5][55:130])
+            self.assertEqual(index.fetch(-1, 10), self.seqs[-1][10:])
+            self.assertEqual(index.length('seq7'), len(self.seqs[7]))
+            self.assertRaises(KeyError, index.row, 'seq50')
+            self.assertRaises(IndexError, index.row, 50)
+        self.assertEqual(index_path(self.fastq), self.fastq + '.fqi')
+        self.assertTrue(index.fastq)
+        self.assertEqual(index.fetch_qual('seq5', 2, 5), 'CDE')
+
+    def test_load_index(self):
+        self.assertIsNone(load_index(self.fasta))
+        built = build_index(self.fasta)
+        loaded = load_index(self.fasta)
+        self.assertEqual(loaded.names, built.names)
+        for column in ['lengths', 'offsets', 'line_bases', 'line_widths']:
+            self.assertEqual(getattr(loaded, column).tolist(), getattr(built, column).tolist())
+        self.assertFalse(loaded.fastq)
+        stat = os.stat(self.fasta)
+        os.utime(self.fasta + '.fai', ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))  # the file changed since
+        self.assertIsNone(load_index(self.fasta))
+        self.assertEqual(get_index(self.fasta).names, built.names)
+        self.assertIsNotNone(load_index(self.fasta))
+
+    def test_invalid(self):
+        path = os.path.join(self.tmp.name, 'bad.fasta')
+        for text in ['>a\nACGT\nAC\nACGT\n', '>a\nACG\nACGT\n', '@a\nACGT\n+\nIII\n', '@a\nACGT\n+\n']:
+            with open(path, 'w') as ouf:
+                ouf.write(text)
+            for block_size in [2, 1 << 20]:
+                self.assertRaises(ValueError, build_index, path, block_size=block_size)
+
+    def test_length_histogram(self):
+        expected = length_histogram(self.fastq)
+        build_index(self.fastq)
+        with mock.patch('seq_stats.read_length_batches', side_effect=AssertionError('the file was read')):
+            histogram = length_histogram(self.fastq)
+        self.assertEqual(histogram.counts.tolist(), expected.counts.tolist())
+        self.assertEqual((histogram.count, histogram.min, histogram.max), (expected.count, expected.min, expected.max))
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region('chr1:11-20'), ('chr1', 10, 20))
+        self.assertEqual(parse_region('#3'), (3, 0, None))
+        self.assertRaises(ValueError, parse_region, 'chr1:x')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import gzip
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from seq_stats import Histogram, KmerCounter, SeqStats, batches, file_stats, kmer_values, length_histogram, \
+    read_sequences, BASE_CODES
+
+
+def count_kmers(seqs, k):
+    """Plain Python k-mer counting to check against."""
+    counts = Counter()
+    for seq in seqs:
+        seq = seq.upper()
+        for i in range(len(seq) - k + 1):
+            if set(seq[i:i + k]) <= set('ACGT'):
+                counts[seq[i:i + k]] += 1
+    return counts
+
+
+def exact(stats):
+    """SeqStats summary with the mean per-read GC percentage rounded: its sum depends on the order of addition."""
+    summary = stats.summary()
+    summary['read_gc_percent']['mean'] = round(summary['read_gc_percent']['mean'], 9)
+    return summary
+
+
+class TestSeqStats(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.seqs = [''.join(rng.choice(list('ACGTN'), p=[0.24, 0.26, 0.26, 0.23, 0.01], size=size))
+                     for size in rng.integers(0, 300, size=200)]
+        self.seqs += ['gattaca', 'GGGG', '']
+
+    def test_histogram(self):
+        histogram = Histogram.linear(0, 10, 5)
+        histogram.add([0, 1.5, 2, 9.9, 10, 12, -1])
+        self.assertEqual(histogram.counts.tolist(), [3, 1, 0, 0, 3])
+        self.assertEqual((histogram.count, histogram.min, histogram.max), (7, -1, 12))
+        other = Histogram.linear(0, 10, 5)
+        other.add([5])
+        histogram.merge(other)
+        self.assertEqual((histogram.counts[2], histogram.count, histogram.mean()), (1, 8, 39.4 / 8))
+        self.assertRaises(ValueError, histogram.merge, Histogram.linear(0, 10, 4))
+        self.assertAlmostEqual(Histogram.log(1, 1024, 4).edges[-1], 1024)
+        self.assertEqual(histogram.rebin([0, 5, 10]).tolist(), [5, 3])  # fine bins go by their low edge
+
+    def test_add(self):
+        stats = SeqStats(k=3, max_position=50)
+        stats.add(self.seqs)
+        lengths = [len(seq) for seq in self.seqs]
+        self.assertEqual((stats.lengths.count, stats.lengths.total), (len(self.seqs), sum(lengths)))
+        self.assertEqual((stats.lengths.min, stats.lengths.max), (min(lengths), max(lengths)))
+        self.assertEqual(stats.lengths.counts[:300].tolist(), np.bincount(lengths, minlength=300).tolist())
+        joined = ''.join(self.seqs).upper()
+        self.assertEqual(stats.base_counts.tolist(), [joined.count(base) for base in 'ACGTN'])
+        self.assertEqual(stats.composition[7].tolist(),
+                         [sum(seq[7:8].upper() == base for seq in self.seqs) for base in 'ACGTN'])
+        self.assertEqual(stats.gc.count, len([seq for seq in self.seqs if seq]))
+        self.assertAlmostEqual(stats.gc.max, 100.0)
+        self.assertAlmostEqual(stats.gc.total, sum((seq.upper().count('G') + seq.upper().count('C')) * 100 / len(seq)
+                                                   for seq in self.seqs if seq))
+        expected = count_kmers(self.seqs, 3)
+        self.assertEqual(len(stats.kmers), len(expected))
+        self.assertEqual(stats.kmers['TAC'], expected['TAC'])
+        self.assertEqual(stats.kmers.most_common(1)[0][1], max(expected.values()))
+
+    def test_merge(self):  # stats of separate batches add up to the stats of the whole
+        whole = SeqStats(k=13)
+        whole.add(self.seqs)
+        merged = SeqStats(k=13)
+        for batch in batches(self.seqs, 1000):
+            part = SeqStats(k=13)
+            part.add(batch)
+            merged.merge(part)
+        self.assertEqual(exact(merged), exact(whole))
+        self.assertEqual(merged.composition.tolist(), whole.composition.tolist())
+        self.assertRaises(ValueError, merged.merge, SeqStats(k=5))
+
+    def test_kmers(self):
+        codes = BASE_CODES[np.frombuffer(b'ACGTNAC\nGTA', dtype=np.uint8)]
+        self.assertEqual(kmer_values(codes, 2).tolist(), [0b0001, 0b0110, 0b1011, 0b0001, 0b1011, 0b1100])
+        for k in [31, 5]:  # sorted arrays and a dense array
+            expected = count_kmers(self.seqs, k)
+            counter = KmerCounter(k)
+            for seq in self.seqs:
+                counter.add_codes(BASE_CODES[np.frombuffer(seq.encode(), dtype=np.uint8)])
+            self.assertEqual(dict(counter.most_common(len(expected))), dict(expected))
+        self.assertRaises(ValueError, KmerCounter, 32)
+
+    def test_file_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fasta = os.path.join(tmp, 'test.fasta')
+            with open(fasta, 'w') as ouf:
+                for i, seq in enumerate(self.seqs):
+                    ouf.write(f'>seq{i}\n' + ''.join(seq[j:j + 60] + '\n' for j in range(0, len(seq), 60)))
+            fastq = os.path.join(tmp, 'test.fastq.gz')
+            with gzip.open(fastq, 'wt') as ouf:
+                for i, seq in enumerate(self.seqs):
+                    ouf.write(f'@seq{i}\n{seq}\n+\n{"I" * len(seq)}\n')
+            expected = SeqStats(k=4)
+            expected.add(self.seqs)
+            for path in [fasta, fastq]:
+                self.assertEqual(exact(file_stats(path, k=4, batch_bases=500)), exact(expected))
+                histogram = length_histogram(path, block_size=50)
+                self.assertEqual(histogram.counts.tolist(), expected.lengths.counts.tolist())
+                self.assertEqual((histogram.count, histogram.min, histogram.max), (len(self.seqs), 0, 299))
+
+    def test_long_sequences(self):  # sequences longer than a slice give the same stats as when added whole
+        rng = np.random.default_rng(2)
+        seqs = [''.join(rng.choice(list('ACGTN'), p=[0.24, 0.26, 0.26, 0.23, 0.01], size=size))
+                for size in [5000, 3, 0, 64, 2500, 65, 1]]
+        with tempfile.TemporaryDirectory() as tmp:
+            for line_length in [60, 10000]:  # wrapped, and a record on one line longer than a slice
+                fasta = os.path.join(tmp, 'long.fasta')
+                with open(fasta, 'w') as ouf:
+                    for i, seq in enumerate(seqs):
+                        ouf.write(f'>seq{i}\n' + ''.join(seq[j:j + line_length] + '\n'
+                                                         for j in range(0, len(seq), line_length)))
+                with open(fasta, 'rb') as inf:
+                    slices = list(read_sequences(inf, slice_bases=64))
+                self.assertLessEqual(max(len(seq) for seq, _, _ in slices), 64)
+                self.assertEqual(sum(last for _, _, last in slices), len(seqs))
+                for k in [5, 13]:
+                    expected = SeqStats(k=k, max_position=3000)
+                    expected.add(seqs)
+                    for batch_bases in [50, 500, 100000]:
+                        stats = file_stats(fasta, k=k, max_position=3000, batch_bases=batch_bases, slice_bases=64)
+                        self.assertEqual(exact(stats), exact(expected))
+                        self.assertEqual(stats.composition.tolist(), expected.composition.tolist())
+                        self.assertEqual(dict(stats.kmers.most_common(len(stats.kmers))), dict(count_kmers(seqs, k)))
+            fastq = os.path.join(tmp, 'long.fastq')
+            with open(fastq, 'w') as ouf:
+                for i, seq in enumerate(seqs):
+                    ouf.write(f'@seq{i}\n{seq}\n+\n{"I" * len(seq)}\n')
+            expected = SeqStats(k=5)
+            expected.add(seqs)
+            self.assertEqual(exact(file_stats(fastq, k=5, batch_bases=50, slice_bases=64)), exact(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from seq_stats import file_stats
+from synthetic import fasta_records, fastq_records, random_lengths, synthetic_seqs, write_fasta, write_fastq
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_seeded(self):
+        self.assertEqual(list(fastq_records(100, seed=1)), list(fastq_records(100, seed=1)))
+        self.assertNotEqual(list(fastq_records(100, seed=1)), list(fastq_records(100, seed=2)))
+        self.assertEqual(synthetic_seqs(10, length=20, seed=3), synthetic_seqs(10, length=20, seed=3))
+
+    def test_lengths(self):
+        rng = np.random.default_rng(0)
+        self.assertEqual(set(random_lengths(rng, 100, 150).tolist()), {150})
+        lengths = random_lengths(rng, 10000, 150, 20)
+        self.assertAlmostEqual(lengths.mean(), 150, delta=2)
+        self.assertTrue(lengths.min() >= 1)
+        lengths = random_lengths(rng, 10000, 150, 20, 'uniform')
+        self.assertEqual((lengths.min(), lengths.max()), (130, 170))
+        self.assertAlmostEqual(np.median(random_lengths(rng, 10000, 500, 1.0, 'lognormal')), 500, delta=30)
+        self.assertRaises(ValueError, random_lengths, rng, 10, 150, 20, 'gamma')
+
+    def test_gc(self):
+        for gc in [20, 65]:
+            seqs = synthetic_seqs(200, length=100, gc=gc, gc_sd=5)
+            joined = ''.join(seqs)
+            self.assertAlmostEqual((joined.count('G') + joined.count('C')) * 100 / len(joined), gc, delta=1.5)
+            self.assertEqual(set(joined), set('ACGT'))
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fastq, fasta = os.path.join(tmp, 'reads.fastq'), os.path.join(tmp, 'contigs.fasta')
+            write_fastq(fastq, 20000, length=150, length_sd=10, gc=40)
+            write_fasta(fasta, 300, length=500, line_width=70)
+            with open(fastq) as inf:
+                lines = inf.read().splitlines()
+            self.assertEqual(len(lines), 20000 * 4)
+            self.assertEqual((lines[-4], lines[2]), ('@synthetic_read19999', '+'))
+            self.assertTrue(all(len(seq) == len(qual) for seq, qual in zip(lines[1::4], lines[3::4])))
+            self.assertTrue(all('#' <= char <= 'J' for char in lines[3]))
+            with open(fasta, 'rb') as inf:
+                self.assertEqual(inf.read(), b''.join(fasta_records(300, length=500, line_width=70)))
+            stats = file_stats(fasta)
+            self.assertEqual(stats.lengths.count, 300)
+            self.assertTrue(stats.lengths.max > 1000)  # log-normal by default
+
+
+if __name__ == '__main__':
+    unittest.main()